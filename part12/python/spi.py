@@ -1,5 +1,7 @@
 """ SPI - Simple Pascal Interpreter. Part 12. """
 
+import operator
+
 ###############################################################################
 #                                                                             #
 #  LEXER                                                                      #
@@ -215,6 +217,27 @@ class Lexer(object):
 #  PARSER                                                                     #
 #                                                                             #
 ###############################################################################
+
+def float_div(left, right):
+    return float(left) / float(right)
+
+
+# the operations of the operators by token type, looked up once
+# by the BinOp and UnaryOp nodes
+BINARY_OPERATIONS = {
+    PLUS: operator.add,
+    MINUS: operator.sub,
+    MUL: operator.mul,
+    INTEGER_DIV: operator.floordiv,
+    FLOAT_DIV: float_div,
+}
+
+UNARY_OPERATIONS = {
+    PLUS: operator.pos,
+    MINUS: operator.neg,
+}
+
+
 class AST(object):
     pass
 
@@ -224,6 +247,7 @@ class BinOp(AST):
         self.left = left
         self.token = self.op = op
         self.right = right
+        self.operation = BINARY_OPERATIONS[op.type]
 
 
 class Num(AST):
@@ -236,6 +260,7 @@ class UnaryOp(AST):
     def __init__(self, op, expr):
         self.token = self.op = op
         self.expr = expr
+        self.operation = UNARY_OPERATIONS[op.type]
 
 
 class Compound(AST):
@@ -724,26 +749,13 @@ class Interpreter(NodeVisitor):
         pass
 
     def visit_BinOp(self, node):
-        if node.op.type == PLUS:
-            return self.visit(node.left) + self.visit(node.right)
-        elif node.op.type == MINUS:
-            return self.visit(node.left) - self.visit(node.right)
-        elif node.op.type == MUL:
-            return self.visit(node.left) * self.visit(node.right)
-        elif node.op.type == INTEGER_DIV:
-            return self.visit(node.left) // self.visit(node.right)
-        elif node.op.type == FLOAT_DIV:
-            return float(self.visit(node.left)) / float(self.visit(node.right))
+        return node.operation(self.visit(node.left), self.visit(node.right))
 
     def visit_Num(self, node):
         return node.value
 
     def visit_UnaryOp(self, node):
-        op = node.op.type
-        if op == PLUS:
-            return +self.visit(node.expr)
-        elif op == MINUS:
-            return -self.visit(node.expr)
+        return node.operation(self.visit(node.expr))
 
     def visit_Compound(self, node):
         for child in node.children:
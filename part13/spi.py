@@ -1,5 +1,8 @@
 """ SPI - Simple Pascal Interpreter. Part 13. """
 
+import operator
+import re
+
 ###############################################################################
 #                                                                             #
 #  LEXER                                                                      #
@@ -68,6 +71,9 @@ RESERVED_KEYWORDS = {
     'PROCEDURE': Token('PROCEDURE', 'PROCEDURE'),
 }
 
+# a run of whitespace characters, skipped by the lexer in one step
+_WHITESPACE = re.compile(r'\s*')
+
 class Lexer(object):
     def __init__(self, text):
         # client string input, e.g. "4 + 2 * 3 - 6 / 2"
@@ -94,14 +100,28 @@ class Lexer(object):
         else:
             return self.text[peek_pos]
 
+    def _seek(self, pos):
+        """Move the `pos` pointer forward and set the `current_char` variable."""
+        self.pos = pos
+        if self.pos > len(self.text) - 1:
+            self.current_char = None  # Indicates end of input
+        else:
+            self.current_char = self.text[self.pos]
+
     def skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self.advance()
+        self._seek(_WHITESPACE.match(self.text, self.pos).end())
 
     def skip_comment(self):
-        while self.current_char != '}':
-            self.advance()
-        self.advance()  # the closing curly brace
+        # the closing curly brace of the comment starting at self.pos
+        end = self.text.find('}', self.pos + 1)
+        if end == -1:
+            # the lexer doesn't keep track of lines, count them here
+            lineno = self.text.count('\n', 0, self.pos) + 1
+            column = self.pos - self.text.rfind('\n', 0, self.pos)
+            raise Exception(
+                f'Unterminated comment line: {lineno} column: {column}'
+            )
+        self._seek(end + 1)
 
     def number(self):
         """Return a (multidigit) integer or float consumed from the input."""
@@ -150,7 +170,6 @@ class Lexer(object):
                 continue
 
             if self.current_char == '{':
-                self.advance()
                 self.skip_comment()
                 continue
 
@@ -215,6 +234,27 @@ class Lexer(object):
 #  PARSER                                                                     #
 #                                                                             #
 ###############################################################################
+
+def float_div(left, right):
+    return float(left) / float(right)
+
+
+# the operations of the operators by token type, looked up once
+# by the BinOp and UnaryOp nodes
+BINARY_OPERATIONS = {
+    PLUS: operator.add,
+    MINUS: operator.sub,
+    MUL: operator.mul,
+    INTEGER_DIV: operator.floordiv,
+    FLOAT_DIV: float_div,
+}
+
+UNARY_OPERATIONS = {
+    PLUS: operator.pos,
+    MINUS: operator.neg,
+}
+
+
 class AST(object):
     pass
 
@@ -224,6 +264,7 @@ class BinOp(AST):
         self.left = left
         self.token = self.op = op
         self.right = right
+        self.operation = BINARY_OPERATIONS[op.type]
 
 
 class Num(AST):
@@ -236,6 +277,7 @@ class UnaryOp(AST):
     def __init__(self, op, expr):
         self.token = self.op = op
         self.expr = expr
+        self.operation = UNARY_OPERATIONS[op.type]
 
 
 class Compound(AST):
@@ -740,26 +782,13 @@ class Interpreter(NodeVisitor):
         pass
 
     def visit_BinOp(self, node):
-        if node.op.type == PLUS:
-            return self.visit(node.left) + self.visit(node.right)
-        elif node.op.type == MINUS:
-            return self.visit(node.left) - self.visit(node.right)
-        elif node.op.type == MUL:
-            return self.visit(node.left) * self.visit(node.right)
-        elif node.op.type == INTEGER_DIV:
-            return self.visit(node.left) // self.visit(node.right)
-        elif node.op.type == FLOAT_DIV:
-            return float(self.visit(node.left)) / float(self.visit(node.right))
+        return node.operation(self.visit(node.left), self.visit(node.right))
 
     def visit_Num(self, node):
         return node.value
 
     def visit_UnaryOp(self, node):
-        op = node.op.type
-        if op == PLUS:
-            return +self.visit(node.expr)
-        elif op == MINUS:
-            return -self.visit(node.expr)
+        return node.operation(self.visit(node.expr))
 
     def visit_Compound(self, node):
         for child in node.children:
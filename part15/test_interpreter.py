@@ -39,6 +39,25 @@ class LexerTestCase(unittest.TestCase):
         with self.assertRaises(LexerError):
             lexer.get_next_token()
 
+    def test_comments(self):
+        lexer = self.makeLexer('{ one }{two\n}  \n\t { three } a')
+        token = lexer.get_next_token()
+        self.assertEqual(token.value, 'a')
+        self.assertEqual((token.lineno, token.column), (3, 13))
+
+    def test_unterminated_comment(self):
+        from spi import LexerError, ErrorCode
+        lexer = self.makeLexer('a\n  { no closing brace')
+        lexer.get_next_token()
+        with self.assertRaises(LexerError) as cm:
+            lexer.get_next_token()
+        self.assertEqual(cm.exception.error_code, ErrorCode.UNTERMINATED_COMMENT)
+        self.assertEqual(
+            cm.exception.message,
+            "LexerError: Lexer error on '{' line: 2 column: 3 "
+            "(Unterminated comment)",
+        )
+
 
 class ParserTestCase(unittest.TestCase):
     def makeParser(self, text):
@@ -1,6 +1,10 @@
 """SPI - Simple Pascal Interpreter. Part 16."""
 
 import argparse
+import bisect
+import collections
+import operator
+import re
 import sys
 from enum import Enum
 
@@ -11,6 +15,7 @@ class ErrorCode(Enum):
     UNEXPECTED_TOKEN = 'Unexpected token'
     ID_NOT_FOUND     = 'Identifier not found'
     DUPLICATE_ID     = 'Duplicate id found'
+    UNTERMINATED_COMMENT = 'Unterminated comment'
 
 
 class Error(Exception):
@@ -69,12 +74,64 @@ class TokenType(Enum):
     EOF           = 'EOF'
 
 
+class LineIndex(object):
+    """Maps offsets into the source text to line and column numbers.
+
+    Line and column numbers are only needed to report errors, so
+    the offsets of the line starts are collected the first time a
+    position is requested and then binary searched.
+    """
+    def __init__(self, text):
+        self.text = text
+        self._line_starts = None
+
+    def _build_line_starts(self):
+        text = self.text
+        line_starts = [0]
+        pos = text.find('\n')
+        while pos != -1:
+            line_starts.append(pos + 1)
+            pos = text.find('\n', pos + 1)
+        return line_starts
+
+    def position(self, offset):
+        """Return the (lineno, column) pair of the given offset.
+
+        Both line and column numbers start at 1.
+        """
+        if self._line_starts is None:
+            self._line_starts = self._build_line_starts()
+        lineno = bisect.bisect_right(self._line_starts, offset)
+        column = offset - self._line_starts[lineno - 1] + 1
+        return lineno, column
+
+
 class Token(object):
-    def __init__(self, type, value, lineno=None, column=None):
+    def __init__(self, type, value, lineno=None, column=None,
+                 pos=None, lines=None):
         self.type = type
         self.value = value
-        self.lineno = lineno
-        self.column = column
+        # start offset of the lexeme in the source text and the
+        # LineIndex shared by all tokens of the source text, used to
+        # compute line and column numbers lazily from the offset
+        self.pos = pos
+        self.lines = lines
+        self._lineno = lineno
+        self._column = column
+
+    def _resolve_position(self):
+        if self._lineno is None and self.lines is not None:
+            self._lineno, self._column = self.lines.position(self.pos)
+
+    @property
+    def lineno(self):
+        self._resolve_position()
+        return self._lineno
+
+    @property
+    def column(self):
+        self._resolve_position()
+        return self._column
 
     def __str__(self):
         """String representation of the class instance.
@@ -125,6 +182,9 @@ def _build_reserved_keywords():
 
 RESERVED_KEYWORDS = _build_reserved_keywords()
 
+# a run of whitespace characters, skipped by the lexer in one step
+_WHITESPACE = re.compile(r'\s*')
+
 
 class Lexer(object):
     def __init__(self, text):
@@ -133,30 +193,34 @@ class Lexer(object):
         # self.pos is an index into self.text
         self.pos = 0
         self.current_char = self.text[self.pos]
-        # token line number and column number
-        self.lineno = 1
-        self.column = 1
+        # line numbers and column numbers are computed on demand
+        self.lines = LineIndex(text)
+
+    @property
+    def lineno(self):
+        return self.lines.position(self.pos)[0]
 
-    def error(self):
+    @property
+    def column(self):
+        return self.lines.position(self.pos)[1]
+
+    def error(self, error_code=None):
         s = "Lexer error on '{lexeme}' line: {lineno} column: {column}".format(
             lexeme=self.current_char,
             lineno=self.lineno,
             column=self.column,
         )
-        raise LexerError(message=s)
+        if error_code is not None:
+            s = f'{s} ({error_code.value})'
+        raise LexerError(error_code=error_code, message=s)
 
     def advance(self):
         """Advance the `pos` pointer and set the `current_char` variable."""
-        if self.current_char == '\n':
-            self.lineno += 1
-            self.column = 0
-
         self.pos += 1
         if self.pos > len(self.text) - 1:
             self.current_char = None  # Indicates end of input
         else:
             self.current_char = self.text[self.pos]
-            self.column += 1
 
     def peek(self):
         peek_pos = self.pos + 1
@@ -165,20 +229,29 @@ class Lexer(object):
         else:
             return self.text[peek_pos]
 
+    def _seek(self, pos):
+        """Move the `pos` pointer forward to `pos` in one step."""
+        self.pos = pos
+        if self.pos > len(self.text) - 1:
+            self.current_char = None  # Indicates end of input
+        else:
+            self.current_char = self.text[self.pos]
+
     def skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self.advance()
+        self._seek(_WHITESPACE.match(self.text, self.pos).end())
 
     def skip_comment(self):
-        while self.current_char != '}':
-            self.advance()
-        self.advance()  # the closing curly brace
+        # the closing curly brace of the comment starting at self.pos
+        end = self.text.find('}', self.pos + 1)
+        if end == -1:
+            self.error(error_code=ErrorCode.UNTERMINATED_COMMENT)
+        self._seek(end + 1)
 
     def number(self):
         """Return a (multidigit) integer or float consumed from the input."""
 
-        # Create a new token with current line and column number
-        token = Token(type=None, value=None, lineno=self.lineno, column=self.column)
+        # Create a new token starting at the current position
+        token = Token(type=None, value=None, pos=self.pos, lines=self.lines)
 
         result = ''
         while self.current_char is not None and self.current_char.isdigit():
@@ -204,8 +277,8 @@ class Lexer(object):
     def _id(self):
         """Handle identifiers and reserved keywords"""
 
-        # Create a new token with current line and column number
-        token = Token(type=None, value=None, lineno=self.lineno, column=self.column)
+        # Create a new token starting at the current position
+        token = Token(type=None, value=None, pos=self.pos, lines=self.lines)
 
         value = ''
         while self.current_char is not None and self.current_char.isalnum():
@@ -235,7 +308,6 @@ class Lexer(object):
                 continue
 
             if self.current_char == '{':
-                self.advance()
                 self.skip_comment()
                 continue
 
@@ -249,8 +321,8 @@ class Lexer(object):
                 token = Token(
                     type=TokenType.ASSIGN,
                     value=TokenType.ASSIGN.value,  # ':='
-                    lineno=self.lineno,
-                    column=self.column,
+                    pos=self.pos,
+                    lines=self.lines,
                 )
                 self.advance()
                 self.advance()
@@ -269,8 +341,8 @@ class Lexer(object):
                 token = Token(
                     type=token_type,
                     value=token_type.value,  # e.g. ';', '.', etc
-                    lineno=self.lineno,
-                    column=self.column,
+                    pos=self.pos,
+                    lines=self.lines,
                 )
                 self.advance()
                 return token
@@ -285,6 +357,27 @@ class Lexer(object):
 #  PARSER                                                                     #
 #                                                                             #
 ###############################################################################
+
+def float_div(left, right):
+    return float(left) / float(right)
+
+
+# the operations of the operators by token type, looked up once
+# by the BinOp and UnaryOp nodes
+BINARY_OPERATIONS = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.MUL: operator.mul,
+    TokenType.INTEGER_DIV: operator.floordiv,
+    TokenType.FLOAT_DIV: float_div,
+}
+
+UNARY_OPERATIONS = {
+    TokenType.PLUS: operator.pos,
+    TokenType.MINUS: operator.neg,
+}
+
+
 class AST(object):
     pass
 
@@ -294,6 +387,7 @@ class BinOp(AST):
         self.left = left
         self.token = self.op = op
         self.right = right
+        self.operation = BINARY_OPERATIONS[op.type]
 
 
 class Num(AST):
@@ -306,6 +400,7 @@ class UnaryOp(AST):
     def __init__(self, op, expr):
         self.token = self.op = op
         self.expr = expr
+        self.operation = UNARY_OPERATIONS[op.type]
 
 
 class Compound(AST):
@@ -379,12 +474,26 @@ class ProcedureCall(AST):
 class Parser(object):
     def __init__(self, lexer):
         self.lexer = lexer
+        # tokens already taken from the lexer but not consumed yet
+        self.lookahead = collections.deque()
         # set current token to the first token taken from the input
         self.current_token = self.get_next_token()
 
     def get_next_token(self):
+        if self.lookahead:
+            return self.lookahead.popleft()
         return self.lexer.get_next_token()
 
+    def peek(self, k=1):
+        """Return the k-th token after the current token.
+
+        The token is not consumed: it is kept in the lookahead
+        queue until get_next_token returns it.
+        """
+        while len(self.lookahead) < k:
+            self.lookahead.append(self.lexer.get_next_token())
+        return self.lookahead[k - 1]
+
     def error(self, error_code, token):
         raise ParserError(
             error_code=error_code,
@@ -568,7 +677,7 @@ class Parser(object):
         if self.current_token.type == TokenType.BEGIN:
             node = self.compound_statement()
         elif (self.current_token.type == TokenType.ID and
-              self.lexer.current_char == '('
+              self.peek().type == TokenType.LPAREN
         ):
             node = self.proccall_statement()
         elif self.current_token.type == TokenType.ID:
@@ -1033,26 +1142,13 @@ class Interpreter(NodeVisitor):
         pass
 
     def visit_BinOp(self, node):
-        if node.op.type == TokenType.PLUS:
-            return self.visit(node.left) + self.visit(node.right)
-        elif node.op.type == TokenType.MINUS:
-            return self.visit(node.left) - self.visit(node.right)
-        elif node.op.type == TokenType.MUL:
-            return self.visit(node.left) * self.visit(node.right)
-        elif node.op.type == TokenType.INTEGER_DIV:
-            return self.visit(node.left) // self.visit(node.right)
-        elif node.op.type == TokenType.FLOAT_DIV:
-            return float(self.visit(node.left)) / float(self.visit(node.right))
+        return node.operation(self.visit(node.left), self.visit(node.right))
 
     def visit_Num(self, node):
         return node.value
 
     def visit_UnaryOp(self, node):
-        op = node.op.type
-        if op == TokenType.PLUS:
-            return +self.visit(node.expr)
-        elif op == TokenType.MINUS:
-            return -self.visit(node.expr)
+        return node.operation(self.visit(node.expr))
 
     def visit_Compound(self, node):
         for child in node.children:
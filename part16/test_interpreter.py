@@ -39,6 +39,25 @@ class LexerTestCase(unittest.TestCase):
         with self.assertRaises(LexerError):
             lexer.get_next_token()
 
+    def test_comments(self):
+        lexer = self.makeLexer('{ one }{two\n}  \n\t { three } a')
+        token = lexer.get_next_token()
+        self.assertEqual(token.value, 'a')
+        self.assertEqual((token.lineno, token.column), (3, 13))
+
+    def test_unterminated_comment(self):
+        from spi import LexerError, ErrorCode
+        lexer = self.makeLexer('a\n  { no closing brace')
+        lexer.get_next_token()
+        with self.assertRaises(LexerError) as cm:
+            lexer.get_next_token()
+        self.assertEqual(cm.exception.error_code, ErrorCode.UNTERMINATED_COMMENT)
+        self.assertEqual(
+            cm.exception.message,
+            "LexerError: Lexer error on '{' line: 2 column: 3 "
+            "(Unterminated comment)",
+        )
+
 
 class ParserTestCase(unittest.TestCase):
     def makeParser(self, text):
@@ -129,6 +148,39 @@ class ParserTestCase(unittest.TestCase):
         self.assertEqual(the_exception.token.value, 'VAR')
         self.assertEqual(the_exception.token.lineno, 5)  # second VAR
 
+    def test_peek(self):
+        from spi import TokenType
+        parser = self.makeParser('PROGRAM Test;')
+        self.assertEqual(parser.peek().value, 'Test')
+        self.assertEqual(parser.peek(2).type, TokenType.SEMI)
+        self.assertEqual(parser.peek(3).type, TokenType.EOF)
+        # peeking does not consume tokens
+        self.assertEqual(parser.current_token.type, TokenType.PROGRAM)
+        parser.eat(TokenType.PROGRAM)
+        self.assertEqual(parser.current_token.value, 'Test')
+
+    def test_procedure_call_statement(self):
+        from spi import Assign, ProcedureCall
+        parser = self.makeParser(
+            """
+            PROGRAM Test;
+            VAR
+                a : INTEGER;
+            PROCEDURE Alpha(x : INTEGER);
+            BEGIN
+            END;
+            BEGIN
+               Alpha (1 + 2);
+               a := (3)
+            END.
+            """
+        )
+        tree = parser.parse()
+        call, assign = tree.block.compound_statement.children
+        self.assertIsInstance(call, ProcedureCall)
+        self.assertEqual(call.proc_name, 'Alpha')
+        self.assertIsInstance(assign, Assign)
+
 
 class SemanticAnalyzerTestCase(unittest.TestCase):
     def runSemanticAnalyzer(self, text):
@@ -0,0 +1,585 @@
+###############################################################################
+#  Flat, array-backed AST (an AST arena).                                     #
+#                                                                             #
+#  Instead of one Python object per node, the nodes of an ASTArena live in    #
+#  parallel arrays indexed by node number:                                    #
+#                                                                             #
+#      kinds        - node type codes (see NODE_TYPES), array('B')            #
+#      first_child  - index of the first child or -1, array('i')              #
+#      next_sibling - index of the next sibling or -1, array('i')             #
+#      payloads     - index into the `values` side table or -1, array('i')    #
+#      offsets      - source span start offsets, array('I')                   #
+#      lengths      - source span lengths, array('I')                         #
+#                                                                             #
+#  Node views (see NodeView) expose the attributes of the object AST, so      #
+#  SemanticAnalyzer and Interpreter walk an arena without changes. The        #
+#  attributes set by the analyzer are kept in the `annotations` dicts.        #
+#                                                                             #
+#      >>> tree = ArenaParser(Lexer(text)).parse()                            #
+#      >>> SemanticAnalyzer().visit(tree)                                     #
+#      >>> Interpreter(tree).interpret()                                      #
+#                                                                             #
+###############################################################################
+import io
+import pickle
+import struct
+from array import array
+
+import spi
+
+# node types in the order of their codes in the `kinds` array
+NODE_TYPES = (
+    spi.Program,
+    spi.Block,
+    spi.VarDecl,
+    spi.Type,
+    spi.Param,
+    spi.ProcedureDecl,
+    spi.Compound,
+    spi.Assign,
+    spi.BinOp,
+    spi.UnaryOp,
+    spi.Num,
+    spi.Var,
+    spi.NoOp,
+    spi.ProcedureCall,
+)
+NODE_CODES = {node_type: code for code, node_type in enumerate(NODE_TYPES)}
+
+# children of every node type, in order
+_CHILDREN = {
+    spi.Program: lambda node: [node.block],
+    spi.Block: lambda node: node.declarations + [node.compound_statement],
+    spi.VarDecl: lambda node: [node.var_node, node.type_node],
+    spi.Type: lambda node: [],
+    spi.Param: lambda node: [node.var_node, node.type_node],
+    spi.ProcedureDecl: lambda node: node.params + [node.block_node],
+    spi.Compound: lambda node: node.children,
+    spi.Assign: lambda node: [node.left, node.right],
+    spi.BinOp: lambda node: [node.left, node.right],
+    spi.UnaryOp: lambda node: [node.expr],
+    spi.Num: lambda node: [],
+    spi.Var: lambda node: [],
+    spi.NoOp: lambda node: [],
+    spi.ProcedureCall: lambda node: node.actual_params,
+}
+
+# the value every node type keeps in the `values` side table
+_PAYLOADS = {
+    spi.Program: lambda node: node.name,
+    spi.Type: lambda node: node.value,
+    spi.ProcedureDecl: lambda node: node.proc_name,
+    spi.Assign: lambda node: node.op,
+    spi.BinOp: lambda node: node.op,
+    spi.UnaryOp: lambda node: node.op,
+    spi.Num: lambda node: node.value,
+    spi.Var: lambda node: node.value,
+    spi.ProcedureCall: lambda node: node.proc_name,
+}
+
+# attributes set by SemanticAnalyzer that are kept in the annotations
+_ANNOTATIONS = {
+    spi.Program: ('var_names',),
+    spi.ProcedureDecl: ('var_names', 'proc_symbol'),
+    spi.Var: ('depth', 'slot', 'static_type'),
+    spi.BinOp: ('static_type',),
+    spi.UnaryOp: ('static_type',),
+    spi.ProcedureCall: ('proc_symbol',),
+}
+
+# header of an arena written with ASTArena.write: the magic bytes,
+# the number of nodes and the size of the pickled side table
+_MAGIC = b'SPIARENA'
+_HEADER = struct.Struct('<8sII')
+
+
+class ArenaRef(spi.AST):
+    """Stands in for a subtree that has already been added to an arena."""
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+
+class ASTArena:
+    def __init__(self, lines=None):
+        # LineIndex of the source text the nodes come from
+        self.lines = lines
+        self.kinds = array('B')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.payloads = array('i')
+        self.offsets = array('I')
+        self.lengths = array('I')
+        self.values = []
+        self._payload_ids = {}
+        # attributes set by passes over the tree, by name and node index
+        self.annotations = {}
+        # index of the Program node
+        self.root = -1
+
+    @classmethod
+    def from_tree(cls, tree):
+        """Convert an object AST into an arena."""
+        arena = cls()
+        arena.root = arena.add_tree(tree)
+        return arena
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add_tree(self, node):
+        """Add the subtree rooted at node and return the index of its root.
+
+        Children are always added before their parent, the walk is
+        iterative so that deeply nested expressions don't exhaust the
+        Python stack.
+        """
+        # (node, number of children) pairs, the number is None until
+        # the children of the node have been pushed
+        stack = [(node, None)]
+        # indices of the completed subtrees
+        indices = []
+        while stack:
+            node, nchildren = stack.pop()
+            if node.__class__ is ArenaRef:
+                indices.append(node.index)
+            elif nchildren is None:
+                children = _CHILDREN[node.__class__](node)
+                stack.append((node, len(children)))
+                stack.extend((child, None) for child in reversed(children))
+            else:
+                children = indices[len(indices) - nchildren:]
+                del indices[len(indices) - nchildren:]
+                indices.append(self._add(node, children))
+        return indices[0]
+
+    def _add(self, node, children):
+        node_type = node.__class__
+        index = len(self.kinds)
+        self.kinds.append(NODE_CODES[node_type])
+        self.first_child.append(children[0] if children else -1)
+        self.next_sibling.append(-1)
+        for child, sibling in zip(children, children[1:]):
+            self.next_sibling[child] = sibling
+
+        get_payload = _PAYLOADS.get(node_type)
+        if get_payload is None:
+            self.payloads.append(-1)
+        else:
+            value = get_payload(node)
+            # the type is part of the key to keep e.g. 3 and 3.0 apart
+            key = (value.__class__, value)
+            payload_id = self._payload_ids.get(key)
+            if payload_id is None:
+                payload_id = self._payload_ids[key] = len(self.values)
+                self.values.append(value)
+            self.payloads.append(payload_id)
+
+        for name in _ANNOTATIONS.get(node_type, ()):
+            value = getattr(node, name)
+            if value is not None:
+                self.annotations.setdefault(name, {})[index] = value
+
+        if isinstance(node, spi.TokenNode):
+            if self.lines is None:
+                self.lines = node.lines
+            self.offsets.append(node.pos)
+            self.lengths.append(node.length)
+        else:
+            self.offsets.append(0)
+            self.lengths.append(0)
+        return index
+
+    def view(self, index=None):
+        """Return a view of the node at index (the root by default)."""
+        if index is None:
+            index = self.root
+        return VIEW_TYPES[self.kinds[index]](self, index)
+
+    def children(self, index):
+        """Return the indices of the children of the node at index."""
+        children = []
+        child = self.first_child[index]
+        while child != -1:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def write(self, f):
+        """Write the arena to a binary file.
+
+        The node arrays are written as they are, only the side tables
+        of payload values and annotations and the line index are
+        pickled.
+        """
+        # the source text is only needed for diagnostics
+        table = io.BytesIO()
+        _TablePickler(self, table).dump(
+            (self.root, self.values, self.annotations, self.lines),
+        )
+        table = table.getvalue()
+        f.write(_HEADER.pack(_MAGIC, len(self), len(table)))
+        for nodes in self._arrays():
+            nodes.tofile(f)
+        f.write(table)
+
+    @classmethod
+    def read(cls, f):
+        """Read an arena written with `write` from a binary file."""
+        magic, size, table_size = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError('Not an AST arena')
+        arena = cls()
+        for nodes in arena._arrays():
+            nodes.fromfile(f, size)
+        (
+            arena.root, arena.values, arena.annotations, arena.lines
+        ) = _TableUnpickler(arena, io.BytesIO(f.read(table_size))).load()
+        return arena
+
+    def _arrays(self):
+        return (
+            self.kinds,
+            self.first_child,
+            self.next_sibling,
+            self.payloads,
+            self.offsets,
+            self.lengths,
+        )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # only needed while the arena is being built
+        del state['_payload_ids']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._payload_ids = {
+            (value.__class__, value): payload_id
+            for payload_id, value in enumerate(self.values)
+        }
+
+
+class _TablePickler(pickle.Pickler):
+    """Pickles the side tables of an arena.
+
+    Views of the arena's own nodes, e.g. the bodies of the procedure
+    symbols, are written as node indices, not with another copy of
+    the arena.
+    """
+    def __init__(self, arena, f):
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arena = arena
+
+    def persistent_id(self, obj):
+        if isinstance(obj, NodeView) and obj.arena is self.arena:
+            return obj.index
+        return None
+
+
+class _TableUnpickler(pickle.Unpickler):
+    """Resolves the node indices of _TablePickler in the read arena."""
+    def __init__(self, arena, f):
+        super().__init__(f)
+        self.arena = arena
+
+    def persistent_load(self, index):
+        return self.arena.view(index)
+
+
+class ArenaParser(spi.Parser):
+    """Parser that builds an ASTArena instead of a tree of objects.
+
+    Every statement is moved into the arena as soon as it has been
+    parsed, so only the statement being parsed exists as objects.
+    parse() returns a view of the Program node; the arena itself is
+    available as `parser.arena` (or `tree.arena`).
+    """
+    def __init__(self, lexer):
+        super().__init__(lexer)
+        self.arena = ASTArena(lines=getattr(lexer, 'lines', None))
+
+    def statement(self):
+        return ArenaRef(self.arena.add_tree(super().statement()))
+
+    def parse(self):
+        self.arena.root = self.arena.add_tree(super().parse())
+        return self.arena.view()
+
+
+###############################################################################
+#                                                                             #
+#  NODE VIEWS                                                                 #
+#                                                                             #
+###############################################################################
+
+def _annotation(name):
+    """Return a view attribute stored in the arena annotations."""
+    def get(view):
+        return view.arena.annotations.get(name, {}).get(view.index)
+
+    def set(view, value):
+        view.arena.annotations.setdefault(name, {})[view.index] = value
+
+    return property(get, set)
+
+
+class NodeView:
+    """A node of an arena, with the attributes of the object AST node.
+
+    Views are created on access and hold no state of their own besides
+    the arena and the node index. The view classes share the names of
+    the AST classes, so NodeVisitor dispatches them to the same
+    visit_ methods, and are registered as virtual subclasses of them,
+    so isinstance(view, spi.BinOp) holds for a BinOp view.
+    """
+    __slots__ = ('arena', 'index')
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, NodeView) and
+            self.arena is other.arena and
+            self.index == other.index
+        )
+
+    def __hash__(self):
+        return hash((id(self.arena), self.index))
+
+    def child_views(self):
+        arena = self.arena
+        return [arena.view(child) for child in arena.children(self.index)]
+
+    def child(self, n):
+        """Return a view of the n-th child."""
+        arena = self.arena
+        child = arena.first_child[self.index]
+        for _ in range(n):
+            child = arena.next_sibling[child]
+        return arena.view(child)
+
+    @property
+    def payload(self):
+        arena = self.arena
+        return arena.values[arena.payloads[self.index]]
+
+    @property
+    def pos(self):
+        return self.arena.offsets[self.index]
+
+    @property
+    def length(self):
+        return self.arena.lengths[self.index]
+
+    @property
+    def lines(self):
+        return self.arena.lines
+
+    @property
+    def token(self):
+        return spi.Token(
+            type=self.token_type,
+            value=self.token_value,
+            pos=self.pos,
+            length=self.length,
+            lines=self.lines,
+        )
+
+    @property
+    def token_value(self):
+        return self.payload
+
+
+class Program(NodeView):
+    __slots__ = ()
+
+    name = NodeView.payload
+    var_names = _annotation('var_names')
+
+    @property
+    def block(self):
+        return self.child(0)
+
+
+class Block(NodeView):
+    __slots__ = ()
+
+    @property
+    def declarations(self):
+        return self.child_views()[:-1]
+
+    @property
+    def compound_statement(self):
+        return self.child_views()[-1]
+
+
+class VarDecl(NodeView):
+    __slots__ = ()
+
+    @property
+    def var_node(self):
+        return self.child(0)
+
+    @property
+    def type_node(self):
+        return self.child(1)
+
+
+class Param(VarDecl):
+    __slots__ = ()
+
+
+class Type(NodeView):
+    __slots__ = ()
+
+    value = NodeView.payload
+
+    @property
+    def token_type(self):
+        return spi.RESERVED_KEYWORDS[self.value]
+
+
+class ProcedureDecl(NodeView):
+    __slots__ = ()
+
+    proc_name = NodeView.payload
+    var_names = _annotation('var_names')
+    proc_symbol = _annotation('proc_symbol')
+
+    @property
+    def params(self):
+        return self.child_views()[:-1]
+
+    @property
+    def block_node(self):
+        return self.child_views()[-1]
+
+
+class Compound(NodeView):
+    __slots__ = ()
+
+    @property
+    def children(self):
+        return self.child_views()
+
+
+class OpNode(NodeView):
+    __slots__ = ()
+
+    op = NodeView.payload
+    token_type = op
+
+    @property
+    def token_value(self):
+        return self.op.value
+
+
+class BinOp(OpNode):
+    __slots__ = ()
+
+    static_type = _annotation('static_type')
+
+    @property
+    def operation(self):
+        return spi.BINARY_OPERATIONS[self.op]
+
+    @property
+    def left(self):
+        return self.child(0)
+
+    @property
+    def right(self):
+        return self.child(1)
+
+
+class Assign(OpNode):
+    __slots__ = ()
+
+    @property
+    def left(self):
+        return self.child(0)
+
+    @property
+    def right(self):
+        return self.child(1)
+
+
+class UnaryOp(OpNode):
+    __slots__ = ()
+
+    static_type = _annotation('static_type')
+
+    @property
+    def operation(self):
+        return spi.UNARY_OPERATIONS[self.op]
+
+    @property
+    def expr(self):
+        return self.child(0)
+
+
+class Num(NodeView):
+    __slots__ = ()
+
+    value = NodeView.payload
+
+    @property
+    def token_type(self):
+        if isinstance(self.value, int):
+            return spi.TokenType.INTEGER_CONST
+        return spi.TokenType.REAL_CONST
+
+    static_type = spi.Num.static_type
+
+
+class Var(NodeView):
+    __slots__ = ()
+
+    value = NodeView.payload
+    token_type = spi.TokenType.ID
+    depth = _annotation('depth')
+    slot = _annotation('slot')
+    static_type = _annotation('static_type')
+
+
+class NoOp(NodeView):
+    __slots__ = ()
+
+
+class ProcedureCall(NodeView):
+    __slots__ = ()
+
+    proc_name = NodeView.payload
+    token_type = spi.TokenType.ID
+    proc_symbol = _annotation('proc_symbol')
+
+    @property
+    def actual_params(self):
+        return self.child_views()
+
+
+# view types in the order of the node type codes
+VIEW_TYPES = (
+    Program,
+    Block,
+    VarDecl,
+    Type,
+    Param,
+    ProcedureDecl,
+    Compound,
+    Assign,
+    BinOp,
+    UnaryOp,
+    Num,
+    Var,
+    NoOp,
+    ProcedureCall,
+)
+
+for _view_type in VIEW_TYPES:
+    getattr(spi, _view_type.__name__).register(_view_type)
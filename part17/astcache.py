@@ -0,0 +1,148 @@
+###############################################################################
+#  On-disk cache of semantically checked ASTs (similar to __pycache__).       #
+#                                                                             #
+#  Every entry holds the pickled AST of one source text. Entries are keyed    #
+#  by a hash of the source text and of the interpreter version, so editing    #
+#  either one makes old entries unreachable; they are eventually evicted      #
+#  when the cache grows past its size limit (least recently used first).      #
+#                                                                             #
+###############################################################################
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+import spi
+
+# header of every cache entry, followed by the SHA-256 digest of the payload
+_MAGIC = b'SPIAST1\n'
+_DIGEST_SIZE = hashlib.sha256().digest_size
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024  # bytes
+
+
+def _interpreter_version():
+    """Return a string that changes whenever the AST format may change.
+
+    The AST classes live in spi.py, so the version is derived from
+    the contents of that file and from the Python version (pickles
+    are not guaranteed to be portable between Python versions).
+    """
+    with open(spi.__file__, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return '{}.{}-{}'.format(*sys.version_info[:2], digest[:16])
+
+
+INTERPRETER_VERSION = _interpreter_version()
+
+
+class ASTCache:
+    # file name suffix and header of the entries
+    SUFFIX = '.ast'
+    MAGIC = _MAGIC
+    # entries of other versions are unreachable
+    version = INTERPRETER_VERSION
+    # the suffixes of the entries of ASTCache and pybackend.CodeCache,
+    # which share a directory and count against the same max_size
+    SHARED_SUFFIXES = ('.ast', '.pyc')
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        # upper bound of the total size of all entries in bytes
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, source):
+        """Return the cache key of a source text (a str or bytes-like)."""
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        h = hashlib.sha256(self.version.encode('ascii'))
+        h.update(b'\0')
+        h.update(source)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def load(self, source):
+        """Return the cached AST of the source text or None.
+
+        Corrupt entries are removed, so the caller rebuilds them.
+        """
+        path = self.path(self.key(source))
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        header_size = len(self.MAGIC) + _DIGEST_SIZE
+        payload = data[header_size:]
+        if (data[:len(self.MAGIC)] != self.MAGIC or
+                data[len(self.MAGIC):header_size] !=
+                hashlib.sha256(payload).digest()):
+            self._remove(path)
+            return None
+        try:
+            tree = self.loads(payload)
+        except Exception:
+            self._remove(path)
+            return None
+
+        # mark the entry as recently used
+        os.utime(path)
+        return tree
+
+    def store(self, source, tree):
+        """Add the AST of the source text to the cache."""
+        try:
+            payload = self.dumps(tree)
+        except RecursionError:
+            # the tree is too deep to be pickled, don't cache it
+            return
+        data = self.MAGIC + hashlib.sha256(payload).digest() + payload
+
+        # write to a temporary file first, so that concurrent readers
+        # never see a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(self.key(source)))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits.
+
+        The entries of all caches in the directory are counted, so the
+        directory as a whole stays below max_size.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.SHARED_SUFFIXES):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    def dumps(self, tree):
+        return pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, payload):
+        return pickle.loads(payload)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
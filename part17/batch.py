@@ -0,0 +1,315 @@
+###############################################################################
+#  Batch execution over NumPy arrays.                                         #
+#                                                                             #
+#  BatchInterpreter runs a program once for a whole batch of inputs: the      #
+#  selected global variables are bound to one-dimensional NumPy arrays of     #
+#  the same length, every operation is evaluated element-wise over the        #
+#  whole batch, and the final values of the global variables come back as     #
+#  arrays:                                                                    #
+#                                                                             #
+#      >>> BatchInterpreter(tree, {'a': np.arange(100000)}).interpret()       #
+#      {'a': array([...]), 'b': array([...]), ...}                            #
+#                                                                             #
+#  Element i of the results is what Interpreter computes for element i of     #
+#  the inputs. INTEGER values are int64 and REAL values float64 arrays,       #
+#  DIV floors like Python's // and / divides like float(a) / float(b). If     #
+#  the interpreter would fail for any element (a division by zero or          #
+#  arithmetic on an unassigned variable), the whole batch fails with an       #
+#  ExecutionError that names the first such element.                          #
+#                                                                             #
+#  What can't be vectorized is refused with a BatchError: node types other    #
+#  than those of straight-line arithmetic programs, INTEGER values that do    #
+#  not fit in 64 bits (Python ints don't overflow, int64 arrays do) and       #
+#  inputs of the wrong shape or type. NumPy is optional, without it           #
+#  BatchInterpreter raises a BatchError.                                      #
+#                                                                             #
+###############################################################################
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from spi import (
+    ActivationRecord,
+    ARType,
+    Error,
+    ExecutionError,
+    Interpreter,
+    NodeVisitor,
+    TokenType,
+    VarDecl,
+)
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+# products of at least that magnitude (as floats) are checked exactly
+_MUL_CHECK_THRESHOLD = 2.0 ** 62
+
+
+class BatchError(Error):
+    pass
+
+
+def _require_numpy():
+    if np is None:
+        raise BatchError(message='batch mode requires NumPy')
+
+
+def load_inputs(path):
+    """Return the arrays of an .npz file by variable name."""
+    _require_numpy()
+    with np.load(path) as inputs:
+        return {name: inputs[name] for name in inputs.files}
+
+
+def save_results(path, results):
+    """Write the arrays of a batch run into an .npz file."""
+    _require_numpy()
+    np.savez(path, **results)
+
+
+class _BatchChecker(NodeVisitor):
+    """Refuses the programs BatchInterpreter can't run."""
+    def error(self, message, node):
+        token = getattr(node, 'token', None)
+        raise BatchError(
+            token=token,
+            message=f'{message} -> {token}' if token else message,
+        )
+
+    def generic_visit(self, node):
+        self.error(
+            f'{type(node).__name__} nodes cannot be run in batch mode', node,
+        )
+
+    def visit_Program(self, node):
+        self.visit(node.block)
+
+    def visit_Block(self, node):
+        for declaration in node.declarations:
+            self.visit(declaration)
+        self.visit(node.compound_statement)
+
+    def visit_VarDecl(self, node):
+        pass
+
+    def visit_ProcedureDecl(self, node):
+        self.visit(node.block_node)
+
+    def visit_Compound(self, node):
+        for child in node.children:
+            self.visit(child)
+
+    def visit_NoOp(self, node):
+        pass
+
+    def visit_Assign(self, node):
+        self.visit(node.right)
+
+    def visit_ProcedureCall(self, node):
+        for param_node in node.actual_params:
+            self.visit(param_node)
+
+    def visit_BinOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_UnaryOp(self, node):
+        self.visit(node.expr)
+
+    def visit_Var(self, node):
+        pass
+
+    def visit_Num(self, node):
+        if (isinstance(node.value, int) and
+                not _INT64_MIN <= node.value <= _INT64_MAX):
+            self.error('INTEGER constant does not fit in 64 bits', node)
+
+
+class BatchInterpreter(Interpreter):
+    """Runs a program element-wise over NumPy arrays.
+
+    `inputs` maps names of global variables to one-dimensional arrays
+    of equal length, the batch size. interpret() returns the arrays of
+    the assigned global variables by name.
+    """
+    def __init__(self, tree, inputs):
+        _require_numpy()
+        _BatchChecker().visit(tree)
+        super().__init__(tree)
+        self.size, self.inputs = self.bind(tree, inputs)
+        self.operations = {
+            TokenType.PLUS: self.add,
+            TokenType.MINUS: self.sub,
+            TokenType.MUL: self.mul,
+            TokenType.INTEGER_DIV: self.integer_div,
+            TokenType.FLOAT_DIV: self.float_div,
+        }
+
+    def bind(self, tree, inputs):
+        """Return the batch size and the input arrays as int64/float64."""
+        var_types = {
+            declaration.var_node.value: declaration.type_node.value
+            for declaration in tree.block.declarations
+            if isinstance(declaration, VarDecl)
+        }
+        if not inputs:
+            raise BatchError(message='batch mode needs at least one input')
+        size = None
+        arrays = {}
+        for name, values in inputs.items():
+            if name not in var_types:
+                raise BatchError(message=f'no global variable {name}')
+            values = np.asarray(values)
+            if values.ndim != 1:
+                raise BatchError(
+                    message=f'the input of {name} is not one-dimensional',
+                )
+            if size is None:
+                size = len(values)
+            elif len(values) != size:
+                raise BatchError(
+                    message=f'the input of {name} has {len(values)} values, '
+                            f'expected {size}',
+                )
+            if values.dtype.kind in 'iu':
+                # only uint64 values may exceed the int64 range
+                if values.dtype == np.uint64 and np.any(
+                    values > np.uint64(_INT64_MAX)
+                ):
+                    raise BatchError(
+                        message=f'the input of {name} does not fit in 64 bits',
+                    )
+                values = values.astype(np.int64)
+            elif values.dtype.kind == 'f' and var_types[name] == 'REAL':
+                values = values.astype(np.float64)
+            else:
+                raise BatchError(
+                    message=f'{values.dtype} input for the '
+                            f'{var_types[name]} variable {name}',
+                )
+            arrays[name] = values
+        return size, arrays
+
+    def visit_Program(self, node):
+        program_name = node.name
+        self.log(f'ENTER: PROGRAM {program_name}')
+
+        ar = ActivationRecord(
+            name=program_name,
+            type=ARType.PROGRAM,
+            nesting_level=1,
+            names=node.var_names,
+        )
+        for name, values in self.inputs.items():
+            ar.slots[node.var_names.index(name)] = values
+        self.call_stack.push(ar)
+
+        self.log(str(self.call_stack))
+
+        self.visit(node.block)
+
+        self.log(f'LEAVE: PROGRAM {program_name}')
+        self.log(str(self.call_stack))
+
+        self.call_stack.pop()
+        return {
+            name: np.broadcast_to(value, (self.size,)).copy()
+            for name, value in ar.members.items()
+        }
+
+    def visit_Num(self, node):
+        dtype = np.int64 if isinstance(node.value, int) else np.float64
+        return np.asarray(node.value, dtype=dtype)
+
+    def fail(self, error_class, message, node, mask):
+        """Raise an error for the first element where mask is true."""
+        elements = np.flatnonzero(np.broadcast_to(mask, (self.size,)))
+        if len(elements):
+            message = f'{message} in batch element {elements[0]}'
+        token = node.token
+        raise error_class(token=token, message=f'{message} -> {token}')
+
+    def operand(self, value, node):
+        if value is None:
+            # like None in the interpreter, for all elements at once
+            self.fail(
+                ExecutionError,
+                'Operation on an unassigned variable',
+                node,
+                True,
+            )
+        return value
+
+    def visit_BinOp(self, node):
+        left = self.operand(self.visit(node.left), node)
+        right = self.operand(self.visit(node.right), node)
+        with np.errstate(all='ignore'):
+            return np.asarray(self.operations[node.op](left, right, node))
+
+    def visit_UnaryOp(self, node):
+        value = self.operand(self.visit(node.expr), node)
+        if node.op == TokenType.PLUS:
+            return value
+        if _is_integer(value):
+            self.check_overflow(value == _INT64_MIN, node)
+        return np.asarray(np.negative(value))
+
+    def check_overflow(self, overflow, node):
+        if np.any(overflow):
+            self.fail(
+                BatchError, 'INTEGER result does not fit in 64 bits',
+                node, overflow,
+            )
+
+    def check_divisor(self, right, node):
+        zero = right == 0
+        if np.any(zero):
+            self.fail(ExecutionError, 'Division by zero', node, zero)
+
+    def add(self, left, right, node):
+        result = left + right
+        if _is_integer(result):
+            # the sign of the result differs from those of both operands
+            self.check_overflow(((left ^ result) & (right ^ result)) < 0, node)
+        return result
+
+    def sub(self, left, right, node):
+        result = left - right
+        if _is_integer(result):
+            self.check_overflow(((left ^ right) & (left ^ result)) < 0, node)
+        return result
+
+    def mul(self, left, right, node):
+        result = left * right
+        if _is_integer(result):
+            # the float product is close enough to tell small products,
+            # check the large ones with Python ints
+            product = np.asarray(left, dtype=np.float64) * right
+            large = np.abs(product) >= _MUL_CHECK_THRESHOLD
+            if np.any(large):
+                lefts, rights = np.broadcast_arrays(left, right)
+                overflow = np.zeros(np.shape(large), dtype=bool)
+                for i in np.flatnonzero(large):
+                    exact = int(lefts.flat[i]) * int(rights.flat[i])
+                    overflow.flat[i] = not _INT64_MIN <= exact <= _INT64_MAX
+                self.check_overflow(overflow, node)
+        return result
+
+    def integer_div(self, left, right, node):
+        self.check_divisor(right, node)
+        if _is_integer(left) and _is_integer(right):
+            self.check_overflow((left == _INT64_MIN) & (right == -1), node)
+        return np.floor_divide(left, right)
+
+    def float_div(self, left, right, node):
+        self.check_divisor(right, node)
+        return np.true_divide(
+            np.asarray(left, dtype=np.float64),
+            np.asarray(right, dtype=np.float64),
+        )
+
+
+def _is_integer(value):
+    return value.dtype.kind == 'i'
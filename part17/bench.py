@@ -0,0 +1,612 @@
+###############################################################################
+#  Benchmarks for SPI - Simple Pascal Interpreter. Part 17.                   #
+#                                                                             #
+#  Run all benchmarks:       $ python bench.py                                #
+#  Run selected benchmarks:  $ python bench.py lexer                          #
+#                                                                             #
+###############################################################################
+import argparse
+import importlib.util
+import io
+import os
+import pickle
+import timeit
+import tracemalloc
+
+from spi import (
+    LEXERS,
+    PARSERS,
+    ActivationRecord,
+    ARType,
+    FramePool,
+    Interpreter,
+    Lexer,
+    Parser,
+    SemanticAnalyzer,
+    TokenType,
+    tokenize,
+)
+
+
+def generate_program(nprocs=200, nstatements=20, ncomments=0):
+    """Generate a syntactically valid Pascal program of a given size.
+
+    `ncomments` is the number of indented comment lines that precede
+    every statement.
+    """
+    comment = '         { ' + 'lorem ipsum dolor sit amet ' * 2 + '}'
+    lines = [
+        'PROGRAM Bench;',
+        'VAR',
+        '   a, b, c : INTEGER;',
+        '   x, y    : REAL;',
+    ]
+    for i in range(nprocs):
+        lines.extend([
+            f'PROCEDURE P{i}(p : INTEGER; q : REAL);',
+            'VAR',
+            '   k, m : INTEGER;',
+            '   r    : REAL;',
+            'BEGIN',
+        ])
+        for j in range(nstatements):
+            lines.extend([comment] * ncomments)
+            lines.append(
+                f'   k := (p + {j}) * 3 - m DIV 2;  {{ statement {j} }}'
+            )
+            lines.append(f'   r := q / 7 + {j}.5 * r;')
+        lines.append('   m := k')
+        lines.append('END;  { P%d }' % i)
+    lines.extend([
+        'BEGIN { Bench }',
+        '   a := 2;',
+        '   b := 10 * a + 10 * a DIV 4;',
+        '   y := 20 / 7 + 3.14',
+        'END.  { Bench }',
+        '',
+    ])
+    return '\n'.join(lines)
+
+
+def _lex_all(lexer_class, text):
+    lexer = lexer_class(text)
+    count = 0
+    while lexer.get_next_token().type != TokenType.EOF:
+        count += 1
+    return count
+
+
+def bench_lexer(repeat):
+    """Compare the character-at-a-time and the regex lexers."""
+    text = generate_program()
+    print(f'lexer: {len(text)} characters, '
+          f'{_lex_all(LEXERS["char"], text)} tokens')
+    for name, lexer_class in sorted(LEXERS.items()):
+        best = min(timeit.repeat(
+            lambda: _lex_all(lexer_class, text), number=1, repeat=repeat,
+        ))
+        mb_per_sec = len(text) / best / 1e6
+        print(f'   {name:<10}: {best * 1000:8.1f} ms  {mb_per_sec:6.2f} MB/s')
+
+
+class _CharSkippingLexer(Lexer):
+    """Lexer that skips whitespace and comments a character at a time."""
+    def skip_whitespace(self):
+        while self.current_char is not None and self.current_char.isspace():
+            self.advance()
+
+    def skip_comment(self):
+        while self.current_char != '}':
+            self.advance()
+        self.advance()  # the closing curly brace
+
+
+def bench_comments(repeat):
+    """Lexer throughput on comment-heavy input."""
+    text = generate_program(ncomments=2)
+    skipped = sum(
+        len(line)
+        for line in text.splitlines()
+        if line.lstrip().startswith('{')
+    )
+    print(f'comments: {len(text)} characters, '
+          f'{skipped / len(text):.0%} in comment lines')
+    for name, lexer_class in [('per-char', _CharSkippingLexer)] + sorted(
+        LEXERS.items()
+    ):
+        best = min(timeit.repeat(
+            lambda: _lex_all(lexer_class, text), number=1, repeat=repeat,
+        ))
+        mb_per_sec = len(text) / best / 1e6
+        print(f'   {name:<10}: {best * 1000:8.1f} ms  {mb_per_sec:6.2f} MB/s')
+
+
+def _traced_size(func):
+    """Return the result of func() and the memory allocated for it."""
+    tracemalloc.start()
+    result = func()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def _token_list(text):
+    lexer = Lexer(text)
+    tokens = [lexer.get_next_token()]
+    while tokens[-1].type != TokenType.EOF:
+        tokens.append(lexer.get_next_token())
+    return tokens
+
+
+def bench_tokens(repeat):
+    """Compare a list of Token objects with a TokenBuffer."""
+    text = generate_program()
+    tokens, list_size = _traced_size(lambda: _token_list(text))
+    buffer, buffer_size = _traced_size(lambda: tokenize(text))
+    print(f'tokens: {len(tokens)} tokens')
+    print(f'   {"list":<10}: {list_size / len(tokens):6.1f} bytes/token')
+    print(f'   {"buffer":<10}: {buffer_size / len(buffer):6.1f} bytes/token')
+
+    def parse_buffer():
+        buffer.rewind()
+        Parser(buffer).parse()
+
+    best = min(timeit.repeat(parse_buffer, number=1, repeat=repeat))
+    print(f'   parse from buffer: {best * 1000:8.1f} ms')
+
+
+def generate_expressions(nstatements=5000):
+    """Generate a program made of long arithmetic assignments."""
+    lines = [
+        'PROGRAM Expressions;',
+        'VAR',
+        '   a, b, c : INTEGER;',
+        'BEGIN',
+    ]
+    for i in range(nstatements):
+        lines.append(
+            f'   a := -(a + {i}) * (b - -c) DIV ((a + 1) * 2 - b) + c * {i} - 7;'
+        )
+    lines.append('   a := 0')
+    lines.append('END.')
+    return '\n'.join(lines)
+
+
+def bench_parser(repeat):
+    """Compare the recursive and the precedence climbing parsers."""
+    tokens = tokenize(generate_expressions())
+    print(f'parser: {len(tokens)} tokens of expression-heavy code')
+
+    for name, parser_class in sorted(PARSERS.items()):
+        def parse():
+            tokens.rewind()
+            parser_class(tokens).parse()
+
+        best = min(timeit.repeat(parse, number=1, repeat=repeat))
+        print(f'   {name:<10}: {best * 1000:8.1f} ms')
+
+
+def bench_arena(repeat):
+    """Compare the object AST with the array-backed AST arena."""
+    from astarena import ArenaParser
+
+    tokens = tokenize(generate_program())
+    tree, tree_size = _traced_size(lambda: Parser(tokens).parse())
+    tokens.rewind()
+    arena, arena_size = _traced_size(
+        lambda: ArenaParser(tokens).parse().arena
+    )
+    print(f'arena: {len(arena)} nodes')
+    print(f'   {"objects":<10}: {tree_size / len(arena):6.1f} bytes/node')
+    print(f'   {"arena":<10}: {arena_size / len(arena):6.1f} bytes/node')
+
+    def write_arena():
+        arena.write(io.BytesIO())
+
+    for name, func in [
+        ('pickle objects', lambda: pickle.dumps(tree)),
+        ('pickle arena', lambda: pickle.dumps(arena)),
+        ('write arena', write_arena),
+    ]:
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        print(f'   {name}: {best * 1000:8.1f} ms')
+
+
+def generate_arithmetic(nstatements=5000):
+    """Generate a straight-line program of arithmetic assignments.
+
+    Unlike generate_expressions the program can be run: every
+    variable is assigned before it is used and no divisor is zero.
+    """
+    lines = [
+        'PROGRAM Arithmetic;',
+        'VAR',
+        '   a, b, c : INTEGER;',
+        '   x       : REAL;',
+        'BEGIN',
+        '   a := 1; b := 2; c := 3; x := 0.5;',
+    ]
+    for i in range(nstatements):
+        lines.append(
+            f'   a := (b + {i}) * 3 - c DIV 2; b := -a DIV 5 + {i} * c;'
+            f' x := x / 3 + (a - b) * 0.25;'
+        )
+    lines.append('   c := a + b')
+    lines.append('END.')
+    return '\n'.join(lines)
+
+
+class _GetattrInterpreter(Interpreter):
+    """Interpreter with the original getattr based NodeVisitor dispatch."""
+    def visit(self, node):
+        method_name = 'visit_' + type(node).__name__
+        visitor = getattr(self, method_name, self.generic_visit)
+        return visitor(node)
+
+
+def bench_dispatch(repeat):
+    """Compare getattr and cached per-class NodeVisitor dispatch."""
+    tree = Parser(Lexer(generate_arithmetic())).parse()
+    SemanticAnalyzer().visit(tree)
+    print('dispatch: interpreting arithmetic-heavy code')
+
+    for name, interpreter_class in [
+        ('getattr', _GetattrInterpreter),
+        ('cached', Interpreter),
+    ]:
+        best = min(timeit.repeat(
+            lambda: interpreter_class(tree).interpret(),
+            number=1,
+            repeat=repeat,
+        ))
+        print(f'   {name:<10}: {best * 1000:8.1f} ms')
+
+
+def bench_engines(repeat):
+    """Compare the execution engines on arithmetic-heavy code."""
+    from closures import ClosureInterpreter
+    from pybackend import PythonCompiler, PythonInterpreter
+    from vm import VM, BytecodeCompiler
+
+    tree = Parser(Lexer(generate_arithmetic())).parse()
+    SemanticAnalyzer().visit(tree)
+    print('engines: running arithmetic-heavy code')
+
+    best = min(timeit.repeat(
+        lambda: ClosureInterpreter(tree), number=1, repeat=repeat,
+    ))
+    print(f'   {"compile closures":<18}: {best * 1000:8.1f} ms')
+    best = min(timeit.repeat(
+        lambda: BytecodeCompiler().compile(tree), number=1, repeat=repeat,
+    ))
+    print(f'   {"compile bytecode":<18}: {best * 1000:8.1f} ms')
+    best = min(timeit.repeat(
+        lambda: PythonCompiler().compile(tree), number=1, repeat=repeat,
+    ))
+    print(f'   {"compile python":<18}: {best * 1000:8.1f} ms')
+
+    for name, interpreter in [
+        ('interpreter', Interpreter(tree)),
+        ('closures', ClosureInterpreter(tree)),
+        ('vm', VM(BytecodeCompiler().compile(tree))),
+        ('python', PythonInterpreter(tree)),
+    ]:
+        best = min(timeit.repeat(
+            interpreter.interpret, number=1, repeat=repeat,
+        ))
+        print(f'   {name:<18}: {best * 1000:8.1f} ms')
+
+
+def bench_ir(repeat):
+    """Compare the bytecode VM and the register VM on sample programs."""
+    import os
+    from regvm import RegisterVM, compile_program
+    from vm import VM, BytecodeCompiler
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    programs = [('arithmetic', generate_arithmetic())]
+    for path in ['part17.pas', os.path.join('..', 'part16', 'part16.pas')]:
+        with open(os.path.join(here, path)) as f:
+            programs.append((os.path.basename(path), f.read()))
+
+    print('ir: bytecode VM vs register VM (instructions, best time)')
+    for program_name, text in programs:
+        tree = Parser(Lexer(text)).parse()
+        SemanticAnalyzer().visit(tree)
+        print(f'   {program_name}')
+        for name, machine in [
+            ('vm', VM(BytecodeCompiler().compile(tree))),
+            ('regvm', RegisterVM(compile_program(tree))),
+        ]:
+            machine.run(profile=True)
+            executed = sum(machine.profile.values())
+            best = min(timeit.repeat(machine.run, number=1, repeat=repeat))
+            print(f'      {name:<6}: {executed:8} {best * 1000:8.2f} ms')
+
+
+def generate_calls(depth=5, fanout=10):
+    """Generate a program that makes fanout ** depth procedure calls.
+
+    The program calls P1 `fanout` times, P1 calls P2 `fanout` times
+    and so on down to the leaf procedure P{depth}, which adds its
+    argument to a global counter.
+    """
+    lines = [
+        'PROGRAM Calls;',
+        'VAR',
+        '   n : INTEGER;',
+        f'PROCEDURE P{depth}(p : INTEGER);',
+        'BEGIN',
+        '   n := n + p',
+        'END;',
+    ]
+    for level in range(depth - 1, 0, -1):
+        lines.extend([
+            f'PROCEDURE P{level}(p : INTEGER);',
+            'VAR',
+            '   k : INTEGER;',
+            'BEGIN',
+            '   k := p + 1;',
+        ])
+        lines.extend(f'   P{level + 1}(k - {i});' for i in range(fanout))
+        lines.append('END;')
+    lines.extend(['BEGIN', '   n := 0;'])
+    lines.extend(f'   P1({i});' for i in range(fanout))
+    lines.extend(['END.', ''])
+    return '\n'.join(lines)
+
+
+class _AllocatingFramePool(FramePool):
+    """FramePool that allocates a new record for every call."""
+    def acquire(self, proc_symbol):
+        return ActivationRecord(
+            name=proc_symbol.name,
+            type=ARType.PROCEDURE,
+            nesting_level=proc_symbol.nesting_level,
+            names=proc_symbol.var_names,
+        )
+
+    def release(self, proc_symbol, ar):
+        pass
+
+
+def bench_calls(repeat):
+    """Procedure call throughput of the execution engines."""
+    from closures import ClosureInterpreter
+    from pybackend import PythonInterpreter
+    from regvm import RegisterVM, compile_program
+    from tiered import MODES, TieredInterpreter
+    from vm import VM, BytecodeCompiler
+
+    depth, fanout = 5, 10
+    tree = Parser(Lexer(generate_calls(depth, fanout))).parse()
+    SemanticAnalyzer().visit(tree)
+    ncalls = sum(fanout ** level for level in range(1, depth + 1))
+    print(f'calls: {ncalls} procedure calls (best time, calls/s)')
+
+    allocating = Interpreter(tree)
+    allocating.frame_pool = _AllocatingFramePool()
+    runs = [
+        (name, interpreter.interpret)
+        for name, interpreter in [
+            ('allocating', allocating),
+            ('interpreter', Interpreter(tree)),
+            ('closures', ClosureInterpreter(tree)),
+            ('vm', VM(BytecodeCompiler().compile(tree))),
+            ('regvm', RegisterVM(compile_program(tree))),
+            ('python', PythonInterpreter(tree)),
+        ]
+    ]
+    # a tiered interpreter keeps its compiled procedures, every run
+    # starts with a new one
+    for mode in MODES:
+        runs.append((
+            f'tiered {mode}',
+            lambda mode=mode: TieredInterpreter(tree, mode=mode).interpret(),
+        ))
+    for name, run in runs:
+        best = min(timeit.repeat(run, number=1, repeat=repeat))
+        print(f'   {name:<15}: {best * 1000:8.1f} ms  '
+              f'{ncalls / best / 1e6:6.2f} M calls/s')
+
+
+def _load_part(path, name):
+    """Import the interpreter module of an earlier part by file name."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(here, '..', path),
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _chain_calculator(module):
+    """The Interpreter of a calculator with the original if/elif chains."""
+    PLUS, MINUS, MUL, DIV = module.PLUS, module.MINUS, module.MUL, module.DIV
+
+    class ChainInterpreter(module.Interpreter):
+        def term(self):
+            result = self.factor()
+            while self.current_token.type in (MUL, DIV):
+                token = self.current_token
+                if token.type == MUL:
+                    self.eat(MUL)
+                    result = result * self.factor()
+                elif token.type == DIV:
+                    self.eat(DIV)
+                    result = result // self.factor()
+            return result
+
+        def expr(self):
+            result = self.term()
+            while self.current_token.type in (PLUS, MINUS):
+                token = self.current_token
+                if token.type == PLUS:
+                    self.eat(PLUS)
+                    result = result + self.term()
+                elif token.type == MINUS:
+                    self.eat(MINUS)
+                    result = result - self.term()
+            return result
+
+    return ChainInterpreter
+
+
+def _chain_interpreter(module, interpreter_class):
+    """Subclass an Interpreter with the original if/elif chains."""
+    types = getattr(module, 'TokenType', module)
+    PLUS, MINUS, MUL = types.PLUS, types.MINUS, types.MUL
+    INTEGER_DIV = getattr(types, 'INTEGER_DIV', None) or types.DIV
+    FLOAT_DIV = getattr(types, 'FLOAT_DIV', None)
+    # only the nodes of part 17 keep the token type instead of the token
+    keeps_type = module.__name__ == 'spi'
+
+    class ChainInterpreter(interpreter_class):
+        def visit_BinOp(self, node):
+            op = node.op if keeps_type else node.op.type
+            if op == PLUS:
+                return self.visit(node.left) + self.visit(node.right)
+            elif op == MINUS:
+                return self.visit(node.left) - self.visit(node.right)
+            elif op == MUL:
+                return self.visit(node.left) * self.visit(node.right)
+            elif op == INTEGER_DIV:
+                return self.visit(node.left) // self.visit(node.right)
+            elif op == FLOAT_DIV:
+                return (float(self.visit(node.left)) /
+                        float(self.visit(node.right)))
+
+        def visit_UnaryOp(self, node):
+            op = node.op if keeps_type else node.op.type
+            if op == PLUS:
+                return +self.visit(node.expr)
+            elif op == MINUS:
+                return -self.visit(node.expr)
+
+    return ChainInterpreter
+
+
+def bench_operators(repeat):
+    """Compare if/elif operator chains with operator tables by part."""
+    import spi
+
+    calc = ' + '.join(['14 + 2 * 3 - 6 / 2'] * 100)
+    nested = ' - '.join(['7 + 3 * (10 / (12 / (3 + 1) - 1))'] * 100)
+    unary = ' - '.join(['-(3 + 5) * -2 + 7 * (10 / (12 / (3 + 1) - 1))'] * 20)
+    pascal = unary.replace('/', 'DIV') + ' + 20 / 7'
+    statements = '; '.join(['a := ' + unary] * 50)
+    program = (
+        'PROGRAM Operators; VAR a : INTEGER; x : REAL; BEGIN ' +
+        '; '.join(['a := ' + unary.replace('/', 'DIV'),
+                   'x := ' + pascal] * 25) +
+        ' END.'
+    )
+    parts = [
+        ('part5', 'part5/calc5.py', calc),
+        ('part6', 'part6/calc6.py', nested),
+        ('part7', 'part7/python/spi.py', nested),
+        ('part8', 'part8/python/spi.py', unary),
+        ('part9', 'part9/python/spi.py', f'BEGIN {statements} END.'),
+    ] + [
+        (f'part{n}', path, program)
+        for n, path in [
+            (10, 'part10/python/spi.py'),
+            (11, 'part11/python/spi.py'),
+            (12, 'part12/python/spi.py'),
+            (13, 'part13/spi.py'),
+            (14, 'part14/spi.py'),
+            (15, 'part15/spi.py'),
+            (16, 'part16/spi.py'),
+        ]
+    ]
+
+    print('operators: if/elif chains vs operator tables (best time)')
+    for name, path, text in parts:
+        module = _load_part(path, f'_{name}')
+        if name in ('part5', 'part6'):
+            # calculators evaluate while they parse
+            runs = [
+                (interpreter_class,
+                 lambda c: c(module.Lexer(text)).expr())
+                for interpreter_class in [
+                    _chain_calculator(module), module.Interpreter,
+                ]
+            ]
+        else:
+            tree = module.Parser(module.Lexer(text)).parse()
+            runs = [
+                (interpreter_class, lambda c: c(None).visit(tree))
+                for interpreter_class in [
+                    _chain_interpreter(module, module.Interpreter),
+                    module.Interpreter,
+                ]
+            ]
+        times = [
+            min(timeit.repeat(
+                lambda: run(interpreter_class), number=10, repeat=repeat,
+            ))
+            for interpreter_class, run in runs
+        ]
+        chain, table = times[0] / 10, times[1] / 10
+        print(f'   {name:<7}: {chain * 1000:8.2f} ms  {table * 1000:8.2f} ms'
+              f'  {chain / table:5.2f}x')
+
+    tree = Parser(Lexer(generate_arithmetic())).parse()
+    SemanticAnalyzer().visit(tree)
+    times = [
+        min(timeit.repeat(
+            lambda: interpreter_class(tree).interpret(),
+            number=1,
+            repeat=repeat,
+        ))
+        for interpreter_class in [
+            _chain_interpreter(spi, Interpreter), Interpreter,
+        ]
+    ]
+    chain, table = times
+    print(f'   {"part17":<7}: {chain * 1000:8.2f} ms  {table * 1000:8.2f} ms'
+          f'  {chain / table:5.2f}x')
+
+
+BENCHMARKS = {
+    'arena': bench_arena,
+    'calls': bench_calls,
+    'comments': bench_comments,
+    'dispatch': bench_dispatch,
+    'engines': bench_engines,
+    'ir': bench_ir,
+    'lexer': bench_lexer,
+    'operators': bench_operators,
+    'parser': bench_parser,
+    'tokens': bench_tokens,
+}
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description='Run SPI benchmarks.'
+    )
+    argparser.add_argument(
+        'names',
+        nargs='*',
+        help='benchmarks to run: %s (default: all)' % ', '.join(
+            sorted(BENCHMARKS)
+        ),
+    )
+    argparser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='number of timing runs, the best one is reported',
+    )
+    args = argparser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            argparser.error(f'unknown benchmark: {name}')
+    for name in args.names or sorted(BENCHMARKS):
+        BENCHMARKS[name](args.repeat)
+
+
+if __name__ == '__main__':
+    main()
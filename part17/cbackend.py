@@ -0,0 +1,605 @@
+###############################################################################
+#  C backend: ahead-of-time compilation with the system C compiler.           #
+#                                                                             #
+#  CCompiler translates an analyzed AST into a standalone C program:          #
+#                                                                             #
+#    - INTEGER values are int64_t, REAL values are double;                    #
+#    - every procedure is a static function with its variables in a frame     #
+#      struct; the frame links to the frame of the enclosing procedure        #
+#      (the static link), which is how nested procedures reach the            #
+#      variables of enclosing scopes;                                         #
+#    - every variable has an `assigned` flag, because using an unassigned     #
+#      variable (None in the interpreters) is an error.                       #
+#                                                                             #
+#  The compiled program prints the activation record of the program when it   #
+#  ends, exactly like the --stack log of the interpreters does (the same      #
+#  repr of REAL values included), and reports run-time errors with the        #
+#  messages and source positions of the Python backend (see pybackend.py).    #
+#                                                                             #
+#      >>> c_source = CCompiler().compile(tree)                               #
+#      >>> run_native(c_source)                                               #
+#                                                                             #
+#  The C types are static, so programs that store an INTEGER value in a REAL  #
+#  variable or vice versa (which the interpreters allow) are rejected with    #
+#  a CBackendError, as are INTEGER results that do not fit in 64 bits.        #
+#                                                                             #
+###############################################################################
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+
+from spi import Error, NodeVisitor, Param, TokenType, VarDecl
+
+# -std=c99 also keeps the compiler from contracting a * b + c into
+# a fused multiply-add, which rounds differently than Python does
+CFLAGS = ['-std=c99', '-O2', '-ffp-contract=off']
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+_C_TYPES = {'int': 'int64_t', 'float': 'double'}
+_PASCAL_TYPES = {'INTEGER': 'int', 'REAL': 'float'}
+
+# the symbols of the operators in Python error messages
+_SYMBOLS = {
+    TokenType.PLUS: '+',
+    TokenType.MINUS: '-',
+    TokenType.MUL: '*',
+    TokenType.INTEGER_DIV: '//',
+}
+
+_INT_FUNCTIONS = {
+    TokenType.PLUS: 'spi_add',
+    TokenType.MINUS: 'spi_sub',
+    TokenType.MUL: 'spi_mul',
+    TokenType.INTEGER_DIV: 'spi_div',
+}
+
+_RUNTIME = r'''#include <inttypes.h>
+#include <math.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+static void spi_error(const char *message, int line, int column)
+{
+    fflush(stdout);
+    printf("ExecutionError: %s -> line: %d column: %d\n",
+           message, line, column);
+    exit(1);
+}
+
+static void spi_operand_error(const char *op, const char *left,
+                              const char *right, int line, int column)
+{
+    char message[128];
+    snprintf(message, sizeof message,
+             "TypeError: unsupported operand type(s) for %s: '%s' and '%s'",
+             op, left, right);
+    spi_error(message, line, column);
+}
+
+#define SPI_OVERFLOW "OverflowError: INTEGER result out of 64-bit range"
+
+static int64_t spi_add(int64_t a, int64_t b, int line, int column)
+{
+    int64_t result;
+    if (__builtin_add_overflow(a, b, &result))
+        spi_error(SPI_OVERFLOW, line, column);
+    return result;
+}
+
+static int64_t spi_sub(int64_t a, int64_t b, int line, int column)
+{
+    int64_t result;
+    if (__builtin_sub_overflow(a, b, &result))
+        spi_error(SPI_OVERFLOW, line, column);
+    return result;
+}
+
+static int64_t spi_mul(int64_t a, int64_t b, int line, int column)
+{
+    int64_t result;
+    if (__builtin_mul_overflow(a, b, &result))
+        spi_error(SPI_OVERFLOW, line, column);
+    return result;
+}
+
+static int64_t spi_neg(int64_t a, int line, int column)
+{
+    if (a == INT64_MIN)
+        spi_error(SPI_OVERFLOW, line, column);
+    return -a;
+}
+
+/* Python's int // int, which rounds towards negative infinity */
+static int64_t spi_div(int64_t a, int64_t b, int line, int column)
+{
+    int64_t quotient;
+    if (b == 0)
+        spi_error("ZeroDivisionError: integer division or modulo by zero",
+                  line, column);
+    if (a == INT64_MIN && b == -1)
+        spi_error(SPI_OVERFLOW, line, column);
+    quotient = a / b;
+    if (a % b != 0 && (a < 0) != (b < 0))
+        quotient--;
+    return quotient;
+}
+
+/* Python's float // float (see float_floor_div in floatobject.c) */
+static double spi_floordiv(double vx, double wx, int line, int column)
+{
+    double mod, div, floordiv;
+    if (wx == 0.0)
+        spi_error("ZeroDivisionError: float floor division by zero",
+                  line, column);
+    mod = fmod(vx, wx);
+    div = (vx - mod) / wx;
+    if (mod && (wx < 0) != (mod < 0))
+        div -= 1.0;
+    if (div) {
+        floordiv = floor(div);
+        if (div - floordiv > 0.5)
+            floordiv += 1.0;
+    }
+    else {
+        floordiv = copysign(0.0, vx / wx);
+    }
+    return floordiv;
+}
+
+static double spi_fdiv(double a, double b, int line, int column)
+{
+    if (b == 0.0)
+        spi_error("ZeroDivisionError: float division by zero", line, column);
+    return a / b;
+}
+
+/* Print a double like Python's repr(): the shortest digits that read
+   back as the same double, in fixed notation for exponents from -4
+   to 15 and in scientific notation otherwise. */
+static void spi_print_real(double x)
+{
+    char buffer[40], digits[20];
+    int precision, exponent, ndigits, i;
+    char *p;
+
+    if (isnan(x)) {
+        printf("nan");
+        return;
+    }
+    if (isinf(x)) {
+        printf(x < 0 ? "-inf" : "inf");
+        return;
+    }
+    for (precision = 1; precision <= 17; precision++) {
+        snprintf(buffer, sizeof buffer, "%.*e", precision - 1, x);
+        if (strtod(buffer, NULL) == x)
+            break;
+    }
+
+    /* buffer is [-]d[.ddd]e(+|-)dd */
+    p = buffer;
+    if (*p == '-') {
+        putchar('-');
+        p++;
+    }
+    ndigits = 0;
+    for (; *p != 'e'; p++) {
+        if (*p != '.')
+            digits[ndigits++] = *p;
+    }
+    exponent = atoi(p + 1);
+    /* drop trailing zeros, e.g. of "1.0e+02" */
+    while (ndigits > 1 && digits[ndigits - 1] == '0')
+        ndigits--;
+
+    if (-4 <= exponent && exponent < 16) {
+        if (exponent < 0) {
+            printf("0.");
+            for (i = 0; i < -exponent - 1; i++)
+                putchar('0');
+            printf("%.*s", ndigits, digits);
+        }
+        else {
+            for (i = 0; i <= exponent; i++)
+                putchar(i < ndigits ? digits[i] : '0');
+            putchar('.');
+            if (ndigits > exponent + 1)
+                printf("%.*s", ndigits - exponent - 1, digits + exponent + 1);
+            else
+                putchar('0');
+        }
+    }
+    else {
+        putchar(digits[0]);
+        if (ndigits > 1)
+            printf(".%.*s", ndigits - 1, digits + 1);
+        printf("e%c%02d", exponent < 0 ? '-' : '+', abs(exponent));
+    }
+}
+'''
+
+
+class CBackendError(Error):
+    pass
+
+
+class _Frame:
+    """The compiled program or procedure."""
+    def __init__(self, index, name, level, var_names, types, nparams):
+        self.index = index
+        self.name = name
+        # static nesting level, 1 for the program
+        self.level = level
+        self.var_names = var_names
+        # 'int' or 'float' by slot
+        self.types = types
+        self.nparams = nparams
+
+    @property
+    def struct(self):
+        return f'struct frame_{self.index}'
+
+    @property
+    def function(self):
+        return f'p{self.index}'
+
+
+class _Operand:
+    """The C expression of a value.
+
+    `assigned` is the C expression of its assigned flag, or None if
+    the value is known to be assigned.
+    """
+    def __init__(self, type, value, assigned=None):
+        self.type = type
+        self.value = value
+        self.assigned = assigned
+
+
+def _c_string(text):
+    """Return a C string literal of the text."""
+    chars = []
+    for byte in text.encode('utf-8'):
+        char = chr(byte)
+        if char in '"\\' or not 32 <= byte < 127:
+            chars.append(f'\\{byte:03o}')
+        else:
+            chars.append(char)
+    return '"' + ''.join(chars) + '"'
+
+
+def _c_number(value):
+    """Return a C expression of an INTEGER or REAL constant."""
+    if isinstance(value, int):
+        if value == _INT64_MIN:
+            # the literal 9223372036854775808 doesn't fit in int64_t
+            return '(-INT64_C(9223372036854775807) - 1)'
+        return f'INT64_C({value})'
+    if math.isnan(value):
+        return 'NAN'
+    if math.isinf(value):
+        return 'INFINITY' if value > 0 else '(-INFINITY)'
+    return repr(value)
+
+
+def _comment(text):
+    return '/* ' + text.replace('*/', '* /') + ' */'
+
+
+class CCompiler(NodeVisitor):
+    """Compiles an analyzed AST into the source of a C program."""
+    def __init__(self):
+        # _Frame by level of the procedures being compiled
+        self.frames = [None]
+        # all frames, the program first
+        self.all_frames = []
+        # ProcedureSymbol -> _Frame
+        self.procedure_frames = {}
+        # struct definitions, prototypes and function definitions
+        self.structs = []
+        self.prototypes = []
+        self.functions = []
+        # the body of the function being compiled
+        self.lines = []
+        self.ntemps = 0
+
+    def compile(self, tree):
+        """Return the source of the C program."""
+        self.visit(tree)
+        return '\n'.join(
+            [f'/* Generated by spi.py from PROGRAM {tree.name} */', _RUNTIME]
+            + [f'{frame.struct};' for frame in self.all_frames]
+            + [''] + self.structs + self.prototypes + [''] + self.functions
+        )
+
+    def error(self, message, node):
+        raise CBackendError(
+            token=node.token,
+            message=f'{message} -> {node.token}',
+        )
+
+    def emit(self, line):
+        self.lines.append('    ' + line)
+
+    def new_temp(self, type, value):
+        self.ntemps += 1
+        name = f't{self.ntemps}'
+        self.emit(f'{_C_TYPES[type]} {name} = {value};')
+        return name
+
+    def position(self, node):
+        token = node.token
+        return f'{token.lineno}, {token.column}'
+
+    def enter(self, name, var_names, params, block):
+        """Create the _Frame of a procedure and emit its struct."""
+        declared = {}
+        for declaration in list(params) + list(block.declarations):
+            if isinstance(declaration, (Param, VarDecl)):
+                declared[declaration.var_node.value] = _PASCAL_TYPES[
+                    declaration.type_node.value
+                ]
+        frame = _Frame(
+            index=len(self.all_frames),
+            name=name,
+            level=len(self.frames),
+            var_names=var_names,
+            types=[declared[var_name] for var_name in var_names],
+            nparams=len(params),
+        )
+        self.frames.append(frame)
+        self.all_frames.append(frame)
+
+        self.structs.append(f'{frame.struct} {{ {_comment(name)}')
+        if frame.level > 1:
+            self.structs.append(f'    {self.frames[-2].struct} *link;')
+        for slot, var_name in enumerate(var_names):
+            self.structs.append('    {} v{}; {}'.format(
+                _C_TYPES[frame.types[slot]], slot, _comment(var_name),
+            ))
+        self.structs.append(
+            f'    unsigned char assigned[{max(len(var_names), 1)}];'
+        )
+        self.structs.extend(['};', ''])
+        return frame
+
+    def compile_body(self, block):
+        """Compile the declarations and statements of a procedure."""
+        enclosing_lines, enclosing_ntemps = self.lines, self.ntemps
+        self.lines, self.ntemps = [], 0
+
+        for declaration in block.declarations:
+            self.visit(declaration)
+        self.visit(block.compound_statement)
+
+        body = self.lines
+        self.lines, self.ntemps = enclosing_lines, enclosing_ntemps
+        return body
+
+    def frame_prologue(self, frame):
+        return [
+            f'    {frame.struct} frame;',
+            f'    {frame.struct} *f = &frame;',
+            '    memset(&frame, 0, sizeof frame);',
+        ]
+
+    def visit_Program(self, node):
+        frame = self.enter(node.name, node.var_names, (), node.block)
+        body = self.compile_body(node.block)
+
+        lines = ['int main(void)', '{'] + self.frame_prologue(frame) + body
+        lines.append('    printf("%s\\n", {});'.format(
+            _c_string(f'1: PROGRAM {node.name}')
+        ))
+        for slot, var_name in enumerate(node.var_names):
+            lines.append(f'    if (f->assigned[{slot}]) {{')
+            lines.append('        printf("%s", {});'.format(
+                _c_string(f'   {var_name:<20}: ')
+            ))
+            if frame.types[slot] == 'int':
+                lines.append(f'        printf("%" PRId64, f->v{slot});')
+            else:
+                lines.append(f'        spi_print_real(f->v{slot});')
+            lines.extend(['        putchar(\'\\n\');', '    }'])
+        lines.extend(['    return 0;', '}', ''])
+        self.functions.extend(lines)
+        self.frames.pop()
+
+    def visit_VarDecl(self, node):
+        pass
+
+    def visit_ProcedureDecl(self, node):
+        enclosing_frame = self.frames[-1]
+        frame = self.enter(
+            node.proc_name, node.var_names, node.params, node.block_node,
+        )
+        # registered before the body is compiled for recursive calls
+        self.procedure_frames[node.proc_symbol] = frame
+
+        params = [f'{enclosing_frame.struct} *link']
+        for slot in range(frame.nparams):
+            params.append(f'{_C_TYPES[frame.types[slot]]} a{slot}')
+            params.append(f'int a{slot}_assigned')
+        signature = 'static void {}({})'.format(
+            frame.function, ', '.join(params),
+        )
+        self.prototypes.append(
+            f'{signature}; {_comment("PROCEDURE " + node.proc_name)}'
+        )
+
+        body = self.compile_body(node.block_node)
+        lines = [signature, '{'] + self.frame_prologue(frame)
+        lines.append('    f->link = link;')
+        for slot in range(frame.nparams):
+            lines.append(f'    f->v{slot} = a{slot};')
+            lines.append(f'    f->assigned[{slot}] = a{slot}_assigned;')
+        lines.extend(body)
+        lines.extend(['}', ''])
+        self.functions.extend(lines)
+        self.frames.pop()
+
+    def visit_Compound(self, node):
+        for child in node.children:
+            self.visit(child)
+
+    def visit_NoOp(self, node):
+        pass
+
+    def frame_path(self, depth):
+        """Return the C expression of the frame at the nesting level."""
+        return 'f' + '->link' * (self.frames[-1].level - depth)
+
+    def check_type(self, operand, expected, node):
+        if operand.type != expected:
+            pascal_types = {t: p for p, t in _PASCAL_TYPES.items()}
+            self.error(
+                f'{pascal_types[operand.type]} value where '
+                f'{pascal_types[expected]} is expected',
+                node,
+            )
+
+    def visit_ProcedureCall(self, node):
+        frame = self.procedure_frames[node.proc_symbol]
+        args = [self.frame_path(frame.level - 1)]
+        for slot, param_node in enumerate(node.actual_params):
+            operand = self.visit(param_node)
+            self.check_type(operand, frame.types[slot], param_node)
+            args.append(operand.value)
+            args.append(operand.assigned or '1')
+        self.emit(f'{frame.function}({", ".join(args)});')
+
+    def visit_Assign(self, node):
+        var_node = node.left
+        operand = self.visit(node.right)
+        frame = self.frames[var_node.depth]
+        self.check_type(operand, frame.types[var_node.slot], node.right)
+        path = self.frame_path(var_node.depth)
+        self.emit(f'{path}->v{var_node.slot} = {operand.value};')
+        self.emit('{}->assigned[{}] = {};'.format(
+            path, var_node.slot, operand.assigned or '1',
+        ))
+
+    def visit_Var(self, node):
+        frame = self.frames[node.depth]
+        path = self.frame_path(node.depth)
+        return _Operand(
+            frame.types[node.slot],
+            f'{path}->v{node.slot}',
+            f'{path}->assigned[{node.slot}]',
+        )
+
+    def visit_Num(self, node):
+        value = node.value
+        if isinstance(value, int):
+            if not _INT64_MIN <= value <= _INT64_MAX:
+                self.error('INTEGER constant out of 64-bit range', node)
+            return _Operand('int', _c_number(value))
+        return _Operand('float', _c_number(value))
+
+    def visit_UnaryOp(self, node):
+        operand = self.visit(node.expr)
+        symbol = '-' if node.op == TokenType.MINUS else '+'
+        if operand.assigned is not None:
+            message = f"TypeError: bad operand type for unary {symbol}: " \
+                      f"'NoneType'"
+            self.emit('if (!{}) spi_error({}, {});'.format(
+                operand.assigned, _c_string(message), self.position(node),
+            ))
+        if node.op == TokenType.PLUS:
+            return _Operand(operand.type, operand.value)
+        if operand.type == 'int':
+            value = f'spi_neg({operand.value}, {self.position(node)})'
+        else:
+            value = f'-{operand.value}'
+        return _Operand(operand.type, self.new_temp(operand.type, value))
+
+    def visit_BinOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        op = node.op
+        position = self.position(node)
+
+        if op == TokenType.FLOAT_DIV:
+            # float(left) / float(right) checks the operands in order
+            message = _c_string(
+                "TypeError: float() argument must be a string or a real "
+                "number, not 'NoneType'"
+            )
+            for operand in (left, right):
+                if operand.assigned is not None:
+                    self.emit(f'if (!{operand.assigned}) '
+                              f'spi_error({message}, {position});')
+            value = 'spi_fdiv((double){}, (double){}, {})'.format(
+                left.value, right.value, position,
+            )
+            return _Operand('float', self.new_temp('float', value))
+
+        flags = [o.assigned for o in (left, right) if o.assigned is not None]
+        if flags:
+            type_names = [
+                f'"{o.type}"' if o.assigned is None else
+                f'({o.assigned} ? "{o.type}" : "NoneType")'
+                for o in (left, right)
+            ]
+            self.emit('if (!({})) spi_operand_error("{}", {}, {});'.format(
+                ' && '.join(flags), _SYMBOLS[op], ', '.join(type_names),
+                position,
+            ))
+
+        if left.type == right.type == 'int':
+            value = f'{_INT_FUNCTIONS[op]}({left.value}, {right.value}, ' \
+                    f'{position})'
+            return _Operand('int', self.new_temp('int', value))
+
+        # one of the operands is a REAL, the other one is converted
+        left_value = f'(double){left.value}'
+        right_value = f'(double){right.value}'
+        if op == TokenType.INTEGER_DIV:
+            value = f'spi_floordiv({left_value}, {right_value}, {position})'
+        else:
+            value = f'{left_value} {_SYMBOLS[op]} {right_value}'
+        return _Operand('float', self.new_temp('float', value))
+
+
+def find_compiler():
+    """Return the path of the C compiler ($CC or cc) or None."""
+    return shutil.which(os.environ.get('CC', 'cc'))
+
+
+def build(c_source, executable):
+    """Compile the C source into an executable with the C compiler."""
+    compiler = find_compiler()
+    if compiler is None:
+        raise CBackendError(message='no C compiler found (set CC)')
+    with tempfile.TemporaryDirectory() as directory:
+        c_path = os.path.join(directory, 'program.c')
+        with open(c_path, 'w') as f:
+            f.write(c_source)
+        result = subprocess.run(
+            [compiler] + CFLAGS + ['-o', executable, c_path, '-lm'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+    if result.returncode != 0:
+        raise CBackendError(
+            message=f'{compiler} failed:\n{result.stdout.rstrip()}'
+        )
+
+
+def run_native(c_source, **kwargs):
+    """Build the C source and run it.
+
+    The keyword arguments are passed to subprocess.run. Returns the
+    CompletedProcess of the run.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        executable = os.path.join(directory, 'program')
+        build(c_source, executable)
+        return subprocess.run([executable], **kwargs)
@@ -0,0 +1,272 @@
+###############################################################################
+#  Closure compilation engine.                                                #
+#                                                                             #
+#  ClosureCompiler turns an analyzed AST into nested Python closures once:    #
+#  the operator of every BinOp and UnaryOp is chosen at compile time and      #
+#  every variable access goes straight to its (depth, slot) address. Running  #
+#  the program then only calls closures, without dispatching on node types    #
+#  or operators:                                                              #
+#                                                                             #
+#      >>> ClosureInterpreter(tree).interpret()                               #
+#                                                                             #
+#  Every closure takes the display of the call stack (see CallStack) as its   #
+#  only argument, so a compiled program can be run any number of times.       #
+#  Procedure calls push pooled activation records (see FramePool) on the      #
+#  call stack of the ClosureInterpreter, like Interpreter does.               #
+#                                                                             #
+###############################################################################
+import gc
+
+import spi
+from spi import (
+    ActivationRecord,
+    ARType,
+    CallStack,
+    FramePool,
+    NodeVisitor,
+    Num,
+    TokenType,
+)
+from typecheck import is_float
+
+
+class ClosureCompiler(NodeVisitor):
+    """Compile statements and expressions into closures.
+
+    visit(node) returns a function of the display; for an expression
+    it returns the value of the expression, for a statement it
+    executes the statement. Statements without run-time effect
+    compile to None.
+    """
+    def __init__(self, interpreter):
+        # the ClosureInterpreter that runs the code, procedure calls
+        # use its call stack and frame pool
+        self.interpreter = interpreter
+        # the compiled bodies of the procedures by ProcedureSymbol
+        self.procedures = {}
+
+    def compile(self, node, manage_gc=True):
+        # Compiling allocates a lot of closures and cells that never
+        # form reference cycles, but their number triggers full
+        # collections that traverse the whole (large) AST over and
+        # over again. Suspend the garbage collector meanwhile, unless
+        # manage_gc is false: the collector state is process-wide, so
+        # compilations on other threads must leave it alone.
+        if not manage_gc:
+            return self.visit(node)
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.visit(node)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def visit_Block(self, node):
+        for declaration in node.declarations:
+            self.visit(declaration)
+        return self.visit(node.compound_statement)
+
+    def visit_VarDecl(self, node):
+        return None
+
+    def visit_ProcedureDecl(self, node):
+        body = self.visit(node.block_node)
+        self.procedures[node.proc_symbol] = body or _empty_body
+        return None
+
+    def visit_Compound(self, node):
+        statements = tuple(
+            statement
+            for statement in map(self.visit, node.children)
+            if statement is not None
+        )
+        if len(statements) == 1:
+            return statements[0]
+
+        def compound(display):
+            for statement in statements:
+                statement(display)
+        return compound
+
+    def visit_NoOp(self, node):
+        return None
+
+    def visit_ProcedureCall(self, node):
+        proc_symbol = node.proc_symbol
+        params = tuple(
+            (param_symbol.slot, self.visit(param_node))
+            for param_symbol, param_node in zip(
+                proc_symbol.params, node.actual_params
+            )
+        )
+        # the body of a recursive procedure is compiled after its calls
+        procedures = self.procedures
+        interpreter = self.interpreter
+        frame_pool = interpreter.frame_pool
+
+        def call(display):
+            ar = frame_pool.acquire(proc_symbol)
+            slots = ar.slots
+            for slot, arg in params:
+                slots[slot] = arg(display)
+
+            call_stack = interpreter.call_stack
+            if spi._SHOULD_LOG_STACK:
+                interpreter.log(f'ENTER: PROCEDURE {proc_symbol.name}')
+            call_stack.push(ar)
+            if spi._SHOULD_LOG_STACK:
+                interpreter.log(str(call_stack))
+
+            procedures[proc_symbol](display)
+
+            if spi._SHOULD_LOG_STACK:
+                interpreter.log(f'LEAVE: PROCEDURE {proc_symbol.name}')
+                interpreter.log(str(call_stack))
+            call_stack.pop()
+            frame_pool.release(proc_symbol, ar)
+        return call
+
+    def visit_Assign(self, node):
+        depth, slot = node.left.depth, node.left.slot
+        expr = self.visit(node.right)
+
+        def assign(display):
+            display[depth].slots[slot] = expr(display)
+        return assign
+
+    def visit_Var(self, node):
+        depth, slot = node.depth, node.slot
+
+        def var(display):
+            return display[depth].slots[slot]
+        return var
+
+    def visit_Num(self, node):
+        value = node.value
+
+        def num(display):
+            return value
+        return num
+
+    def visit_UnaryOp(self, node):
+        expr = self.visit(node.expr)
+        if node.op == TokenType.PLUS:
+            def unary_plus(display):
+                return +expr(display)
+            return unary_plus
+        elif node.op == TokenType.MINUS:
+            def unary_minus(display):
+                return -expr(display)
+            return unary_minus
+
+    def visit_BinOp(self, node):
+        op = node.op
+        if (isinstance(node.right, Num) and
+                op != TokenType.FLOAT_DIV):
+            # the most common case: an operation with a constant
+            return self._const_binop(op, self.visit(node.left),
+                                     node.right.value)
+
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if op == TokenType.PLUS:
+            def add(display):
+                return left(display) + right(display)
+            return add
+        elif op == TokenType.MINUS:
+            def sub(display):
+                return left(display) - right(display)
+            return sub
+        elif op == TokenType.MUL:
+            def mul(display):
+                return left(display) * right(display)
+            return mul
+        elif op == TokenType.INTEGER_DIV:
+            def integer_div(display):
+                return left(display) // right(display)
+            return integer_div
+        elif op == TokenType.FLOAT_DIV:
+            return self._float_div(node, left, right)
+
+    def _float_div(self, node, left, right):
+        # only operands that may be an int (or None) need the
+        # conversion, which also fails on None like Interpreter does
+        left_float = is_float(node.left)
+        right_float = is_float(node.right)
+        if left_float and right_float:
+            def float_div_floats(display):
+                return left(display) / right(display)
+            return float_div_floats
+        elif left_float:
+            def float_div_by_float(display):
+                return left(display) / float(right(display))
+            return float_div_by_float
+        elif right_float:
+            def float_div_float(display):
+                return float(left(display)) / right(display)
+            return float_div_float
+        def float_div(display):
+            return float(left(display)) / float(right(display))
+        return float_div
+
+    def _const_binop(self, op, left, value):
+        if op == TokenType.PLUS:
+            def add_const(display):
+                return left(display) + value
+            return add_const
+        elif op == TokenType.MINUS:
+            def sub_const(display):
+                return left(display) - value
+            return sub_const
+        elif op == TokenType.MUL:
+            def mul_const(display):
+                return left(display) * value
+            return mul_const
+        elif op == TokenType.INTEGER_DIV:
+            def integer_div_const(display):
+                return left(display) // value
+            return integer_div_const
+
+
+def _empty_body(display):
+    pass
+
+
+class ClosureInterpreter:
+    """Runs a program compiled by ClosureCompiler.
+
+    It is a drop-in replacement of Interpreter: the program gets the
+    same activation record and the same --stack log.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+        self.call_stack = CallStack()
+        self.frame_pool = FramePool()
+        # the compiled body of the program
+        self.code = ClosureCompiler(self).compile(tree.block)
+
+    def log(self, msg):
+        if spi._SHOULD_LOG_STACK:
+            print(msg)
+
+    def interpret(self):
+        program_name = self.tree.name
+        self.log(f'ENTER: PROGRAM {program_name}')
+
+        ar = ActivationRecord(
+            name=program_name,
+            type=ARType.PROGRAM,
+            nesting_level=1,
+            names=self.tree.var_names,
+        )
+        self.call_stack.push(ar)
+
+        self.log(str(self.call_stack))
+
+        self.code(self.call_stack.display)
+
+        self.log(f'LEAVE: PROGRAM {program_name}')
+        self.log(str(self.call_stack))
+
+        self.call_stack.pop()
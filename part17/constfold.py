@@ -0,0 +1,188 @@
+###############################################################################
+#  Constant folding and algebraic simplification.                             #
+#                                                                             #
+#  ConstantFolder rewrites the expressions of an analyzed AST in place,       #
+#  between SemanticAnalyzer and the execution engines:                        #
+#                                                                             #
+#      >>> folder = ConstantFolder()                                          #
+#      >>> folder.visit(tree)                                                 #
+#      >>> folder.eliminated    # number of nodes removed from the tree       #
+#                                                                             #
+#  Every rewrite keeps the behavior of the interpreter, errors included. An   #
+#  operation on constants is computed by the Interpreter itself, unless it    #
+#  fails (e.g. 1 DIV 0) and must fail at run time. A variable may hold an     #
+#  INTEGER or a REAL value or be unassigned (None, which makes arithmetic     #
+#  fail), so the identities are only applied to operands that are the        #
+#  result of an operation and can't be None:                                  #
+#                                                                             #
+#      e * 1  ->  e        1 * e  ->  e        e - 0  ->  e                   #
+#                                                                             #
+#  x + 0 is not simplified, -0.0 + 0 is 0.0, and neither is 0 * x, which is   #
+#  NaN for an infinite x and fails when x fails.                              #
+#                                                                             #
+###############################################################################
+from spi import (
+    UNARY_OPERATIONS,
+    BinOp,
+    Interpreter,
+    Num,
+    NodeVisitor,
+    Token,
+    TokenType,
+    UnaryOp,
+)
+
+
+def _count_nodes(node):
+    if isinstance(node, BinOp):
+        return 1 + _count_nodes(node.left) + _count_nodes(node.right)
+    if isinstance(node, UnaryOp):
+        return 1 + _count_nodes(node.expr)
+    return 1
+
+
+def _is_const(node, value=None):
+    if not isinstance(node, Num):
+        return False
+    # 1.0 is not the identity: 2 * 1.0 is a REAL
+    return value is None or (
+        type(node.value) is type(value) and node.value == value
+    )
+
+
+def _is_operation(node):
+    return isinstance(node, (BinOp, UnaryOp))
+
+
+def _set_op(node, op):
+    """Change the operator of a UnaryOp node."""
+    node.op = op
+    node.operation = UNARY_OPERATIONS[op]
+
+
+class ConstantFolder(NodeVisitor):
+    """Folds constant expressions of an analyzed AST in place.
+
+    visit(node) returns the node that replaces the visited expression;
+    statements are rewritten in place.
+    """
+    def __init__(self):
+        # number of nodes removed from the tree
+        self.eliminated = 0
+        # evaluates operations on constants
+        self.evaluator = Interpreter(None)
+
+    def visit_Program(self, node):
+        self.visit(node.block)
+        return node
+
+    def visit_Block(self, node):
+        for declaration in node.declarations:
+            self.visit(declaration)
+        self.visit(node.compound_statement)
+        return node
+
+    def visit_VarDecl(self, node):
+        return node
+
+    def visit_ProcedureDecl(self, node):
+        self.visit(node.block_node)
+        return node
+
+    def visit_Compound(self, node):
+        for child in node.children:
+            self.visit(child)
+        return node
+
+    def visit_NoOp(self, node):
+        return node
+
+    def visit_Assign(self, node):
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_ProcedureCall(self, node):
+        node.actual_params = [
+            self.visit(param_node) for param_node in node.actual_params
+        ]
+        return node
+
+    def visit_Var(self, node):
+        return node
+
+    def visit_Num(self, node):
+        return node
+
+    def replace(self, node, replacement):
+        self.eliminated += _count_nodes(node) - _count_nodes(replacement)
+        return replacement
+
+    def fold(self, node):
+        """Return a Num of the value of the operation or None."""
+        try:
+            value = self.evaluator.visit(node)
+        except ArithmeticError:
+            return None
+        token_type = (
+            TokenType.INTEGER_CONST if isinstance(value, int)
+            else TokenType.REAL_CONST
+        )
+        token = Token(
+            token_type, value,
+            pos=node.pos, length=node.length, lines=node.lines,
+        )
+        return self.replace(node, Num(token))
+
+    def visit_UnaryOp(self, node):
+        node.expr = self.visit(node.expr)
+        if _is_const(node.expr):
+            return self.fold(node) or node
+
+        # collapse a chain of signs, e.g. - - - x
+        signs = [node.op]
+        expr = node.expr
+        while isinstance(expr, UnaryOp):
+            signs.append(expr.op)
+            expr = expr.expr
+        negative = signs.count(TokenType.MINUS) % 2 == 1
+        if _is_operation(expr):
+            # the value of an operation is a number: + e is e
+            if not negative:
+                return self.replace(node, expr)
+            _set_op(node, TokenType.MINUS)
+            node.expr = expr
+            self.eliminated += len(signs) - 1
+            return node
+        if len(signs) == 1:
+            return node
+
+        # x may be unassigned: keep the innermost sign, which fails
+        # then, and another - if the sign is wrong without it
+        innermost = signs[-1]
+        if negative == (innermost == TokenType.MINUS):
+            _set_op(node, innermost)
+            node.expr = expr
+            self.eliminated += len(signs) - 1
+        else:
+            _set_op(node, TokenType.MINUS)
+            _set_op(node.expr, innermost)
+            node.expr.expr = expr
+            self.eliminated += len(signs) - 2
+        return node
+
+    def visit_BinOp(self, node):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        left, right, op = node.left, node.right, node.op
+        if _is_const(left) and _is_const(right):
+            return self.fold(node) or node
+
+        if op == TokenType.MUL:
+            if _is_const(right, 1) and _is_operation(left):
+                return self.replace(node, left)
+            if _is_const(left, 1) and _is_operation(right):
+                return self.replace(node, right)
+        elif op == TokenType.MINUS:
+            if _is_const(right, 0) and _is_operation(left):
+                return self.replace(node, left)
+        return node
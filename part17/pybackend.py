@@ -0,0 +1,371 @@
+###############################################################################
+#  Python backend: Pascal to Python code objects.                             #
+#                                                                             #
+#  PythonCompiler translates an analyzed AST into a Python ast.Module that    #
+#  defines the program as a function. Procedures become nested functions and  #
+#  variables become their local variables, so lexical scoping is left to      #
+#  Python: a procedure that assigns a variable of an enclosing scope          #
+#  declares it nonlocal. For the program                                      #
+#                                                                             #
+#      PROGRAM Main;                                                          #
+#      VAR x : INTEGER;                                                       #
+#      PROCEDURE Alpha(a : INTEGER);                                          #
+#      BEGIN x := a * 2 END;                                                  #
+#      BEGIN Alpha(3 + 5) END.                                                #
+#                                                                             #
+#  the module is equivalent to                                                #
+#                                                                             #
+#      def p_Main():                                                          #
+#          v_x = None                                                         #
+#          def p_Alpha(v_a):                                                  #
+#              nonlocal v_x                                                   #
+#              v_x = v_a * 2                                                  #
+#          p_Alpha(3 + 5)                                                     #
+#          return (v_x,)                                                      #
+#                                                                             #
+#  Every generated node carries the line and column of its Pascal token, so  #
+#  exceptions raised by the compiled code are reported at Pascal source       #
+#  positions (see ExecutionError).                                            #
+#                                                                             #
+###############################################################################
+import ast
+import gc
+import hashlib
+import marshal
+
+import astcache
+import spi
+from spi import (
+    ActivationRecord,
+    ARType,
+    Assign,
+    CallStack,
+    Compound,
+    ExecutionError,
+    NodeVisitor,
+    Token,
+    TokenType,
+)
+from typecheck import is_float
+
+# the file name of the compiled code, which tells frames of the
+# program from those of the interpreter in tracebacks
+FILENAME = '<pascal>'
+
+_BINARY_OPERATORS = {
+    TokenType.PLUS: ast.Add,
+    TokenType.MINUS: ast.Sub,
+    TokenType.MUL: ast.Mult,
+    TokenType.INTEGER_DIV: ast.FloorDiv,
+}
+
+_UNARY_OPERATORS = {
+    TokenType.PLUS: ast.UAdd,
+    TokenType.MINUS: ast.USub,
+}
+
+
+# expression contexts carry no data and can be shared
+_LOAD = ast.Load()
+_STORE = ast.Store()
+
+
+def _var(name, ctx=_LOAD):
+    return ast.Name(id='v_' + name, ctx=ctx)
+
+
+def _procedure(name):
+    return 'p_' + name
+
+
+class PythonCompiler(NodeVisitor):
+    """Compiles an analyzed AST into a Python code object.
+
+    visit(node) returns a list of Python statements for statements
+    and declarations and a Python expression for expressions.
+    """
+    def __init__(self):
+        # nesting level of the procedure being compiled
+        self.level = 0
+
+    def compile(self, tree):
+        """Return the code object of a module defining the program.
+
+        The module defines the function PROGRAM, which runs the
+        program and returns the values of its variables by slot.
+        """
+        # like ClosureCompiler.compile, don't let the many new nodes
+        # trigger full collections over the AST
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._compile(tree)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _compile(self, tree):
+        program = self.visit(tree)
+        module = ast.Module(body=[
+            program,
+            _at_start(ast.Assign(
+                targets=[_at_start(ast.Name(id='PROGRAM', ctx=_STORE))],
+                value=_at_start(ast.Name(id=program.name, ctx=_LOAD)),
+            )),
+        ], type_ignores=[])
+        return compile(module, FILENAME, 'exec')
+
+    def locate(self, python_node, node):
+        """Give the Python node the source position of the Pascal node."""
+        lineno, column = node.lines.position(node.pos)
+        python_node.lineno = python_node.end_lineno = lineno
+        python_node.col_offset = column - 1
+        python_node.end_col_offset = column - 1 + max(node.length, 1)
+        return python_node
+
+    def function(self, name, var_names, nparams, block, nonlocals=()):
+        # the prologue and the function itself have no Pascal
+        # counterpart, they are placed at the start of the source
+        body = []
+        if nonlocals:
+            body.append(_at_start(
+                ast.Nonlocal(names=['v_' + n for n in nonlocals])
+            ))
+        # unassigned variables hold None, like in activation records
+        for var_name in var_names[nparams:]:
+            body.append(_at_start(ast.Assign(
+                targets=[_at_start(_var(var_name, _STORE))],
+                value=_at_start(ast.Constant(value=None)),
+            )))
+        for declaration in block.declarations:
+            body.extend(self.visit(declaration))
+        body.extend(self.visit(block.compound_statement))
+        return _at_start(ast.FunctionDef(
+            name=_procedure(name),
+            args=ast.arguments(
+                posonlyargs=[],
+                args=[
+                    _at_start(ast.arg(arg='v_' + n))
+                    for n in var_names[:nparams]
+                ],
+                kwonlyargs=[],
+                kw_defaults=[],
+                defaults=[],
+            ),
+            body=body,
+            decorator_list=[],
+        ))
+
+    def visit_Program(self, node):
+        self.level = 1
+        function = self.function(node.name, node.var_names, 0, node.block)
+        function.body.append(_at_start(ast.Return(value=_at_start(ast.Tuple(
+            elts=[_at_start(_var(var_name)) for var_name in node.var_names],
+            ctx=_LOAD,
+        )))))
+        return function
+
+    def visit_VarDecl(self, node):
+        return []
+
+    def visit_ProcedureDecl(self, node):
+        self.level += 1
+        nonlocals = sorted({
+            var_node.value
+            for var_node in _assigned_vars(node.block_node.compound_statement)
+            if var_node.depth < self.level
+        })
+        function = self.function(
+            node.proc_name,
+            node.var_names,
+            len(node.params),
+            node.block_node,
+            nonlocals,
+        )
+        self.level -= 1
+        return [function]
+
+    def visit_Compound(self, node):
+        statements = []
+        for child in node.children:
+            statements.extend(self.visit(child))
+        return statements or [_at_start(ast.Pass())]
+
+    def visit_NoOp(self, node):
+        return []
+
+    def visit_ProcedureCall(self, node):
+        args = [self.visit(param) for param in node.actual_params]
+        call = ast.Call(
+            func=self.locate(
+                ast.Name(id=_procedure(node.proc_name), ctx=_LOAD), node,
+            ),
+            args=args,
+            keywords=[],
+        )
+        return [self.locate(ast.Expr(value=self.locate(call, node)), node)]
+
+    def visit_Assign(self, node):
+        target = self.locate(_var(node.left.value, _STORE), node.left)
+        assign = ast.Assign(targets=[target], value=self.visit(node.right))
+        return [self.locate(assign, node)]
+
+    def visit_Var(self, node):
+        return self.locate(_var(node.value), node)
+
+    def visit_Num(self, node):
+        return self.locate(ast.Constant(value=node.value), node)
+
+    def visit_UnaryOp(self, node):
+        return self.locate(ast.UnaryOp(
+            op=_UNARY_OPERATORS[node.op](),
+            operand=self.visit(node.expr),
+        ), node)
+
+    def visit_BinOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if node.op == TokenType.FLOAT_DIV:
+            # only operands that may be an int (or None) need the
+            # conversion, which also fails on None like Interpreter does
+            left, right = [
+                operand if is_float(operand_node) else self.locate(ast.Call(
+                    func=self.locate(ast.Name(id='float', ctx=_LOAD), node),
+                    args=[operand],
+                    keywords=[],
+                ), node)
+                for operand, operand_node in (
+                    (left, node.left), (right, node.right),
+                )
+            ]
+            op = ast.Div()
+        else:
+            op = _BINARY_OPERATORS[node.op]()
+        return self.locate(ast.BinOp(left=left, op=op, right=right), node)
+
+
+def _at_start(python_node):
+    python_node.lineno = python_node.end_lineno = 1
+    python_node.col_offset = python_node.end_col_offset = 0
+    return python_node
+
+
+def _assigned_vars(node):
+    """Yield the Var nodes assigned in a compound statement."""
+    for child in node.children:
+        if isinstance(child, Assign):
+            yield child.left
+        elif isinstance(child, Compound):
+            yield from _assigned_vars(child)
+
+
+def _file_version(path):
+    """Return a digest of the contents of a source file."""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def _backend_version():
+    return f'{astcache.INTERPRETER_VERSION}-{_file_version(__file__)}'
+
+
+class CodeCache(astcache.ASTCache):
+    """On-disk cache of the code objects compiled by PythonCompiler.
+
+    Entries are keyed by the source text like those of ASTCache and
+    can share its directory. `passes` are the modules of the passes
+    run over the AST before it is compiled, e.g. constfold: code
+    compiled after other passes, or other versions of them, is kept
+    apart.
+    """
+    SUFFIX = '.pyc'
+    MAGIC = b'SPIPYC1\n'
+    version = _backend_version()
+
+    def __init__(self, directory, max_size=astcache.DEFAULT_MAX_SIZE,
+                 passes=()):
+        super().__init__(directory, max_size)
+        self.version = '-'.join([self.version] + [
+            f'{module.__name__}:{_file_version(module.__file__)}'
+            for module in passes
+        ])
+
+    def dumps(self, code):
+        return marshal.dumps(code)
+
+    def loads(self, payload):
+        return marshal.loads(payload)
+
+
+class PythonInterpreter:
+    """Runs a program compiled by PythonCompiler.
+
+    It is a drop-in replacement of Interpreter for the program: the
+    program gets the same activation record and the same --stack log.
+    Procedures run in Python frames without activation records.
+    """
+    def __init__(self, tree, code=None):
+        self.tree = tree
+        self.call_stack = CallStack()
+        if code is None:
+            code = PythonCompiler().compile(tree)
+        self.code = code
+        namespace = {}
+        exec(code, namespace)
+        self.program = namespace['PROGRAM']
+
+    def log(self, msg):
+        if spi._SHOULD_LOG_STACK:
+            print(msg)
+
+    def interpret(self):
+        program_name = self.tree.name
+        self.log(f'ENTER: PROGRAM {program_name}')
+
+        ar = ActivationRecord(
+            name=program_name,
+            type=ARType.PROGRAM,
+            nesting_level=1,
+            names=self.tree.var_names,
+        )
+        self.call_stack.push(ar)
+
+        self.log(str(self.call_stack))
+
+        try:
+            ar.slots[:] = self.program()
+        except Exception as e:
+            raise _execution_error(e) from e
+
+        self.log(f'LEAVE: PROGRAM {program_name}')
+        self.log(str(self.call_stack))
+
+        self.call_stack.pop()
+
+
+def _execution_error(exception):
+    """Return an ExecutionError at the Pascal position of the exception."""
+    lineno = column = None
+    tb = exception.__traceback__
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        if code.co_filename == FILENAME:
+            # the innermost frame of the program wins
+            if hasattr(code, 'co_positions'):
+                positions = list(code.co_positions())[tb.tb_lasti // 2]
+                lineno, column = positions[0], positions[2]
+            else:
+                # before Python 3.11 code objects only map lines
+                lineno, column = tb.tb_lineno, None
+        tb = tb.tb_next
+
+    token = None
+    message = f'{exception.__class__.__name__}: {exception}'
+    if lineno is not None:
+        if column is not None:
+            column += 1
+        token = Token(type=None, value=None, lineno=lineno, column=column)
+        message += f' -> line: {lineno}'
+        if column is not None:
+            message += f' column: {column}'
+    return ExecutionError(token=token, message=message)
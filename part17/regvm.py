@@ -0,0 +1,592 @@
+###############################################################################
+#  Register IR, optimizer and register VM.                                    #
+#                                                                             #
+#  The bytecode of vm.py is lowered into a three-address IR in which every    #
+#  instruction names its operands and its destination, e.g.                   #
+#                                                                             #
+#      t0 = y                                                                 #
+#      t1 = 3                                                                 #
+#      t2 = add t0, t1                                                        #
+#      x = t2                                                                 #
+#                                                                             #
+#  The optimizer passes (see PASSES) fold constants, drop redundant loads     #
+#  and stores and merge an operation with the store of its result into a      #
+#  single instruction, so the statement above becomes `x = add y, 3`. The     #
+#  optimized IR is assembled into code for RegisterVM, where variables,       #
+#  temporaries and constants are all registers of the frame:                  #
+#                                                                             #
+#      >>> procedures = optimize(lower(BytecodeCompiler().compile(tree)))     #
+#      >>> RegisterVM(assemble(procedures)).run()                             #
+#                                                                             #
+###############################################################################
+import collections
+
+import spi
+from spi import ActivationRecord, ARType, CallStack
+import vm
+
+# Operands are tagged tuples:
+#   ('var', slot)    - a variable of the current frame
+#   ('tmp', number)  - a temporary
+#   ('const', value) - a constant
+
+ARITHMETIC_OPS = ('add', 'sub', 'mul', 'div', 'fdiv', 'neg', 'pos')
+
+_BINARY_OPS = {
+    vm.ADD: 'add',
+    vm.SUB: 'sub',
+    vm.MUL: 'mul',
+    vm.INTEGER_DIV: 'div',
+    vm.FLOAT_DIV: 'fdiv',
+}
+
+
+class Instr:
+    """An IR instruction: dst = op args.
+
+    `target` is the (depth, slot) address of loadvar and storevar and
+    the index of the called procedure of call.
+    """
+    __slots__ = ('op', 'dst', 'args', 'target')
+
+    def __init__(self, op, dst=None, args=(), target=None):
+        self.op = op
+        self.dst = dst
+        self.args = args
+        self.target = target
+
+
+class IRProcedure:
+    def __init__(self, procedure, instrs):
+        # the vm.Procedure the IR was lowered from
+        self.procedure = procedure
+        self.instrs = instrs
+
+
+###############################################################################
+#                                                                             #
+#  LOWERING                                                                   #
+#                                                                             #
+###############################################################################
+
+def lower(bytecode):
+    """Translate Bytecode into a list of IRProcedures.
+
+    Every stack slot becomes a new temporary, so every bytecode
+    instruction (but CALL) becomes one IR instruction.
+    """
+    return [
+        IRProcedure(procedure, _lower_procedure(bytecode, procedure))
+        for procedure in bytecode.procedures
+    ]
+
+
+def _lower_procedure(bytecode, procedure):
+    code = bytecode.code
+    instrs = []
+    stack = []
+    ntemps = 0
+
+    def new_temp():
+        nonlocal ntemps
+        ntemps += 1
+        return ('tmp', ntemps - 1)
+
+    pc = procedure.entry
+    while True:
+        op, arg = code[pc], code[pc + 1]
+        pc += 2
+        if op == vm.LOAD_CONST:
+            dst = new_temp()
+            instrs.append(Instr('mov', dst, (('const', bytecode.consts[arg]),)))
+            stack.append(dst)
+        elif op == vm.LOAD_LOCAL:
+            dst = new_temp()
+            instrs.append(Instr('mov', dst, (('var', arg),)))
+            stack.append(dst)
+        elif op == vm.STORE_LOCAL:
+            instrs.append(Instr('mov', ('var', arg), (stack.pop(),)))
+        elif op == vm.LOAD_VAR:
+            dst = new_temp()
+            instrs.append(
+                Instr('loadvar', dst, target=vm._split_address(arg))
+            )
+            stack.append(dst)
+        elif op == vm.STORE_VAR:
+            instrs.append(Instr(
+                'storevar', args=(stack.pop(),), target=vm._split_address(arg),
+            ))
+        elif op in _BINARY_OPS:
+            right = stack.pop()
+            left = stack.pop()
+            dst = new_temp()
+            instrs.append(Instr(_BINARY_OPS[op], dst, (left, right)))
+            stack.append(dst)
+        elif op == vm.NEG:
+            dst = new_temp()
+            instrs.append(Instr('neg', dst, (stack.pop(),)))
+            stack.append(dst)
+        elif op == vm.POS:
+            dst = new_temp()
+            instrs.append(Instr('pos', dst, (stack.pop(),)))
+            stack.append(dst)
+        elif op == vm.CALL:
+            nparams = bytecode.procedures[arg].nparams
+            args = tuple(stack[len(stack) - nparams:])
+            del stack[len(stack) - nparams:]
+            instrs.append(Instr('call', args=args, target=arg))
+        elif op == vm.RETURN:
+            instrs.append(Instr('return'))
+            return instrs
+        elif op == vm.HALT:
+            instrs.append(Instr('halt'))
+            return instrs
+
+
+###############################################################################
+#                                                                             #
+#  OPTIMIZER                                                                  #
+#                                                                             #
+#  There are no jumps in the language, so the body of every procedure is     #
+#  a single basic block; only calls, which may read and write variables of   #
+#  the enclosing scopes, limit what the passes may assume.                    #
+#                                                                             #
+###############################################################################
+
+def _evaluate(op, args):
+    """Return the value of an arithmetic op with constant arguments.
+
+    Returns None if the operation fails at run time (e.g. division
+    by zero), so that it is left to fail when the program runs.
+    """
+    values = [value for _, value in args]
+    try:
+        if op == 'add':
+            return values[0] + values[1]
+        elif op == 'sub':
+            return values[0] - values[1]
+        elif op == 'mul':
+            return values[0] * values[1]
+        elif op == 'div':
+            return values[0] // values[1]
+        elif op == 'fdiv':
+            return float(values[0]) / float(values[1])
+        elif op == 'neg':
+            return -values[0]
+        elif op == 'pos':
+            return +values[0]
+    except (ArithmeticError, TypeError):
+        return None
+
+
+def fold_constants(instrs):
+    """Compute operations with constant arguments at compile time."""
+    # temporaries known to hold a constant
+    known = {}
+    for instr in instrs:
+        instr.args = tuple(known.get(arg, arg) for arg in instr.args)
+        if instr.op in ARITHMETIC_OPS and all(
+            arg[0] == 'const' for arg in instr.args
+        ):
+            value = _evaluate(instr.op, instr.args)
+            if value is not None:
+                instr.op = 'mov'
+                instr.args = (('const', value),)
+        if (instr.op == 'mov' and instr.dst[0] == 'tmp' and
+                instr.args[0][0] == 'const'):
+            known[instr.dst] = instr.args[0]
+    return instrs
+
+
+def propagate_copies(instrs):
+    """Use the sources of copies and loads instead of their temporaries.
+
+    Drops redundant loads: a temporary that copies a variable is
+    replaced by the variable itself, and a non-local variable loaded
+    (or stored) before is not loaded again until it may have changed.
+    """
+    # temporary -> operand with the same value
+    copies = {}
+    # (depth, slot) address -> operand with the value of the variable
+    loads = {}
+    for instr in instrs:
+        instr.args = tuple(copies.get(arg, arg) for arg in instr.args)
+        op = instr.op
+        if op == 'mov' and instr.dst[0] == 'tmp':
+            copies[instr.dst] = instr.args[0]
+        elif op == 'loadvar':
+            value = loads.get(instr.target)
+            if value is None:
+                loads[instr.target] = instr.dst
+            else:
+                instr.op, instr.args, instr.target = 'mov', (value,), None
+                copies[instr.dst] = value
+        elif op == 'storevar':
+            loads[instr.target] = instr.args[0]
+        elif op == 'call':
+            # the procedure may change any variable but the temporaries
+            copies = {
+                temp: value for temp, value in copies.items()
+                if value[0] != 'var'
+            }
+            loads.clear()
+
+        if instr.dst is not None and instr.dst[0] == 'var':
+            # the copies of the old value of the variable are stale
+            copies = {
+                temp: value for temp, value in copies.items()
+                if value != instr.dst
+            }
+            loads = {
+                address: value for address, value in loads.items()
+                if value != instr.dst
+            }
+    return instrs
+
+
+def _temp_uses(instrs):
+    return collections.Counter(
+        arg for instr in instrs for arg in instr.args if arg[0] == 'tmp'
+    )
+
+
+def fuse_stores(instrs):
+    """Merge an instruction and the store of its result.
+
+    `t = add a, b; x = t` becomes the superinstruction `x = add a, b`,
+    if t is not used anywhere else.
+    """
+    uses = _temp_uses(instrs)
+    fused = []
+    for instr in instrs:
+        if (instr.op == 'mov' and instr.args[0][0] == 'tmp' and fused and
+                fused[-1].dst == instr.args[0] and uses[instr.args[0]] == 1):
+            fused[-1].dst = instr.dst
+        else:
+            fused.append(instr)
+    return fused
+
+
+def eliminate_dead_code(instrs):
+    """Drop copies and loads whose results are not used, and self-moves."""
+    while True:
+        uses = _temp_uses(instrs)
+        live = [
+            instr for instr in instrs
+            if not (
+                instr.op in ('mov', 'loadvar') and
+                (instr.dst[0] == 'tmp' and not uses[instr.dst] or
+                 instr.args == (instr.dst,))
+            )
+        ]
+        if len(live) == len(instrs):
+            return live
+        instrs = live
+
+
+def eliminate_dead_stores(instrs):
+    """Drop copies into variables that are overwritten before any read.
+
+    Only copies are dropped: an operation may fail at run time and
+    that must not go unnoticed.
+    """
+    # variables and addresses that are written later, and not read
+    # in between
+    overwritten = set()
+    live = []
+    for instr in reversed(instrs):
+        if instr.op == 'call':
+            overwritten.clear()
+        written = instr.dst if instr.op != 'storevar' else instr.target
+        if written is not None:
+            if instr.op == 'mov' and written in overwritten:
+                continue
+            overwritten.add(written)
+        overwritten.difference_update(instr.args)
+        if instr.op == 'loadvar':
+            overwritten.discard(instr.target)
+        live.append(instr)
+    live.reverse()
+    return live
+
+
+PASSES = (
+    fold_constants,
+    propagate_copies,
+    fuse_stores,
+    eliminate_dead_code,
+    eliminate_dead_stores,
+)
+
+
+def optimize(procedures, passes=PASSES, dump=None):
+    """Run the optimizer passes over every procedure.
+
+    If `dump` is given, it is called with the IR listing before the
+    first pass and after every pass.
+    """
+    if dump is not None:
+        dump(format_ir(procedures, 'before optimization'))
+    for optimizer_pass in passes:
+        for procedure in procedures:
+            procedure.instrs = optimizer_pass(procedure.instrs)
+        if dump is not None:
+            dump(format_ir(procedures, f'after {optimizer_pass.__name__}'))
+    return procedures
+
+
+def format_ir(procedures, title=None):
+    """Return a listing of the IR of the procedures."""
+    lines = []
+    if title is not None:
+        lines.extend([f'--- {title} ---', ''])
+    for ir in procedures:
+        procedure = ir.procedure
+        kind = 'PROGRAM' if procedure.level == 1 else 'PROCEDURE'
+        lines.append(f'{kind} {procedure.name} (level {procedure.level})')
+        for instr in ir.instrs:
+            lines.append('   ' + _format_instr(procedures, procedure, instr))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def _format_operand(procedure, operand):
+    kind, value = operand
+    if kind == 'var':
+        return procedure.var_names[value]
+    elif kind == 'tmp':
+        return f't{value}'
+    return repr(value)
+
+
+def _format_instr(procedures, procedure, instr):
+    args = [_format_operand(procedure, arg) for arg in instr.args]
+    if instr.op in ('loadvar', 'storevar'):
+        depth, slot = instr.target
+        owner = procedure
+        while owner.level > depth:
+            owner = owner.parent
+        args.insert(0, f'{owner.name}.{owner.var_names[slot]}')
+    text = instr.op
+    if instr.op == 'mov':
+        text = args.pop()
+    elif instr.op == 'call':
+        name = procedures[instr.target].procedure.name
+        text = f'call {name}({", ".join(args)})'
+    elif args:
+        text += ' ' + ', '.join(args)
+    if instr.dst is not None:
+        text = f'{_format_operand(procedure, instr.dst)} = {text}'
+    return text
+
+
+###############################################################################
+#                                                                             #
+#  ASSEMBLER AND REGISTER VM                                                  #
+#                                                                             #
+###############################################################################
+
+OPCODES = (
+    'HALT', 'RETURN', 'CALL', 'MOV', 'LOADVAR', 'STOREVAR',
+    'ADD', 'SUB', 'MUL', 'DIV', 'FDIV', 'NEG', 'POS',
+)
+(
+    HALT, RETURN, CALL, MOV, LOADVAR, STOREVAR,
+    ADD, SUB, MUL, DIV, FDIV, NEG, POS,
+) = range(len(OPCODES))
+
+_OPCODES = {name.lower(): opcode for opcode, name in enumerate(OPCODES)}
+
+
+class RegisterProcedure:
+    """A procedure assembled for RegisterVM.
+
+    A frame holds the variables, then the temporaries, then the
+    constants of the procedure: `registers` is the initial content of
+    the registers that follow the variables.
+    """
+    def __init__(self, procedure, entry, registers):
+        self.name = procedure.name
+        self.level = procedure.level
+        self.var_names = procedure.var_names
+        self.nparams = procedure.nparams
+        self.entry = entry
+        self.registers = registers
+
+
+class RegisterCode:
+    def __init__(self):
+        # (opcode, a, b, c) instructions
+        self.code = []
+        # procedures[0] is the program itself
+        self.procedures = []
+
+
+def assemble(procedures):
+    """Translate the IR of all procedures into RegisterCode."""
+    register_code = RegisterCode()
+    for ir in procedures:
+        procedure = ir.procedure
+        nvars = len(procedure.var_names)
+        temps = sorted({
+            operand
+            for instr in ir.instrs
+            for operand in instr.args + (instr.dst,)
+            if operand is not None and operand[0] == 'tmp'
+        })
+        consts = []
+        registers = {temp: nvars + n for n, temp in enumerate(temps)}
+        for instr in ir.instrs:
+            for kind, value in instr.args:
+                # the type is part of the key to keep e.g. 3 and 3.0 apart
+                key = ('const', value.__class__, value)
+                if kind == 'const' and key not in registers:
+                    registers[key] = nvars + len(temps) + len(consts)
+                    consts.append(value)
+
+        def register(operand):
+            kind, value = operand
+            if kind == 'var':
+                return value
+            elif kind == 'tmp':
+                return registers[operand]
+            return registers[('const', value.__class__, value)]
+
+        register_code.procedures.append(RegisterProcedure(
+            procedure,
+            entry=len(register_code.code),
+            registers=[None] * len(temps) + consts,
+        ))
+        for instr in ir.instrs:
+            op = instr.op
+            args = [register(arg) for arg in instr.args]
+            if op == 'loadvar':
+                code = (LOADVAR, register(instr.dst)) + instr.target
+            elif op == 'storevar':
+                code = (STOREVAR, args[0]) + instr.target
+            elif op == 'call':
+                code = (CALL, instr.target, tuple(args), 0)
+            elif op in ('return', 'halt'):
+                code = (_OPCODES[op], 0, 0, 0)
+            else:
+                args.extend([0] * (2 - len(args)))
+                code = (_OPCODES[op], register(instr.dst), args[0], args[1])
+            register_code.code.append(code)
+    return register_code
+
+
+def compile_program(tree, passes=PASSES, dump=None):
+    """Compile an analyzed AST into optimized RegisterCode."""
+    bytecode = vm.BytecodeCompiler().compile(tree)
+    return assemble(optimize(lower(bytecode), passes=passes, dump=dump))
+
+
+class RegisterVM:
+    def __init__(self, register_code):
+        self.register_code = register_code
+        self.call_stack = CallStack()
+        # executed instructions by opcode name, if profiling
+        self.profile = None
+
+    def log(self, msg):
+        if spi._SHOULD_LOG_STACK:
+            print(msg)
+
+    def interpret(self):
+        """Run the program, like Interpreter.interpret."""
+        self.run()
+
+    def run(self, profile=False):
+        """Run the program.
+
+        With profile=True the number of executed instructions of
+        every kind is counted in self.profile.
+        """
+        counts = [0] * len(OPCODES) if profile else None
+        log_stack = spi._SHOULD_LOG_STACK
+
+        code = self.register_code.code
+        procedures = self.register_code.procedures
+        call_stack = self.call_stack
+        display = call_stack.display
+        program = procedures[0]
+
+        self.log(f'ENTER: PROGRAM {program.name}')
+        ar = ActivationRecord(
+            name=program.name,
+            type=ARType.PROGRAM,
+            nesting_level=1,
+            names=program.var_names,
+        )
+        ar.slots.extend(program.registers)
+        call_stack.push(ar)
+        self.log(str(call_stack))
+
+        regs = ar.slots
+        # return addresses
+        returns = []
+        pc = program.entry
+        while True:
+            op, a, b, c = code[pc]
+            pc += 1
+            if counts is not None:
+                counts[op] += 1
+
+            if op == MOV:
+                regs[a] = regs[b]
+            elif op == ADD:
+                regs[a] = regs[b] + regs[c]
+            elif op == SUB:
+                regs[a] = regs[b] - regs[c]
+            elif op == MUL:
+                regs[a] = regs[b] * regs[c]
+            elif op == DIV:
+                regs[a] = regs[b] // regs[c]
+            elif op == FDIV:
+                regs[a] = float(regs[b]) / float(regs[c])
+            elif op == NEG:
+                regs[a] = -regs[b]
+            elif op == POS:
+                regs[a] = +regs[b]
+            elif op == LOADVAR:
+                regs[a] = display[b].slots[c]
+            elif op == STOREVAR:
+                display[b].slots[c] = regs[a]
+            elif op == CALL:
+                procedure = procedures[a]
+                if log_stack:
+                    self.log(f'ENTER: PROCEDURE {procedure.name}')
+                ar = ActivationRecord(
+                    name=procedure.name,
+                    type=ARType.PROCEDURE,
+                    nesting_level=procedure.level,
+                    names=procedure.var_names,
+                )
+                callee_regs = ar.slots
+                for slot, register in enumerate(b):
+                    callee_regs[slot] = regs[register]
+                callee_regs.extend(procedure.registers)
+                call_stack.push(ar)
+                if log_stack:
+                    self.log(str(call_stack))
+                returns.append(pc)
+                pc = procedure.entry
+                regs = callee_regs
+            elif op == RETURN:
+                if log_stack:
+                    self.log(f'LEAVE: PROCEDURE {call_stack.peek().name}')
+                    self.log(str(call_stack))
+                call_stack.pop()
+                pc = returns.pop()
+                regs = call_stack.peek().slots
+            elif op == HALT:
+                break
+
+        self.log(f'LEAVE: PROGRAM {program.name}')
+        self.log(str(call_stack))
+        call_stack.pop()
+
+        if counts is not None:
+            self.profile = collections.Counter({
+                OPCODES[op]: count for op, count in enumerate(counts) if count
+            })
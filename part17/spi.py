@@ -1,17 +1,32 @@
 """SPI - Simple Pascal Interpreter. Part 17."""
 
+import abc
 import argparse
+import bisect
+import collections
+import mmap
+import operator
+import os
+import re
 import sys
+from array import array
 from enum import Enum
 
 _SHOULD_LOG_SCOPE = False  # see '--scope' command line option
 _SHOULD_LOG_STACK = False  # see '--stack' command line option
+# source files of at least that many bytes are memory-mapped
+# instead of read into a string, see '--mmap-threshold' option
+_MMAP_THRESHOLD = 8 * 1024 * 1024
 
 
 class ErrorCode(Enum):
     UNEXPECTED_TOKEN = 'Unexpected token'
     ID_NOT_FOUND     = 'Identifier not found'
     DUPLICATE_ID     = 'Duplicate id found'
+    UNTERMINATED_COMMENT = 'Unterminated comment'
+    TYPE_MISMATCH    = 'Type mismatch'
+    CALL_DEPTH_EXCEEDED = 'Maximum call depth exceeded'
+    WRONG_PARAMS_NUM = 'Wrong number of arguments'
 
 
 class Error(Exception):
@@ -34,6 +49,10 @@ class SemanticError(Error):
     pass
 
 
+class ExecutionError(Error):
+    pass
+
+
 ###############################################################################
 #                                                                             #
 #  LEXER                                                                      #
@@ -70,12 +89,76 @@ class TokenType(Enum):
     EOF           = 'EOF'
 
 
+class LineIndex:
+    """Maps offsets into the source text to line and column numbers.
+
+    Line and column numbers are only needed to report errors, so
+    the offsets of the line starts are collected the first time a
+    position is requested and then binary searched.
+
+    The text can be a string or any bytes-like object, e.g. a
+    memory-mapped file.
+    """
+    def __init__(self, text):
+        self.text = text
+        self._line_starts = None
+
+    def __getstate__(self):
+        # a memory-mapped text can't be pickled, store a copy of its bytes
+        state = self.__dict__.copy()
+        if not isinstance(self.text, (str, bytes)):
+            state['text'] = bytes(self.text)
+        return state
+
+    def _build_line_starts(self):
+        newline = re.compile('\n' if isinstance(self.text, str) else b'\n')
+        line_starts = [0]
+        line_starts.extend(match.end() for match in newline.finditer(self.text))
+        return line_starts
+
+    def position(self, offset):
+        """Return the (lineno, column) pair of the given offset.
+
+        Both line and column numbers start at 1.
+        """
+        if self._line_starts is None:
+            self._line_starts = self._build_line_starts()
+        lineno = bisect.bisect_right(self._line_starts, offset)
+        column = offset - self._line_starts[lineno - 1] + 1
+        return lineno, column
+
+
 class Token:
-    def __init__(self, type, value, lineno=None, column=None):
+    __slots__ = (
+        'type', 'value', 'pos', 'length', 'lines', '_lineno', '_column',
+    )
+
+    def __init__(self, type, value, lineno=None, column=None,
+                 pos=None, length=0, lines=None):
         self.type = type
         self.value = value
-        self.lineno = lineno
-        self.column = column
+        # start offset and length of the lexeme in the source text
+        self.pos = pos
+        self.length = length
+        # LineIndex shared by all tokens of the source text, used to
+        # compute line and column numbers lazily from the offset
+        self.lines = lines
+        self._lineno = lineno
+        self._column = column
+
+    def _resolve_position(self):
+        if self._lineno is None and self.lines is not None:
+            self._lineno, self._column = self.lines.position(self.pos)
+
+    @property
+    def lineno(self):
+        self._resolve_position()
+        return self._lineno
+
+    @property
+    def column(self):
+        self._resolve_position()
+        return self._column
 
     def __str__(self):
         """String representation of the class instance.
@@ -126,6 +209,9 @@ def _build_reserved_keywords():
 
 RESERVED_KEYWORDS = _build_reserved_keywords()
 
+# a run of whitespace characters, skipped by the lexer in one step
+_WHITESPACE = re.compile(r'\s*')
+
 
 class Lexer:
     def __init__(self, text):
@@ -134,30 +220,34 @@ class Lexer:
         # self.pos is an index into self.text
         self.pos = 0
         self.current_char = self.text[self.pos]
-        # token line number and column number
-        self.lineno = 1
-        self.column = 1
+        # line numbers and column numbers are computed on demand
+        self.lines = LineIndex(text)
+
+    @property
+    def lineno(self):
+        return self.lines.position(self.pos)[0]
 
-    def error(self):
+    @property
+    def column(self):
+        return self.lines.position(self.pos)[1]
+
+    def error(self, error_code=None):
         s = "Lexer error on '{lexeme}' line: {lineno} column: {column}".format(
             lexeme=self.current_char,
             lineno=self.lineno,
             column=self.column,
         )
-        raise LexerError(message=s)
+        if error_code is not None:
+            s = f'{s} ({error_code.value})'
+        raise LexerError(error_code=error_code, message=s)
 
     def advance(self):
         """Advance the `pos` pointer and set the `current_char` variable."""
-        if self.current_char == '\n':
-            self.lineno += 1
-            self.column = 0
-
         self.pos += 1
         if self.pos > len(self.text) - 1:
             self.current_char = None  # Indicates end of input
         else:
             self.current_char = self.text[self.pos]
-            self.column += 1
 
     def peek(self):
         peek_pos = self.pos + 1
@@ -166,20 +256,26 @@ class Lexer:
         else:
             return self.text[peek_pos]
 
+    def _seek(self, pos):
+        """Move the `pos` pointer and set the `current_char` variable."""
+        self.pos = pos
+        self.current_char = self.text[pos] if pos < len(self.text) else None
+
     def skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self.advance()
+        self._seek(_WHITESPACE.match(self.text, self.pos).end())
 
     def skip_comment(self):
-        while self.current_char != '}':
-            self.advance()
-        self.advance()  # the closing curly brace
+        # the closing curly brace of the comment starting at self.pos
+        end = self.text.find('}', self.pos + 1)
+        if end == -1:
+            self.error(error_code=ErrorCode.UNTERMINATED_COMMENT)
+        self._seek(end + 1)
 
     def number(self):
         """Return a (multidigit) integer or float consumed from the input."""
 
-        # Create a new token with current line and column number
-        token = Token(type=None, value=None, lineno=self.lineno, column=self.column)
+        # Create a new token starting at the current position
+        token = Token(type=None, value=None, pos=self.pos, lines=self.lines)
 
         result = ''
         while self.current_char is not None and self.current_char.isdigit():
@@ -200,13 +296,14 @@ class Lexer:
             token.type = TokenType.INTEGER_CONST
             token.value = int(result)
 
+        token.length = self.pos - token.pos
         return token
 
     def _id(self):
         """Handle identifiers and reserved keywords"""
 
-        # Create a new token with current line and column number
-        token = Token(type=None, value=None, lineno=self.lineno, column=self.column)
+        # Create a new token starting at the current position
+        token = Token(type=None, value=None, pos=self.pos, lines=self.lines)
 
         value = ''
         while self.current_char is not None and self.current_char.isalnum():
@@ -222,6 +319,7 @@ class Lexer:
             token.type = token_type
             token.value = value.upper()
 
+        token.length = self.pos - token.pos
         return token
 
     def get_next_token(self):
@@ -236,7 +334,6 @@ class Lexer:
                 continue
 
             if self.current_char == '{':
-                self.advance()
                 self.skip_comment()
                 continue
 
@@ -250,8 +347,9 @@ class Lexer:
                 token = Token(
                     type=TokenType.ASSIGN,
                     value=TokenType.ASSIGN.value,  # ':='
-                    lineno=self.lineno,
-                    column=self.column,
+                    pos=self.pos,
+                    length=2,
+                    lines=self.lines,
                 )
                 self.advance()
                 self.advance()
@@ -270,8 +368,9 @@ class Lexer:
                 token = Token(
                     type=token_type,
                     value=token_type.value,  # e.g. ';', '.', etc
-                    lineno=self.lineno,
-                    column=self.column,
+                    pos=self.pos,
+                    length=1,
+                    lines=self.lines,
                 )
                 self.advance()
                 return token
@@ -281,111 +380,580 @@ class Lexer:
         return Token(type=TokenType.EOF, value=None)
 
 
+# Operator and punctuation lexemes, e.g. {';': <TokenType.SEMI: ';'>, ...}
+SYMBOL_TOKENS = {
+    token_type.value: token_type
+    for token_type in TokenType
+    if len(token_type.value) == 1 or token_type is TokenType.ASSIGN
+}
+
+
+class RegexLexer(Lexer):
+    """Table-driven lexer that recognizes a whole lexeme in one step.
+
+    Instead of walking the input one character at a time it matches
+    a compiled master regular expression at the current position and
+    slices the lexeme out of the text. Whitespace and comments are
+    skipped as whole spans.
+
+    The token stream is the same as the one produced by Lexer,
+    so the two are interchangeable.
+    """
+    _TOKEN = re.compile(
+        r"""
+        (?:\s+|\{[^}]*\})*      # whitespace and comments before the token
+        (?:
+          (?P<ID>[^\W\d_][^\W_]*)
+        | (?P<REAL_CONST>\d+\.\d*)
+        | (?P<INTEGER_CONST>\d+)
+        | (?P<SYMBOL>:=|[%s])
+        )?
+        """ % re.escape(''.join(
+            lexeme for lexeme in SYMBOL_TOKENS if len(lexeme) == 1
+        )),
+        re.VERBOSE,
+    )
+
+    def get_next_token(self):
+        """Lexical analyzer (also known as scanner or tokenizer)
+
+        Same contract as Lexer.get_next_token, but every call
+        consumes whitespace, comments and a whole lexeme with
+        a single regex match.
+        """
+        match = self._TOKEN.match(self.text, self.pos)
+        kind = match.lastgroup
+        if kind is None:
+            # nothing but whitespace and comments left or an invalid character
+            self._seek(match.end())
+            if self.current_char is None:
+                return Token(type=TokenType.EOF, value=None)
+            if self.current_char == '{':
+                self.error(error_code=ErrorCode.UNTERMINATED_COMMENT)
+            self.error()
+
+        start, end = match.span(kind)
+        self._seek(end)
+        return self._make_token(kind, match.group(kind), start, end)
+
+    def _make_token(self, kind, lexeme, start, end):
+        """Create a token out of a lexeme matched by the `kind` group."""
+        if kind == 'ID':
+            value = lexeme.upper()
+            token_type = RESERVED_KEYWORDS.get(value)
+            if token_type is None:
+                token_type, value = TokenType.ID, lexeme
+        elif kind == 'SYMBOL':
+            token_type, value = SYMBOL_TOKENS[lexeme], lexeme
+        elif kind == 'INTEGER_CONST':
+            token_type, value = TokenType.INTEGER_CONST, int(lexeme)
+        else:
+            token_type, value = TokenType.REAL_CONST, float(lexeme)
+
+        return Token(
+            token_type, value, pos=start, length=end - start, lines=self.lines,
+        )
+
+
+class BytesLexer(RegexLexer):
+    """RegexLexer over ASCII-encoded source bytes.
+
+    The input can be any bytes-like object the `re` module can
+    search, most usefully a memory-mapped file (see map_source), so
+    the source text is never copied into a Python string. Comments
+    may contain arbitrary bytes; any other non-ASCII byte is a lexer
+    error. Column numbers count bytes.
+    """
+    _TOKEN = re.compile(
+        rb"""
+        (?:\s+|\{[^}]*\})*      # whitespace and comments before the token
+        (?:
+          (?P<ID>[A-Za-z][A-Za-z0-9]*)
+        | (?P<REAL_CONST>[0-9]+\.[0-9]*)
+        | (?P<INTEGER_CONST>[0-9]+)
+        | (?P<SYMBOL>:=|[%s])
+        )?
+        """ % re.escape(''.join(
+            lexeme for lexeme in SYMBOL_TOKENS if len(lexeme) == 1
+        )).encode('ascii'),
+        re.VERBOSE,
+    )
+
+    def __init__(self, text):
+        super().__init__(text)
+        self._seek(0)
+
+    def _seek(self, pos):
+        """Move the `pos` pointer and set the `current_char` variable."""
+        self.pos = pos
+        if pos < len(self.text):
+            self.current_char = chr(self.text[pos])
+        else:
+            self.current_char = None
+
+    def _make_token(self, kind, lexeme, start, end):
+        # the pattern only matches ASCII lexemes
+        return super()._make_token(kind, lexeme.decode('ascii'), start, end)
+
+    def error(self, error_code=None):
+        if self.current_char <= '\x7f':
+            super().error(error_code)
+        s = (
+            "Lexer error on non-ASCII byte {byte:#04x} "
+            "line: {lineno} column: {column}".format(
+                byte=ord(self.current_char),
+                lineno=self.lineno,
+                column=self.column,
+            )
+        )
+        raise LexerError(message=s)
+
+
+def map_source(filename):
+    """Memory-map a source file for reading with BytesLexer."""
+    with open(filename, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# Lexer implementations selectable with the '--lexer' command line option
+LEXERS = {
+    'char': Lexer,
+    'regex': RegexLexer,
+}
+
+
+# Small integer codes of token types used by TokenBuffer, e.g.
+# TOKEN_CODES[TokenType.PLUS] == 0 and TOKEN_TYPES[0] is TokenType.PLUS
+TOKEN_TYPES = tuple(TokenType)
+TOKEN_CODES = {token_type: code for code, token_type in enumerate(TOKEN_TYPES)}
+# the codes as module constants, compared by the parser instead of the
+# TokenType members, e.g. SEMI == TOKEN_CODES[TokenType.SEMI]
+(
+    PLUS, MINUS, MUL, FLOAT_DIV, LPAREN, RPAREN, SEMI, DOT, COLON, COMMA,
+    PROGRAM, INTEGER, REAL, INTEGER_DIV, VAR, PROCEDURE, BEGIN, END,
+    ID, INTEGER_CONST, REAL_CONST, ASSIGN, EOF,
+) = range(len(TOKEN_TYPES))
+
+
+class TokenBuffer:
+    """Compact storage for a sequence of tokens.
+
+    Instead of one Token object per token the buffer keeps the
+    tokens in parallel arrays (struct of arrays):
+
+        kinds     - token type codes (see TOKEN_CODES), array('B')
+        offsets   - lexeme start offsets, array('I')
+        lengths   - lexeme lengths, array('I')
+        value_ids - indices into the `values` side table, array('I')
+
+    Every distinct token value is stored only once in `values`.
+
+    Indexing the buffer returns a Token view with the usual TokenType
+    and value. The buffer can also be read sequentially with
+    get_next_token, so a parser can consume it in place of a lexer:
+
+        >>> tokens = TokenBuffer.from_lexer(Lexer(text))
+        >>> tree = Parser(tokens).parse()
+    """
+    def __init__(self, lines=None):
+        # LineIndex of the source text the tokens come from
+        self.lines = lines
+        self.kinds = array('B')
+        self.offsets = array('I')
+        self.lengths = array('I')
+        self.value_ids = array('I')
+        self.values = []
+        self._value_ids = {}
+        # index of the token that get_next_token returns next
+        self.cursor = 0
+
+    @classmethod
+    def from_lexer(cls, lexer):
+        """Read all tokens from the lexer, up to and including EOF."""
+        buffer = cls(lines=lexer.lines)
+        while True:
+            token = lexer.get_next_token()
+            buffer.append(token)
+            if token.type == TokenType.EOF:
+                return buffer
+
+    def append(self, token):
+        # the type is part of the key to keep e.g. 3 and 3.0 apart
+        key = (token.value.__class__, token.value)
+        value_id = self._value_ids.get(key)
+        if value_id is None:
+            value_id = self._value_ids[key] = len(self.values)
+            self.values.append(token.value)
+
+        self.kinds.append(TOKEN_CODES[token.type])
+        self.offsets.append(token.pos or 0)
+        self.lengths.append(token.length)
+        self.value_ids.append(value_id)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        token_type = TOKEN_TYPES[self.kinds[index]]
+        if token_type is TokenType.EOF:
+            return Token(type=TokenType.EOF, value=None)
+        return Token(
+            type=token_type,
+            value=self.values[self.value_ids[index]],
+            pos=self.offsets[index],
+            length=self.lengths[index],
+            lines=self.lines,
+        )
+
+    def get_next_token(self):
+        """Return the token at the cursor and move the cursor forward.
+
+        Once the EOF token is reached it is returned on every call.
+        """
+        token = self[self.cursor]
+        if token.type != TokenType.EOF:
+            self.cursor += 1
+        return token
+
+    def rewind(self):
+        """Move the cursor back to the first token."""
+        self.cursor = 0
+
+
+def tokenize(text, lexer_class=Lexer):
+    """Break the whole text into tokens up front.
+
+    Returns a TokenBuffer that can be passed to Parser in place of
+    a lexer, cached or inspected on its own.
+    """
+    return TokenBuffer.from_lexer(lexer_class(text))
+
+
 ###############################################################################
 #                                                                             #
 #  PARSER                                                                     #
 #                                                                             #
 ###############################################################################
-class AST:
-    pass
 
+def float_div(left, right):
+    return float(left) / float(right)
+
+
+# the operations of the operators by TokenType, looked up once by the
+# BinOp and UnaryOp nodes
+BINARY_OPERATIONS = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.MUL: operator.mul,
+    TokenType.INTEGER_DIV: operator.floordiv,
+    TokenType.FLOAT_DIV: float_div,
+}
+
+UNARY_OPERATIONS = {
+    TokenType.PLUS: operator.pos,
+    TokenType.MINUS: operator.neg,
+}
+
+
+class AST(metaclass=abc.ABCMeta):
+    # an ABC: the node views of an arena (see astarena.py) are
+    # registered as virtual subclasses of the node classes
+    __slots__ = ()
+
+
+class TokenNode(AST):
+    """A node constructed out of a token.
+
+    Instead of the token itself only its source span is kept: the
+    start offset and length of the lexeme and the LineIndex shared by
+    the whole source. The `token` property recreates the token for
+    diagnostics out of the span and of the `token_type` and
+    `token_value` of the node.
+    """
+    __slots__ = ('pos', 'length', 'lines')
+
+    def __init__(self, token):
+        self.pos = token.pos
+        self.length = token.length
+        self.lines = token.lines
+
+    @property
+    def token(self):
+        return Token(
+            type=self.token_type,
+            value=self.token_value,
+            pos=self.pos,
+            length=self.length,
+            lines=self.lines,
+        )
+
+    @property
+    def token_value(self):
+        return self.value
+
+
+class OpNode(TokenNode):
+    """A node constructed out of an operator token.
+
+    `op` is the TokenType of the operator, e.g. TokenType.PLUS.
+    """
+    __slots__ = ('op',)
+
+    def __init__(self, op):
+        super().__init__(op)
+        self.op = op.type
+
+    @property
+    def token_type(self):
+        return self.op
+
+    @property
+    def token_value(self):
+        return self.op.value
+
+
+class BinOp(OpNode):
+    """A binary operation.
+
+    `operation` is the function of the operator, the one of `op` in
+    BINARY_OPERATIONS. `static_type` is the name of the type of its
+    value ('INTEGER' or 'REAL'), set by TypeChecker (see typecheck.py).
+    """
+    __slots__ = ('left', 'right', 'operation', 'static_type')
 
-class BinOp(AST):
     def __init__(self, left, op, right):
+        super().__init__(op)
         self.left = left
-        self.token = self.op = op
         self.right = right
+        self.operation = BINARY_OPERATIONS[self.op]
+        self.static_type = None
 
 
-class Num(AST):
+class Num(TokenNode):
+    __slots__ = ('value',)
+
     def __init__(self, token):
-        self.token = token
+        super().__init__(token)
         self.value = token.value
 
+    @property
+    def token_type(self):
+        if isinstance(self.value, int):
+            return TokenType.INTEGER_CONST
+        return TokenType.REAL_CONST
+
+    @property
+    def static_type(self):
+        if isinstance(self.value, int):
+            return 'INTEGER'
+        return 'REAL'
+
+
+class UnaryOp(OpNode):
+    """A unary operation.
+
+    `operation` is the one of `op` in UNARY_OPERATIONS, `static_type`
+    is the one of BinOp.
+    """
+    __slots__ = ('expr', 'operation', 'static_type')
 
-class UnaryOp(AST):
     def __init__(self, op, expr):
-        self.token = self.op = op
+        super().__init__(op)
         self.expr = expr
+        self.operation = UNARY_OPERATIONS[self.op]
+        self.static_type = None
 
 
 class Compound(AST):
     """Represents a 'BEGIN ... END' block"""
+    __slots__ = ('children',)
+
     def __init__(self):
         self.children = []
 
 
-class Assign(AST):
+class Assign(OpNode):
+    __slots__ = ('left', 'right')
+
     def __init__(self, left, op, right):
+        super().__init__(op)
         self.left = left
-        self.token = self.op = op
         self.right = right
 
 
-class Var(AST):
-    """The Var node is constructed out of ID token."""
+class Var(TokenNode):
+    """The Var node is constructed out of ID token.
+
+    The semantic analyzer sets the address of the variable: `depth` is
+    the scope level of its declaration and `slot` is its index in the
+    activation records of that scope. It also sets `static_type`, the
+    name of the declared type of the variable.
+    """
+    __slots__ = ('value', 'depth', 'slot', 'static_type')
+    token_type = TokenType.ID
+
     def __init__(self, token):
-        self.token = token
+        super().__init__(token)
         self.value = token.value
+        self.depth = None
+        self.slot = None
+        self.static_type = None
 
 
 class NoOp(AST):
-    pass
+    __slots__ = ()
 
 
 class Program(AST):
+    __slots__ = ('name', 'block', 'var_names')
+
     def __init__(self, name, block):
         self.name = name
         self.block = block
+        # names of the global variables by slot, set by SemanticAnalyzer
+        self.var_names = None
 
 
 class Block(AST):
+    __slots__ = ('declarations', 'compound_statement')
+
     def __init__(self, declarations, compound_statement):
         self.declarations = declarations
         self.compound_statement = compound_statement
 
 
 class VarDecl(AST):
+    __slots__ = ('var_node', 'type_node')
+
     def __init__(self, var_node, type_node):
         self.var_node = var_node
         self.type_node = type_node
 
 
-class Type(AST):
+class Type(TokenNode):
+    __slots__ = ('value',)
+
     def __init__(self, token):
-        self.token = token
+        super().__init__(token)
         self.value = token.value
 
+    @property
+    def token_type(self):
+        return RESERVED_KEYWORDS[self.value]
+
 
 class Param(AST):
+    __slots__ = ('var_node', 'type_node')
+
     def __init__(self, var_node, type_node):
         self.var_node = var_node
         self.type_node = type_node
 
 
 class ProcedureDecl(AST):
+    __slots__ = (
+        'proc_name', 'params', 'block_node', 'var_names', 'proc_symbol',
+    )
+
     def __init__(self, proc_name, params, block_node):
         self.proc_name = proc_name
         self.params = params  # a list of Param nodes
         self.block_node = block_node
+        # names of the parameters and local variables by slot,
+        # set by SemanticAnalyzer
+        self.var_names = None
+        # the ProcedureSymbol of the procedure, set by SemanticAnalyzer
+        self.proc_symbol = None
+
 
+class ProcedureCall(TokenNode):
+    __slots__ = ('proc_name', 'actual_params', 'proc_symbol')
+    token_type = TokenType.ID
 
-class ProcedureCall(AST):
     def __init__(self, proc_name, actual_params, token):
+        super().__init__(token)
         self.proc_name = proc_name
         self.actual_params = actual_params  # a list of AST nodes
-        self.token = token
+        # the ProcedureSymbol of the called procedure,
+        # set by SemanticAnalyzer
+        self.proc_symbol = None
+
+    @property
+    def token_value(self):
+        return self.proc_name
 
 
 class Parser:
+    """Recursive descent parser.
+
+    The parser compares the type codes of the tokens (see TOKEN_CODES)
+    rather than their TokenType members: `kind` is the code of the
+    current token. A TokenBuffer is read in place, its codes straight
+    from the `kinds` array, and a Token is only created for the tokens
+    that end up in a node or an error message.
+    """
     def __init__(self, lexer):
+        # a lexer or a TokenBuffer, anything with get_next_token()
         self.lexer = lexer
+        # the TokenBuffer read in place, None for a lexer
+        self.buffer = lexer if isinstance(lexer, TokenBuffer) else None
+        # tokens already taken from the lexer but not consumed yet
+        self.lookahead = collections.deque()
+        # the current token, created on demand from the buffer
+        self._current_token = None
+        # index of the current token in the buffer
+        self.index = None
+        # type code of the current token
+        self.kind = None
         # set current token to the first token taken from the input
-        self.current_token = self.get_next_token()
+        self.advance()
+
+    @property
+    def current_token(self):
+        token = self._current_token
+        if token is None:
+            token = self._current_token = self.buffer[self.index]
+        return token
 
     def get_next_token(self):
+        if self.lookahead:
+            return self.lookahead.popleft()
         return self.lexer.get_next_token()
 
+    def advance(self):
+        """Make the next token of the input the current token."""
+        buffer = self.buffer
+        if buffer is None:
+            token = self._current_token = self.get_next_token()
+            self.kind = TOKEN_CODES[token.type]
+            return
+        # the cursor of the buffer stays on EOF, like get_next_token
+        index = self.index = buffer.cursor
+        kind = self.kind = buffer.kinds[index]
+        self._current_token = None
+        if kind != EOF:
+            buffer.cursor = index + 1
+
+    def peek(self, k=1):
+        """Return the k-th token after the current token.
+
+        The token is not consumed: it is kept in the lookahead
+        queue until get_next_token returns it.
+        """
+        buffer = self.buffer
+        if buffer is not None:
+            return buffer[min(self.index + k, len(buffer) - 1)]
+        while len(self.lookahead) < k:
+            self.lookahead.append(self.lexer.get_next_token())
+        return self.lookahead[k - 1]
+
+    def peek_kind(self, k=1):
+        """Return the type code of the k-th token after the current one."""
+        buffer = self.buffer
+        if buffer is not None:
+            return buffer.kinds[min(self.index + k, len(buffer) - 1)]
+        return TOKEN_CODES[self.peek(k).type]
+
     def error(self, error_code, token):
         raise ParserError(
             error_code=error_code,
@@ -393,13 +961,12 @@ class Parser:
             message=f'{error_code.value} -> {token}',
         )
 
-    def eat(self, token_type):
-        # compare the current token type with the passed token
-        # type and if they match then "eat" the current token
-        # and assign the next token to the self.current_token,
-        # otherwise raise an exception.
-        if self.current_token.type == token_type:
-            self.current_token = self.get_next_token()
+    def eat(self, kind):
+        # compare the type code of the current token with the passed
+        # type code and if they match then "eat" the current token
+        # and move on to the next token, otherwise raise an exception.
+        if self.kind == kind:
+            self.advance()
         else:
             self.error(
                 error_code=ErrorCode.UNEXPECTED_TOKEN,
@@ -408,13 +975,13 @@ class Parser:
 
     def program(self):
         """program : PROGRAM variable SEMI block DOT"""
-        self.eat(TokenType.PROGRAM)
+        self.eat(PROGRAM)
         var_node = self.variable()
         prog_name = var_node.value
-        self.eat(TokenType.SEMI)
+        self.eat(SEMI)
         block_node = self.block()
         program_node = Program(prog_name, block_node)
-        self.eat(TokenType.DOT)
+        self.eat(DOT)
         return program_node
 
     def block(self):
@@ -430,14 +997,14 @@ class Parser:
         """
         declarations = []
 
-        if self.current_token.type == TokenType.VAR:
-            self.eat(TokenType.VAR)
-            while self.current_token.type == TokenType.ID:
+        if self.kind == VAR:
+            self.eat(VAR)
+            while self.kind == ID:
                 var_decl = self.variable_declaration()
                 declarations.extend(var_decl)
-                self.eat(TokenType.SEMI)
+                self.eat(SEMI)
 
-        while self.current_token.type == TokenType.PROCEDURE:
+        while self.kind == PROCEDURE:
             proc_decl = self.procedure_declaration()
             declarations.append(proc_decl)
 
@@ -448,13 +1015,13 @@ class Parser:
         param_nodes = []
 
         param_tokens = [self.current_token]
-        self.eat(TokenType.ID)
-        while self.current_token.type == TokenType.COMMA:
-            self.eat(TokenType.COMMA)
+        self.eat(ID)
+        while self.kind == COMMA:
+            self.eat(COMMA)
             param_tokens.append(self.current_token)
-            self.eat(TokenType.ID)
+            self.eat(ID)
 
-        self.eat(TokenType.COLON)
+        self.eat(COLON)
         type_node = self.type_spec()
 
         for param_token in param_tokens:
@@ -468,13 +1035,13 @@ class Parser:
                                   | formal_parameters SEMI formal_parameter_list
         """
         # procedure Foo();
-        if not self.current_token.type == TokenType.ID:
+        if not self.kind == ID:
             return []
 
         param_nodes = self.formal_parameters()
 
-        while self.current_token.type == TokenType.SEMI:
-            self.eat(TokenType.SEMI)
+        while self.kind == SEMI:
+            self.eat(SEMI)
             param_nodes.extend(self.formal_parameters())
 
         return param_nodes
@@ -482,14 +1049,14 @@ class Parser:
     def variable_declaration(self):
         """variable_declaration : ID (COMMA ID)* COLON type_spec"""
         var_nodes = [Var(self.current_token)]  # first ID
-        self.eat(TokenType.ID)
+        self.eat(ID)
 
-        while self.current_token.type == TokenType.COMMA:
-            self.eat(TokenType.COMMA)
+        while self.kind == COMMA:
+            self.eat(COMMA)
             var_nodes.append(Var(self.current_token))
-            self.eat(TokenType.ID)
+            self.eat(ID)
 
-        self.eat(TokenType.COLON)
+        self.eat(COLON)
 
         type_node = self.type_spec()
         var_declarations = [
@@ -502,20 +1069,20 @@ class Parser:
         """procedure_declaration :
              PROCEDURE ID (LPAREN formal_parameter_list RPAREN)? SEMI block SEMI
         """
-        self.eat(TokenType.PROCEDURE)
+        self.eat(PROCEDURE)
         proc_name = self.current_token.value
-        self.eat(TokenType.ID)
+        self.eat(ID)
         params = []
 
-        if self.current_token.type == TokenType.LPAREN:
-            self.eat(TokenType.LPAREN)
+        if self.kind == LPAREN:
+            self.eat(LPAREN)
             params = self.formal_parameter_list()
-            self.eat(TokenType.RPAREN)
+            self.eat(RPAREN)
 
-        self.eat(TokenType.SEMI)
+        self.eat(SEMI)
         block_node = self.block()
         proc_decl = ProcedureDecl(proc_name, params, block_node)
-        self.eat(TokenType.SEMI)
+        self.eat(SEMI)
         return proc_decl
 
     def type_spec(self):
@@ -523,10 +1090,10 @@ class Parser:
                      | REAL
         """
         token = self.current_token
-        if self.current_token.type == TokenType.INTEGER:
-            self.eat(TokenType.INTEGER)
+        if self.kind == INTEGER:
+            self.eat(INTEGER)
         else:
-            self.eat(TokenType.REAL)
+            self.eat(REAL)
         node = Type(token)
         return node
 
@@ -534,9 +1101,9 @@ class Parser:
         """
         compound_statement: BEGIN statement_list END
         """
-        self.eat(TokenType.BEGIN)
+        self.eat(BEGIN)
         nodes = self.statement_list()
-        self.eat(TokenType.END)
+        self.eat(END)
 
         root = Compound()
         for node in nodes:
@@ -553,8 +1120,8 @@ class Parser:
 
         results = [node]
 
-        while self.current_token.type == TokenType.SEMI:
-            self.eat(TokenType.SEMI)
+        while self.kind == SEMI:
+            self.eat(SEMI)
             results.append(self.statement())
 
         return results
@@ -566,13 +1133,13 @@ class Parser:
                   | assignment_statement
                   | empty
         """
-        if self.current_token.type == TokenType.BEGIN:
+        if self.kind == BEGIN:
             node = self.compound_statement()
-        elif (self.current_token.type == TokenType.ID and
-              self.lexer.current_char == '('
+        elif (self.kind == ID and
+              self.peek_kind() == LPAREN
         ):
             node = self.proccall_statement()
-        elif self.current_token.type == TokenType.ID:
+        elif self.kind == ID:
             node = self.assignment_statement()
         else:
             node = self.empty()
@@ -583,19 +1150,19 @@ class Parser:
         token = self.current_token
 
         proc_name = self.current_token.value
-        self.eat(TokenType.ID)
-        self.eat(TokenType.LPAREN)
+        self.eat(ID)
+        self.eat(LPAREN)
         actual_params = []
-        if self.current_token.type != TokenType.RPAREN:
+        if self.kind != RPAREN:
             node = self.expr()
             actual_params.append(node)
 
-        while self.current_token.type == TokenType.COMMA:
-            self.eat(TokenType.COMMA)
+        while self.kind == COMMA:
+            self.eat(COMMA)
             node = self.expr()
             actual_params.append(node)
 
-        self.eat(TokenType.RPAREN)
+        self.eat(RPAREN)
 
         node = ProcedureCall(
             proc_name=proc_name,
@@ -610,7 +1177,7 @@ class Parser:
         """
         left = self.variable()
         token = self.current_token
-        self.eat(TokenType.ASSIGN)
+        self.eat(ASSIGN)
         right = self.expr()
         node = Assign(left, token, right)
         return node
@@ -620,7 +1187,7 @@ class Parser:
         variable : ID
         """
         node = Var(self.current_token)
-        self.eat(TokenType.ID)
+        self.eat(ID)
         return node
 
     def empty(self):
@@ -633,12 +1200,12 @@ class Parser:
         """
         node = self.term()
 
-        while self.current_token.type in (TokenType.PLUS, TokenType.MINUS):
+        while self.kind in (PLUS, MINUS):
             token = self.current_token
-            if token.type == TokenType.PLUS:
-                self.eat(TokenType.PLUS)
-            elif token.type == TokenType.MINUS:
-                self.eat(TokenType.MINUS)
+            if self.kind == PLUS:
+                self.eat(PLUS)
+            elif self.kind == MINUS:
+                self.eat(MINUS)
 
             node = BinOp(left=node, op=token, right=self.term())
 
@@ -648,18 +1215,14 @@ class Parser:
         """term : factor ((MUL | INTEGER_DIV | FLOAT_DIV) factor)*"""
         node = self.factor()
 
-        while self.current_token.type in (
-                TokenType.MUL,
-                TokenType.INTEGER_DIV,
-                TokenType.FLOAT_DIV,
-        ):
+        while self.kind in (MUL, INTEGER_DIV, FLOAT_DIV):
             token = self.current_token
-            if token.type == TokenType.MUL:
-                self.eat(TokenType.MUL)
-            elif token.type == TokenType.INTEGER_DIV:
-                self.eat(TokenType.INTEGER_DIV)
-            elif token.type == TokenType.FLOAT_DIV:
-                self.eat(TokenType.FLOAT_DIV)
+            if self.kind == MUL:
+                self.eat(MUL)
+            elif self.kind == INTEGER_DIV:
+                self.eat(INTEGER_DIV)
+            elif self.kind == FLOAT_DIV:
+                self.eat(FLOAT_DIV)
 
             node = BinOp(left=node, op=token, right=self.factor())
 
@@ -673,25 +1236,29 @@ class Parser:
                   | LPAREN expr RPAREN
                   | variable
         """
-        token = self.current_token
-        if token.type == TokenType.PLUS:
-            self.eat(TokenType.PLUS)
+        kind = self.kind
+        if kind == PLUS:
+            token = self.current_token
+            self.eat(PLUS)
             node = UnaryOp(token, self.factor())
             return node
-        elif token.type == TokenType.MINUS:
-            self.eat(TokenType.MINUS)
+        elif kind == MINUS:
+            token = self.current_token
+            self.eat(MINUS)
             node = UnaryOp(token, self.factor())
             return node
-        elif token.type == TokenType.INTEGER_CONST:
-            self.eat(TokenType.INTEGER_CONST)
+        elif kind == INTEGER_CONST:
+            token = self.current_token
+            self.eat(INTEGER_CONST)
             return Num(token)
-        elif token.type == TokenType.REAL_CONST:
-            self.eat(TokenType.REAL_CONST)
+        elif kind == REAL_CONST:
+            token = self.current_token
+            self.eat(REAL_CONST)
             return Num(token)
-        elif token.type == TokenType.LPAREN:
-            self.eat(TokenType.LPAREN)
+        elif kind == LPAREN:
+            self.eat(LPAREN)
             node = self.expr()
-            self.eat(TokenType.RPAREN)
+            self.eat(RPAREN)
             return node
         else:
             node = self.variable()
@@ -747,7 +1314,7 @@ class Parser:
         variable: ID
         """
         node = self.program()
-        if self.current_token.type != TokenType.EOF:
+        if self.kind != EOF:
             self.error(
                 error_code=ErrorCode.UNEXPECTED_TOKEN,
                 token=self.current_token,
@@ -756,6 +1323,114 @@ class Parser:
         return node
 
 
+class PrecedenceParser(Parser):
+    """Parser with an iterative (precedence climbing) expression parser.
+
+    Parser.expr, term and factor spend a Python call per precedence
+    level and recurse on parentheses and unary operators. This parser
+    recognizes the same expressions and builds the same nodes with a
+    loop and explicit operand and operator stacks, so the nesting of
+    parentheses and unary operators is limited only by memory.
+    """
+    # type codes of the binary operators, all of them are
+    # left-associative
+    ADDITIVE_OPS = (PLUS, MINUS)
+    MULTIPLICATIVE_OPS = (MUL, INTEGER_DIV, FLOAT_DIV)
+    # type codes of the tokens that can precede an operand
+    PREFIX_TOKENS = (PLUS, MINUS, LPAREN)
+
+    # precedence of the entries of the operator stack, an opening
+    # parenthesis is kept there too and is never reduced
+    PAREN_PRECEDENCE = 0
+    ADDITIVE_PRECEDENCE = 1
+    MULTIPLICATIVE_PRECEDENCE = 2
+    UNARY_PRECEDENCE = 3
+
+    def reduce(self, operators, operands, precedence):
+        """Build nodes for the operators on top of the stack that
+        bind at least as tight as `precedence` (which must be > 0)."""
+        while operators and operators[-1][0] >= precedence:
+            op_precedence, token = operators.pop()
+            if op_precedence == self.UNARY_PRECEDENCE:
+                operands[-1] = UnaryOp(token, operands[-1])
+            else:
+                right = operands.pop()
+                operands[-1] = BinOp(left=operands[-1], op=token, right=right)
+
+    def expr(self):
+        """
+        expr : term ((PLUS | MINUS) term)*
+
+        term : factor ((MUL | INTEGER_DIV | FLOAT_DIV) factor)*
+
+        factor : PLUS factor
+               | MINUS factor
+               | INTEGER_CONST
+               | REAL_CONST
+               | LPAREN expr RPAREN
+               | variable
+        """
+        advance = self.advance
+        # pending (precedence, token) pairs and the nodes they apply to
+        operators = []
+        operands = []
+        open_parens = 0
+
+        kind = self.kind
+        while True:
+            # unary operators and opening parentheses before an operand;
+            # the type of the tokens is known, so there is no need to eat()
+            while kind in self.PREFIX_TOKENS:
+                if kind == LPAREN:
+                    operators.append((self.PAREN_PRECEDENCE, None))
+                    open_parens += 1
+                else:
+                    operators.append((self.UNARY_PRECEDENCE,
+                                      self.current_token))
+                advance()
+                kind = self.kind
+
+            if kind == INTEGER_CONST or kind == REAL_CONST:
+                operands.append(Num(self.current_token))
+                advance()
+            else:
+                operands.append(self.variable())
+            kind = self.kind
+
+            # closing parentheses after an operand
+            while kind == RPAREN and open_parens:
+                self.reduce(operators, operands, self.PAREN_PRECEDENCE + 1)
+                operators.pop()  # the matching opening parenthesis
+                open_parens -= 1
+                advance()
+                kind = self.kind
+
+            # a binary operator, otherwise the end of the expression
+            if kind in self.ADDITIVE_OPS:
+                precedence = self.ADDITIVE_PRECEDENCE
+            elif kind in self.MULTIPLICATIVE_OPS:
+                precedence = self.MULTIPLICATIVE_PRECEDENCE
+            else:
+                break
+            self.reduce(operators, operands, precedence)
+            operators.append((precedence, self.current_token))
+            advance()
+            kind = self.kind
+
+        if open_parens:
+            # raises an error for the token in place of the missing ')'
+            self.eat(RPAREN)
+        self.reduce(operators, operands, self.PAREN_PRECEDENCE + 1)
+        return operands[0]
+
+
+# Parser implementations selectable with the '--parser' command line option
+PARSERS = {
+    'recursive': Parser,
+    'precedence': PrecedenceParser,
+}
+
+
 ###############################################################################
 #                                                                             #
 #  AST visitors (walkers)                                                     #
@@ -763,10 +1438,34 @@ class Parser:
 ###############################################################################
 
 class NodeVisitor:
+    """Base class of the AST walkers.
+
+    visit(node) calls the visit_<class name> method of the visitor,
+    or generic_visit if there is none. The method is looked up once
+    per node class and kept in a per-visitor-class table, so most
+    calls cost a single dict lookup instead of building the method
+    name and calling getattr.
+    """
+    # node class -> visit function, see __init_subclass__
+    _visitors = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every visitor class has its own table
+        cls._visitors = {}
+
     def visit(self, node):
-        method_name = 'visit_' + type(node).__name__
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
+        visitor = self._visitors.get(node.__class__)
+        if visitor is None:
+            visitor = self._add_visitor(node.__class__)
+        return visitor(self, node)
+
+    @classmethod
+    def _add_visitor(cls, node_class):
+        method_name = 'visit_' + node_class.__name__
+        visitor = getattr(cls, method_name, cls.generic_visit)
+        cls._visitors[node_class] = visitor
+        return visitor
 
     def generic_visit(self, node):
         raise Exception('No visit_{} method'.format(type(node).__name__))
@@ -787,6 +1486,10 @@ class Symbol:
 class VarSymbol(Symbol):
     def __init__(self, name, type):
         super().__init__(name, type)
+        # set when the symbol is inserted into a scope: the level of
+        # the scope and the index of the variable in its frames
+        self.scope_level = None
+        self.slot = None
 
     def __str__(self):
         return "<{class_name}(name='{name}', type='{type}')>".format(
@@ -817,6 +1520,12 @@ class ProcedureSymbol(Symbol):
         super().__init__(name)
         # a list of formal parameters
         self.params = params if params is not None else []
+        # set by SemanticAnalyzer: the nesting level of the procedure
+        # scope, the names of its variables by slot (see ProcedureDecl)
+        # and the Block node of its body
+        self.nesting_level = None
+        self.var_names = None
+        self.block_ast = None
 
     def __str__(self):
         return '<{class_name}(name={name}, parameters={params})>'.format(
@@ -834,6 +1543,13 @@ class ScopedSymbolTable:
         self.scope_name = scope_name
         self.scope_level = scope_level
         self.enclosing_scope = enclosing_scope
+        # names of the variables of the scope in slot order
+        self.var_names = []
+
+    @property
+    def frame_size(self):
+        """The number of variable slots in an activation record."""
+        return len(self.var_names)
 
     def _init_builtins(self):
         self.insert(BuiltinTypeSymbol('INTEGER'))
@@ -868,6 +1584,10 @@ class ScopedSymbolTable:
 
     def insert(self, symbol):
         self.log(f'Insert: {symbol.name}')
+        if isinstance(symbol, VarSymbol):
+            symbol.scope_level = self.scope_level
+            symbol.slot = len(self.var_names)
+            self.var_names.append(symbol.name)
         self._symbols[symbol.name] = symbol
 
     def lookup(self, name, current_scope_only=False):
@@ -918,6 +1638,7 @@ class SemanticAnalyzer(NodeVisitor):
 
         # visit subtree
         self.visit(node.block)
+        node.var_names = tuple(global_scope.var_names)
 
         self.log(global_scope)
 
@@ -939,6 +1660,7 @@ class SemanticAnalyzer(NodeVisitor):
         proc_name = node.proc_name
         proc_symbol = ProcedureSymbol(proc_name)
         self.current_scope.insert(proc_symbol)
+        node.proc_symbol = proc_symbol
 
         self.log(f'ENTER scope: {proc_name}')
         # Scope for parameters and local variables
@@ -948,6 +1670,7 @@ class SemanticAnalyzer(NodeVisitor):
             enclosing_scope=self.current_scope
         )
         self.current_scope = procedure_scope
+        proc_symbol.nesting_level = procedure_scope.scope_level
 
         # Insert parameters into the procedure scope
         for param in node.params:
@@ -958,6 +1681,9 @@ class SemanticAnalyzer(NodeVisitor):
             proc_symbol.params.append(var_symbol)
 
         self.visit(node.block_node)
+        node.var_names = tuple(procedure_scope.var_names)
+        proc_symbol.var_names = node.var_names
+        proc_symbol.block_ast = node.block_node
 
         self.log(procedure_scope)
 
@@ -992,16 +1718,29 @@ class SemanticAnalyzer(NodeVisitor):
     def visit_Var(self, node):
         var_name = node.value
         var_symbol = self.current_scope.lookup(var_name)
-        if var_symbol is None:
+        # procedure and type names are not variables
+        if not isinstance(var_symbol, VarSymbol):
             self.error(error_code=ErrorCode.ID_NOT_FOUND, token=node.token)
+        node.depth = var_symbol.scope_level
+        node.slot = var_symbol.slot
+        node.static_type = var_symbol.type.name
 
     def visit_Num(self, node):
         pass
 
     def visit_UnaryOp(self, node):
-        pass
+        self.visit(node.expr)
 
     def visit_ProcedureCall(self, node):
+        proc_symbol = self.current_scope.lookup(node.proc_name)
+        if not isinstance(proc_symbol, ProcedureSymbol):
+            self.error(error_code=ErrorCode.ID_NOT_FOUND, token=node.token)
+        if len(node.actual_params) != len(proc_symbol.params):
+            self.error(
+                error_code=ErrorCode.WRONG_PARAMS_NUM, token=node.token,
+            )
+        node.proc_symbol = proc_symbol
+
         for param_node in node.actual_params:
             self.visit(param_node)
 
@@ -1015,17 +1754,37 @@ class SemanticAnalyzer(NodeVisitor):
 
 class ARType(Enum):
     PROGRAM   = 'PROGRAM'
+    PROCEDURE = 'PROCEDURE'
 
 
 class CallStack:
+    """The stack of activation records and the display.
+
+    The display is a list of activation records indexed by static
+    nesting level: display[n] is the most recent record of the
+    enclosing procedure (or the program) at level n, so a variable
+    declared at any level is accessed as display[depth].slots[slot]
+    without walking static links. Entry 0 is unused.
+    """
     def __init__(self):
         self._records = []
+        self.display = [None]
 
     def push(self, ar):
         self._records.append(ar)
+        # a procedure at level n is called from level n - 1 or deeper,
+        # so the display is at most one entry short
+        level = ar.nesting_level
+        if level == len(self.display):
+            self.display.append(None)
+        ar.display_link = self.display[level]
+        self.display[level] = ar
 
     def pop(self):
-        return self._records.pop()
+        ar = self._records.pop()
+        self.display[ar.nesting_level] = ar.display_link
+        ar.display_link = None
+        return ar
 
     def peek(self):
         return self._records[-1]
@@ -1040,20 +1799,51 @@ class CallStack:
 
 
 class ActivationRecord:
-    def __init__(self, name, type, nesting_level):
+    """A frame of variables indexed by slot.
+
+    `names` are the names of the variables in slot order (the
+    var_names of the Program or ProcedureDecl node), the interpreter
+    reads and writes `slots` by the slot numbers of Var nodes.
+    Variables that have not been assigned yet hold None.
+
+    Records are created for every procedure call, so they have no
+    __dict__ (see also FramePool).
+    """
+    __slots__ = (
+        'name', 'type', 'nesting_level', 'names', 'slots', 'display_link',
+    )
+
+    def __init__(self, name, type, nesting_level, names=()):
         self.name = name
         self.type = type
         self.nesting_level = nesting_level
-        self.members = {}
+        self.names = names
+        self.slots = [None] * len(names)
+        # the display entry this record replaced, see CallStack
+        self.display_link = None
+
+    @property
+    def members(self):
+        """A dict of the assigned variables by name."""
+        return {
+            name: value
+            for name, value in zip(self.names, self.slots)
+            if value is not None
+        }
 
     def __setitem__(self, key, value):
-        self.members[key] = value
+        self.slots[self.names.index(key)] = value
 
     def __getitem__(self, key):
-        return self.members[key]
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
 
     def get(self, key):
-        return self.members.get(key)
+        if key not in self.names:
+            return None
+        return self.slots[self.names.index(key)]
 
     def __str__(self):
         lines = [
@@ -1073,10 +1863,47 @@ class ActivationRecord:
         return self.__str__()
 
 
+class FramePool:
+    """Free lists of the activation records of procedures.
+
+    A procedure call acquires a record of the procedure and releases
+    it on return, so records are reused instead of allocated anew for
+    every call. A free list holds as many records as the deepest
+    recursion of its procedure needed. Released records are cleared:
+    all variables of an acquired record are unassigned, and the pool
+    keeps no values alive.
+    """
+    def __init__(self):
+        # (free records, slots of a cleared record) by ProcedureSymbol
+        self._free = {}
+
+    def acquire(self, proc_symbol):
+        entry = self._free.get(proc_symbol)
+        if entry is None:
+            entry = self._free[proc_symbol] = (
+                [], (None,) * len(proc_symbol.var_names),
+            )
+        free = entry[0]
+        if free:
+            return free.pop()
+        return ActivationRecord(
+            name=proc_symbol.name,
+            type=ARType.PROCEDURE,
+            nesting_level=proc_symbol.nesting_level,
+            names=proc_symbol.var_names,
+        )
+
+    def release(self, proc_symbol, ar):
+        free, cleared = self._free[proc_symbol]
+        ar.slots[:] = cleared
+        free.append(ar)
+
+
 class Interpreter(NodeVisitor):
     def __init__(self, tree):
         self.tree = tree
         self.call_stack = CallStack()
+        self.frame_pool = FramePool()
 
     def log(self, msg):
         if _SHOULD_LOG_STACK:
@@ -1090,6 +1917,7 @@ class Interpreter(NodeVisitor):
             name=program_name,
             type=ARType.PROGRAM,
             nesting_level=1,
+            names=node.var_names,
         )
         self.call_stack.push(ar)
 
@@ -1116,43 +1944,28 @@ class Interpreter(NodeVisitor):
         pass
 
     def visit_BinOp(self, node):
-        if node.op.type == TokenType.PLUS:
-            return self.visit(node.left) + self.visit(node.right)
-        elif node.op.type == TokenType.MINUS:
-            return self.visit(node.left) - self.visit(node.right)
-        elif node.op.type == TokenType.MUL:
-            return self.visit(node.left) * self.visit(node.right)
-        elif node.op.type == TokenType.INTEGER_DIV:
-            return self.visit(node.left) // self.visit(node.right)
-        elif node.op.type == TokenType.FLOAT_DIV:
-            return float(self.visit(node.left)) / float(self.visit(node.right))
+        return node.operation(self.visit(node.left), self.visit(node.right))
 
     def visit_Num(self, node):
         return node.value
 
     def visit_UnaryOp(self, node):
-        op = node.op.type
-        if op == TokenType.PLUS:
-            return +self.visit(node.expr)
-        elif op == TokenType.MINUS:
-            return -self.visit(node.expr)
+        return node.operation(self.visit(node.expr))
 
     def visit_Compound(self, node):
         for child in node.children:
             self.visit(child)
 
     def visit_Assign(self, node):
-        var_name = node.left.value
         var_value = self.visit(node.right)
 
-        ar = self.call_stack.peek()
-        ar[var_name] = var_value
+        var_node = node.left
+        ar = self.call_stack.display[var_node.depth]
+        ar.slots[var_node.slot] = var_value
 
     def visit_Var(self, node):
-        var_name = node.value
-
-        ar = self.call_stack.peek()
-        var_value = ar.get(var_name)
+        ar = self.call_stack.display[node.depth]
+        var_value = ar.slots[node.slot]
 
         return var_value
 
@@ -1163,7 +1976,33 @@ class Interpreter(NodeVisitor):
         pass
 
     def visit_ProcedureCall(self, node):
-        pass
+        proc_symbol = node.proc_symbol
+        ar = self.frame_pool.acquire(proc_symbol)
+
+        slots = ar.slots
+        for param_symbol, param_node in zip(
+            proc_symbol.params, node.actual_params
+        ):
+            slots[param_symbol.slot] = self.visit(param_node)
+
+        call_stack = self.call_stack
+        if _SHOULD_LOG_STACK:
+            self.log(f'ENTER: PROCEDURE {proc_symbol.name}')
+        call_stack.push(ar)
+        if _SHOULD_LOG_STACK:
+            self.log(str(call_stack))
+
+        self.execute_procedure(proc_symbol)
+
+        if _SHOULD_LOG_STACK:
+            self.log(f'LEAVE: PROCEDURE {proc_symbol.name}')
+            self.log(str(call_stack))
+        call_stack.pop()
+        self.frame_pool.release(proc_symbol, ar)
+
+    def execute_procedure(self, proc_symbol):
+        """Run the body of a procedure whose record is on the stack."""
+        self.visit(proc_symbol.block_ast)
 
     def interpret(self):
         tree = self.tree
@@ -1187,31 +2026,276 @@ def main():
         help='Print call stack',
         action='store_true',
     )
+    parser.add_argument(
+        '--lexer',
+        help='Lexer implementation (default: %(default)s)',
+        choices=sorted(LEXERS),
+        default='char',
+    )
+    parser.add_argument(
+        '--parser',
+        help='Parser implementation (default: %(default)s)',
+        choices=sorted(PARSERS),
+        default='recursive',
+    )
+    parser.add_argument(
+        '--engine',
+        help='Execution engine: the tree-walking interpreter, closures '
+             'compiled from the AST, the bytecode VM, the register VM, '
+             'Python code compiled from the AST, the tree-walking '
+             'interpreter without Python recursion for procedure calls or '
+             'the tree-walking interpreter that compiles hot procedures '
+             'into closures (default: %(default)s)',
+        choices=[
+            'closures', 'interpreter', 'python', 'regvm', 'tiered',
+            'trampoline', 'vm',
+        ],
+        default='interpreter',
+    )
+    parser.add_argument(
+        '--max-depth',
+        help='Maximum depth of procedure calls, 0 for no limit '
+             '(with --engine=trampoline, default: %(default)s)',
+        type=int,
+        default=100000,
+    )
+    parser.add_argument(
+        '--tiering',
+        help='Compile procedures after --tier-threshold calls, before '
+             'their first call or never (with --engine=tiered, default: '
+             '%(default)s); --stack prints the tier and the number of '
+             'calls of every procedure',
+        choices=['adaptive', 'always', 'never'],
+        default='adaptive',
+    )
+    parser.add_argument(
+        '--tier-threshold',
+        help='Number of calls that make a procedure hot (with '
+             '--engine=tiered, default: %(default)s)',
+        type=int,
+        default=100,
+    )
+    parser.add_argument(
+        '--disassemble',
+        help='Print the bytecode of the program (with --engine=vm)',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--profile',
+        help='Print the number of executed instructions of every kind '
+             '(with --engine=vm or --engine=regvm)',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--dump-ir',
+        help='Print the register IR before and after every optimizer '
+             'pass (with --engine=regvm)',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--typecheck',
+        help='Check the types of expressions and assignments before '
+             'running the program',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--fold',
+        help='Fold constant expressions before running the program and '
+             'print the number of eliminated nodes',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--emit-c',
+        help='Translate the program into a standalone C program and write '
+             'it to this file',
+        metavar='FILE',
+    )
+    parser.add_argument(
+        '--native',
+        help='Build the program with the C compiler ($CC or cc) and run '
+             'it; it prints the activation record of the program at exit',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--mmap-threshold',
+        help='Memory-map source files of at least that many bytes '
+             'and lex them with BytesLexer (default: %(default)s)',
+        type=int,
+        default=_MMAP_THRESHOLD,
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help='Cache semantically checked ASTs (and the code compiled by '
+             '--engine=python) in this directory',
+    )
+    parser.add_argument(
+        '--cache-size',
+        help='Maximum size of the AST cache (and of the code cached by '
+             '--engine=python) in bytes',
+        type=int,
+    )
+    parser.add_argument(
+        '--batch',
+        help='Run the program element-wise over the arrays of this .npz '
+             'file, bound to the global variables of the same names, and '
+             'print the final global variables as arrays (needs NumPy)',
+        metavar='FILE',
+    )
+    parser.add_argument(
+        '--batch-output',
+        help='Write the arrays of --batch into this .npz file instead of '
+             'printing them',
+        metavar='FILE',
+    )
     args = parser.parse_args()
 
     global _SHOULD_LOG_SCOPE, _SHOULD_LOG_STACK
     _SHOULD_LOG_SCOPE, _SHOULD_LOG_STACK = args.scope, args.stack
 
-    text = open(args.inputfile, 'r').read()
-
-    lexer = Lexer(text)
-    try:
-        parser = Parser(lexer)
-        tree = parser.parse()
-    except (LexerError, ParserError) as e:
-        print(e.message)
-        sys.exit(1)
-
-    semantic_analyzer = SemanticAnalyzer()
+    if os.path.getsize(args.inputfile) >= args.mmap_threshold:
+        source = map_source(args.inputfile)
+    else:
+        source = open(args.inputfile, 'r').read()
+
+    cache = tree = None
+    if args.cache_dir is not None:
+        from astcache import ASTCache
+        cache = ASTCache(args.cache_dir)
+        if args.cache_size is not None:
+            cache.max_size = args.cache_size
+        tree = cache.load(source)
+
+    if tree is None:
+        try:
+            if isinstance(source, str):
+                tokens = tokenize(source, LEXERS[args.lexer])
+            else:
+                # stream tokens straight from the mapped file
+                tokens = BytesLexer(source)
+            parser = PARSERS[args.parser](tokens)
+            tree = parser.parse()
+        except (LexerError, ParserError) as e:
+            print(e.message)
+            sys.exit(1)
+
+        semantic_analyzer = SemanticAnalyzer()
+        try:
+            semantic_analyzer.visit(tree)
+        except SemanticError as e:
+            print(e.message)
+            sys.exit(1)
+
+        if cache is not None:
+            cache.store(source, tree)
+
+    # the modules of the passes run over the AST before it is compiled
+    passes = []
+    if args.typecheck:
+        import typecheck
+        passes.append(typecheck)
+        try:
+            typecheck.TypeChecker().visit(tree)
+        except SemanticError as e:
+            print(e.message)
+            sys.exit(1)
+
+    if args.fold:
+        import constfold
+        passes.append(constfold)
+        folder = constfold.ConstantFolder()
+        folder.visit(tree)
+        print(f'Constant folding eliminated {folder.eliminated} nodes')
+
+    if args.emit_c is not None or args.native:
+        from cbackend import CBackendError, CCompiler, run_native
+        try:
+            c_source = CCompiler().compile(tree)
+            if args.emit_c is not None:
+                with open(args.emit_c, 'w') as f:
+                    f.write(c_source)
+            if args.native:
+                sys.exit(run_native(c_source).returncode)
+        except CBackendError as e:
+            print(e.message)
+            sys.exit(1)
+        return
+
+    if args.batch is not None:
+        from batch import (
+            BatchError, BatchInterpreter, load_inputs, save_results,
+        )
+        try:
+            inputs = load_inputs(args.batch)
+            results = BatchInterpreter(tree, inputs).interpret()
+            if args.batch_output is not None:
+                save_results(args.batch_output, results)
+        except (BatchError, ExecutionError) as e:
+            print(e.message)
+            sys.exit(1)
+        if args.batch_output is None:
+            for name, values in results.items():
+                print(f'{name:<20}: {values}')
+        return
+
+    if args.engine in ('regvm', 'vm'):
+        from vm import CompileError
+        try:
+            if args.engine == 'vm':
+                from vm import VM, BytecodeCompiler, disassemble
+                bytecode = BytecodeCompiler().compile(tree)
+                if args.disassemble:
+                    print(disassemble(bytecode))
+                vm = VM(bytecode)
+            else:
+                from regvm import RegisterVM, compile_program
+                dump = print if args.dump_ir else None
+                vm = RegisterVM(compile_program(tree, dump=dump))
+        except CompileError as e:
+            print(e.message)
+            sys.exit(1)
+        vm.run(profile=args.profile)
+        if args.profile:
+            for name, count in vm.profile.most_common():
+                print(f'{name:<12} {count:10}')
+        return
+
+    if args.engine == 'closures':
+        from closures import ClosureInterpreter
+        interpreter = ClosureInterpreter(tree)
+    elif args.engine == 'python':
+        from pybackend import CodeCache, PythonCompiler, PythonInterpreter
+        code = None
+        if args.cache_dir is not None:
+            code_cache = CodeCache(args.cache_dir, passes=passes)
+            if args.cache_size is not None:
+                code_cache.max_size = args.cache_size
+            code = code_cache.load(source)
+            if code is None:
+                code = PythonCompiler().compile(tree)
+                code_cache.store(source, code)
+        interpreter = PythonInterpreter(tree, code)
+    elif args.engine == 'tiered':
+        from tiered import TieredInterpreter
+        interpreter = TieredInterpreter(
+            tree, mode=args.tiering, threshold=args.tier_threshold,
+        )
+    elif args.engine == 'trampoline':
+        from trampoline import TrampolineInterpreter
+        interpreter = TrampolineInterpreter(
+            tree, max_depth=args.max_depth or None,
+        )
+    else:
+        interpreter = Interpreter(tree)
     try:
-        semantic_analyzer.visit(tree)
-    except SemanticError as e:
+        interpreter.interpret()
+    except ExecutionError as e:
         print(e.message)
         sys.exit(1)
 
-    interpreter = Interpreter(tree)
-    interpreter.interpret()
-
 
 if __name__ == '__main__':
-    main()
+    # Run main() from the module imported as 'spi' rather than from
+    # '__main__', so that the classes of pickled (cached) trees and
+    # those used by helper modules importing spi are the same.
+    import spi
+    spi.main()
@@ -0,0 +1,183 @@
+import io
+import pickle
+import unittest
+
+
+PROGRAM = """\
+PROGRAM Test;
+VAR
+   a, b : INTEGER;
+   y    : REAL;
+
+PROCEDURE P1(p : INTEGER; q : REAL);
+VAR
+   k : INTEGER;
+BEGIN
+   k := -p + 2
+END;
+
+BEGIN {Test}
+   a := 2;
+   b := 10 * a + 10 * a DIV 4;
+   y := 20 / 7 + 3.14;
+   P1(a + 1, y)
+END.  {Test}
+"""
+
+
+def dump(node):
+    """Return the attributes of an AST node or view as nested lists."""
+    result = [type(node).__name__]
+    for name in ('name', 'proc_name', 'value', 'op'):
+        if hasattr(node, name):
+            result.append(getattr(node, name))
+    for name in (
+        'block', 'declarations', 'compound_statement', 'var_node',
+        'type_node', 'params', 'block_node', 'children', 'left', 'right',
+        'expr', 'actual_params',
+    ):
+        if hasattr(node, name):
+            value = getattr(node, name)
+            if isinstance(value, list):
+                result.append([dump(child) for child in value])
+            else:
+                result.append(dump(value))
+    return result
+
+
+class ASTArenaTestCase(unittest.TestCase):
+    def makeTree(self, text):
+        from spi import Lexer, Parser
+        return Parser(Lexer(text)).parse()
+
+    def makeArenaTree(self, text):
+        from spi import Lexer
+        from astarena import ArenaParser
+        return ArenaParser(Lexer(text)).parse()
+
+    def test_from_tree(self):
+        from astarena import ASTArena
+        tree = self.makeTree(PROGRAM)
+        arena = ASTArena.from_tree(tree)
+        self.assertEqual(dump(arena.view()), dump(tree))
+
+    def test_annotations(self):
+        from spi import SemanticAnalyzer
+        from astarena import ASTArena
+        tree = self.makeTree(PROGRAM)
+        SemanticAnalyzer().visit(tree)
+        arena_tree = ASTArena.from_tree(tree).view()
+        self.assertEqual(arena_tree.var_names, ('a', 'b', 'y'))
+
+        proc = arena_tree.block.declarations[3]
+        self.assertEqual(proc.var_names, ('p', 'q', 'k'))
+        var_node = proc.block_node.compound_statement.children[0].left
+        self.assertEqual((var_node.depth, var_node.slot), (2, 2))
+
+    def test_parser(self):
+        tree = self.makeArenaTree(PROGRAM)
+        self.assertEqual(dump(tree), dump(self.makeTree(PROGRAM)))
+        # declarations and statements are nodes of the same arena
+        self.assertEqual(len(tree.arena), 56)
+
+    def test_view_types(self):
+        import spi
+        from astarena import VIEW_TYPES
+        tree = self.makeArenaTree(PROGRAM)
+        for view_type in VIEW_TYPES:
+            self.assertTrue(issubclass(
+                view_type, getattr(spi, view_type.__name__)
+            ))
+        statement = tree.block.compound_statement.children[1]
+        self.assertIsInstance(statement, spi.Assign)
+        # an assignment is no arithmetic operation
+        self.assertNotIsInstance(statement, spi.BinOp)
+        self.assertFalse(hasattr(statement, 'operation'))
+        self.assertIsInstance(statement.right, spi.BinOp)
+        self.assertNotIsInstance(statement.right, spi.UnaryOp)
+        self.assertIsInstance(statement.right.left.left, spi.Num)
+
+    def test_deeply_nested_expression(self):
+        from spi import Lexer, PrecedenceParser
+        from astarena import ASTArena
+        depth = 20000
+        text = 'PROGRAM Test; BEGIN a := %s1%s END.' % (
+            '(' * depth, ')' * depth,
+        )
+        arena = ASTArena.from_tree(PrecedenceParser(Lexer(text)).parse())
+        self.assertEqual(len(arena), 6)
+
+    def test_interpret(self):
+        from spi import Interpreter, SemanticAnalyzer
+        from testutils import RecordingCallStack
+        tree = self.makeArenaTree(PROGRAM)
+        SemanticAnalyzer().visit(tree)
+        interpreter = Interpreter(tree)
+        interpreter.call_stack = RecordingCallStack()
+        interpreter.interpret()
+
+        ar = interpreter.call_stack.last
+        self.assertEqual(ar['a'], 2)
+        self.assertEqual(ar['b'], 25)
+        self.assertAlmostEqual(ar['y'], float(20) / 7 + 3.14)
+
+    def test_semantic_error_position(self):
+        from spi import ErrorCode, SemanticAnalyzer, SemanticError
+        tree = self.makeArenaTree(PROGRAM.replace('-p + 2', '-p + x'))
+        with self.assertRaises(SemanticError) as e:
+            SemanticAnalyzer().visit(tree)
+        self.assertEqual(e.exception.error_code, ErrorCode.ID_NOT_FOUND)
+        self.assertEqual(e.exception.token.value, 'x')
+        self.assertEqual(e.exception.token.lineno, 10)
+        self.assertEqual(e.exception.token.column, 14)
+
+    def test_write_read(self):
+        from astarena import ASTArena
+        tree = self.makeArenaTree(PROGRAM)
+        f = io.BytesIO()
+        tree.arena.write(f)
+        f.seek(0)
+        arena = ASTArena.read(f)
+        self.assertEqual(dump(arena.view()), dump(tree))
+        var_node = arena.view().block.declarations[0].var_node
+        self.assertEqual(var_node.token.lineno, 3)
+
+    def test_write_read_analyzed(self):
+        from astarena import ASTArena
+        from spi import Interpreter, SemanticAnalyzer
+        from testutils import RecordingCallStack
+        tree = self.makeArenaTree(PROGRAM)
+        before = io.BytesIO()
+        tree.arena.write(before)
+        SemanticAnalyzer().visit(tree)
+        f = io.BytesIO()
+        tree.arena.write(f)
+        # the procedure bodies are written as node indices, not with
+        # another copy of the arena
+        self.assertLess(len(f.getvalue()), 2 * len(before.getvalue()))
+        f.seek(0)
+        arena = ASTArena.read(f)
+        proc_symbol = arena.view().block.declarations[-1].proc_symbol
+        self.assertIs(proc_symbol.block_ast.arena, arena)
+
+        interpreter = Interpreter(arena.view())
+        interpreter.call_stack = RecordingCallStack()
+        interpreter.interpret()
+        self.assertEqual(interpreter.call_stack.last['b'], 25)
+
+    def test_read_error(self):
+        from astarena import ASTArena
+        with self.assertRaises(ValueError):
+            ASTArena.read(io.BytesIO(b'\0' * 64))
+
+    def test_pickle(self):
+        tree = self.makeArenaTree(PROGRAM)
+        arena = pickle.loads(pickle.dumps(tree.arena))
+        self.assertEqual(dump(arena.view()), dump(tree))
+        # the arena can still grow after unpickling
+        arena.add_tree(self.makeTree(PROGRAM))
+        self.assertEqual(len(arena.values), len(tree.arena.values))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+from testutils import make_tree
+
+
+PROGRAM = """\
+PROGRAM Test;
+VAR
+   a : INTEGER;
+BEGIN
+   a := 2 + 3
+END.
+"""
+
+
+class ASTCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def makeCache(self, **kwargs):
+        from astcache import ASTCache
+        return ASTCache(self.directory, **kwargs)
+
+    def entries(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_hit(self):
+        from spi import Interpreter
+        cache = self.makeCache()
+        self.assertIsNone(cache.load(PROGRAM))
+        cache.store(PROGRAM, make_tree(PROGRAM))
+
+        tree = cache.load(PROGRAM)
+        self.assertEqual(tree.name, 'Test')
+        interpreter = Interpreter(tree)
+        interpreter.interpret()
+        # bytes of the same source text share the entry
+        self.assertIsNotNone(cache.load(PROGRAM.encode('ascii')))
+
+    def test_mapped_source(self):
+        from spi import BytesLexer, Parser, map_source
+        path = os.path.join(self.directory, 'test.pas')
+        with open(path, 'w') as f:
+            f.write(PROGRAM)
+        source = map_source(path)
+        tree = Parser(BytesLexer(source)).parse()
+
+        cache = self.makeCache()
+        cache.store(source, tree)
+        tree = cache.load(source)
+        source.close()
+        self.assertEqual(tree.block.declarations[0].var_node.token.lineno, 3)
+
+    def test_miss_on_changed_source(self):
+        cache = self.makeCache()
+        cache.store(PROGRAM, make_tree(PROGRAM))
+        self.assertIsNone(cache.load(PROGRAM.replace('3', '4')))
+
+    def test_corrupt_entry(self):
+        cache = self.makeCache()
+        cache.store(PROGRAM, make_tree(PROGRAM))
+        path = cache.path(cache.key(PROGRAM))
+        with open(path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'\0')
+
+        self.assertIsNone(cache.load(PROGRAM))
+        # the corrupt entry is gone, so it gets rebuilt
+        self.assertFalse(os.path.exists(path))
+
+    def test_lru_eviction(self):
+        cache = self.makeCache()
+        texts = [PROGRAM.replace('3', str(n)) for n in range(3)]
+        for n, text in enumerate(texts):
+            cache.store(text, make_tree(text))
+            path = cache.path(cache.key(text))
+            os.utime(path, (n, n))
+        entry_size = os.path.getsize(path)
+
+        # use the oldest entry, then make room for two entries only
+        cache.load(texts[0])
+        cache.max_size = 2 * entry_size
+        cache.evict()
+
+        self.assertEqual(len(self.entries()), 2)
+        self.assertIsNotNone(cache.load(texts[0]))
+        self.assertIsNone(cache.load(texts[1]))
+        self.assertIsNotNone(cache.load(texts[2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
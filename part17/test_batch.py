@@ -0,0 +1,150 @@
+import importlib.util
+import unittest
+
+from testutils import RecordingCallStack, make_tree
+
+HAS_NUMPY = importlib.util.find_spec('numpy') is not None
+
+# {init} assigns the inputs in the scalar runs
+PROGRAM = """\
+PROGRAM Batch;
+VAR
+   a, b, q, m : INTEGER;
+   r, s       : REAL;
+
+PROCEDURE Scale(k : INTEGER);
+BEGIN
+   m := a * k - b
+END;
+
+BEGIN
+   {init}
+   q := a DIV b;
+   r := a / b;
+   s := -r * 2.5 + q;
+   Scale(3)
+END.
+"""
+
+
+@unittest.skipUnless(HAS_NUMPY, 'NumPy is not installed')
+class BatchInterpreterTestCase(unittest.TestCase):
+    def run_batch(self, text, **inputs):
+        from batch import BatchInterpreter
+        return BatchInterpreter(make_tree(text), inputs).interpret()
+
+    def run_scalar(self, text):
+        from spi import Interpreter
+        interpreter = Interpreter(make_tree(text))
+        interpreter.call_stack = RecordingCallStack()
+        interpreter.interpret()
+        return interpreter.call_stack.last
+
+    def test_matches_interpreter(self):
+        import numpy as np
+        a = [-7, 7, -7, 0, 100, -2 ** 40, 2 ** 61]
+        b = [2, -2, -2, 5, -3, 7, 3]
+        results = self.run_batch(
+            PROGRAM.format(init=''), a=np.array(a), b=np.array(b),
+        )
+        self.assertEqual(sorted(results), ['a', 'b', 'm', 'q', 'r', 's'])
+        for i, (a_value, b_value) in enumerate(zip(a, b)):
+            ar = self.run_scalar(PROGRAM.format(
+                init=f'a := {a_value}; b := {b_value};',
+            ))
+            for name, values in results.items():
+                self.assertEqual(values[i], ar[name], (name, i))
+        self.assertEqual(results['q'].dtype, np.int64)
+        self.assertEqual(results['r'].dtype, np.float64)
+
+    def test_constants_are_broadcast(self):
+        import numpy as np
+        results = self.run_batch(
+            'PROGRAM P; VAR a, c : INTEGER; BEGIN c := 7 DIV 2 END.',
+            a=np.arange(3),
+        )
+        self.assertEqual(results['c'].tolist(), [3, 3, 3])
+
+    def test_division_by_zero(self):
+        import numpy as np
+        from spi import ExecutionError
+        for op in ('DIV', '/'):
+            with self.assertRaises(ExecutionError) as cm:
+                self.run_batch(
+                    f'PROGRAM P; VAR a, b : INTEGER; r : REAL; '
+                    f'BEGIN r := a {op} b END.',
+                    a=np.arange(4), b=np.array([1, 2, 0, 0]),
+                )
+            self.assertIn('in batch element 2', cm.exception.message)
+
+    def test_unassigned_variable(self):
+        import numpy as np
+        from spi import ExecutionError
+        with self.assertRaises(ExecutionError):
+            self.run_batch(
+                'PROGRAM P; VAR a, b : INTEGER; BEGIN a := a + b END.',
+                a=np.arange(4),
+            )
+
+    def test_integer_overflow(self):
+        import numpy as np
+        from batch import BatchError
+        big = 2 ** 62
+        for expr, values in [
+            ('a * a', [3, 2 ** 32]),
+            ('a * 3', [1, big]),
+            ('a + a', [1, big]),
+            ('-a - a', [1, big + 1]),
+            ('-a', [1, -2 ** 63]),
+            ('a DIV -1', [1, -2 ** 63]),
+        ]:
+            with self.assertRaises(BatchError, msg=expr) as cm:
+                self.run_batch(
+                    f'PROGRAM P; VAR a : INTEGER; BEGIN a := {expr} END.',
+                    a=np.array(values, dtype=np.int64),
+                )
+            self.assertIn('in batch element 1', cm.exception.message)
+        results = self.run_batch(
+            'PROGRAM P; VAR a : INTEGER; BEGIN a := a * 2 - 1 END.',
+            a=np.array([big - 1, 1 - big]),
+        )
+        self.assertEqual(results['a'].tolist(), [2 * big - 3, 1 - 2 * big])
+
+    def test_large_constant(self):
+        import numpy as np
+        from batch import BatchError
+        with self.assertRaises(BatchError):
+            self.run_batch(
+                'PROGRAM P; VAR a : INTEGER; '
+                'BEGIN a := a + 99999999999999999999 END.',
+                a=np.arange(4),
+            )
+
+    def test_invalid_inputs(self):
+        import numpy as np
+        from batch import BatchError
+        text = 'PROGRAM P; VAR a, b : INTEGER; r : REAL; BEGIN END.'
+        for inputs in [
+            {},
+            {'c': np.arange(3)},
+            {'a': np.arange(3), 'b': np.arange(4)},
+            {'a': np.zeros((2, 2), dtype=np.int64)},
+            {'a': np.array([1.5])},
+            {'a': np.array([2 ** 63], dtype=np.uint64)},
+            {'r': np.array(['x'])},
+        ]:
+            with self.assertRaises(BatchError, msg=inputs):
+                self.run_batch(text, **inputs)
+
+
+@unittest.skipIf(HAS_NUMPY, 'NumPy is installed')
+class NoNumpyTestCase(unittest.TestCase):
+    def test_batch_needs_numpy(self):
+        from batch import BatchError, BatchInterpreter
+        tree = make_tree('PROGRAM P; VAR a : INTEGER; BEGIN END.')
+        with self.assertRaises(BatchError):
+            BatchInterpreter(tree, {'a': [1, 2]})
+
+
+if __name__ == '__main__':
+    unittest.main()
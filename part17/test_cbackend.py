@@ -0,0 +1,142 @@
+import subprocess
+import unittest
+
+from test_vm import PROGRAM
+from testutils import RecordingCallStack, make_tree
+
+
+def has_compiler():
+    from cbackend import find_compiler
+    return find_compiler() is not None
+
+
+# programs whose native output must match the Python backend
+CONFORMANCE = [
+    PROGRAM,
+    """\
+PROGRAM Division;
+VAR a, b, c, d : INTEGER;
+    r, s, t, u : REAL;
+BEGIN
+   a := -7 DIV 2;
+   b := 7 DIV -2;
+   c := -7 DIV -2;
+   d := 0 - 9223372036854775807;
+   r := 7.5 DIV -2;
+   s := -1 / 3;
+   t := 10000000000000000 / 1;
+   u := 1 / 20000;
+END.
+""",
+    """\
+PROGRAM Unassigned;
+VAR x, y : INTEGER;
+PROCEDURE P(a : INTEGER);
+VAR b : INTEGER;
+   PROCEDURE Q(c : INTEGER);
+   BEGIN
+      x := c
+   END;
+BEGIN
+   y := b;
+   Q(b)
+END;
+BEGIN
+   P(1)
+END.
+""",
+    """\
+PROGRAM ZeroDivision;
+VAR x, y : INTEGER;
+BEGIN
+   y := 0;
+   x := 7 DIV y
+END.
+""",
+    """\
+PROGRAM NoneOperand;
+VAR x, y : INTEGER;
+BEGIN
+   x := 2 * y
+END.
+""",
+]
+
+
+class CBackendTestCase(unittest.TestCase):
+    def expected_output(self, text):
+        """Return the output of the program run by the Python backend."""
+        from spi import ExecutionError
+        from pybackend import PythonInterpreter
+        interpreter = PythonInterpreter(make_tree(text))
+        interpreter.call_stack = RecordingCallStack()
+        try:
+            interpreter.interpret()
+        except ExecutionError as e:
+            return e.message + '\n'
+        return str(interpreter.call_stack.last) + '\n'
+
+    def test_emit(self):
+        from cbackend import CCompiler
+        c_source = CCompiler().compile(make_tree(PROGRAM))
+        self.assertIn('int main(void)', c_source)
+        # Beta reaches the variables of Main through two static links
+        self.assertIn('f->link->link->v1 = ', c_source)
+
+    def test_type_mismatch(self):
+        from cbackend import CBackendError, CCompiler
+        tree = make_tree('PROGRAM T; VAR r : REAL; BEGIN r := 1 END.')
+        with self.assertRaises(CBackendError) as cm:
+            CCompiler().compile(tree)
+        self.assertEqual(
+            cm.exception.message,
+            'CBackendError: INTEGER value where REAL is expected -> '
+            'Token(TokenType.INTEGER_CONST, 1, position=1:37)',
+        )
+
+    @unittest.skipUnless(has_compiler(), 'no C compiler')
+    def test_conformance(self):
+        from cbackend import CCompiler, run_native
+        for text in CONFORMANCE:
+            with self.subTest(program=text.split(';')[0]):
+                c_source = CCompiler().compile(make_tree(text))
+                result = run_native(
+                    c_source,
+                    stdout=subprocess.PIPE,
+                    universal_newlines=True,
+                )
+                self.assertEqual(result.stdout, self.expected_output(text))
+                self.assertEqual(
+                    result.returncode, 'Error' in result.stdout,
+                )
+
+    @unittest.skipUnless(has_compiler(), 'no C compiler')
+    def test_special_constants(self):
+        from cbackend import CCompiler, run_native
+        from constfold import ConstantFolder
+        big = '1' + '0' * 400 + '.0'
+        text = f"""\
+PROGRAM Special;
+VAR i : INTEGER;
+    r, s, t : REAL;
+BEGIN
+   i := 0 - 9223372036854775807 - 1;
+   r := {big};
+   s := 0 - {big};
+   t := {big} - {big}
+END.
+"""
+        tree = make_tree(text)
+        ConstantFolder().visit(tree)
+        c_source = CCompiler().compile(tree)
+        self.assertIn('(-INT64_C(9223372036854775807) - 1)', c_source)
+        self.assertIn('NAN', c_source)
+        result = run_native(
+            c_source, stdout=subprocess.PIPE, universal_newlines=True,
+        )
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, self.expected_output(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
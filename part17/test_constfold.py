@@ -0,0 +1,76 @@
+import unittest
+
+
+class ConstantFolderTestCase(unittest.TestCase):
+    def fold(self, expression):
+        """Fold `x := expression` and return the folded expression."""
+        from spi import Lexer, Parser, SemanticAnalyzer
+        from constfold import ConstantFolder
+        text = f"""\
+PROGRAM Test;
+VAR x, y : INTEGER;
+BEGIN
+   x := {expression}
+END.
+"""
+        tree = Parser(Lexer(text)).parse()
+        SemanticAnalyzer().visit(tree)
+        folder = ConstantFolder()
+        folder.visit(tree)
+        assign = tree.block.compound_statement.children[0]
+        return assign.right, folder.eliminated
+
+    def dump(self, node):
+        kind = type(node).__name__
+        if kind == 'BinOp':
+            return '({} {} {})'.format(
+                self.dump(node.left), node.op.value, self.dump(node.right),
+            )
+        if kind == 'UnaryOp':
+            return node.op.value + self.dump(node.expr)
+        return repr(node.value)
+
+    def assertFolds(self, expression, expected, eliminated):
+        node, count = self.fold(expression)
+        self.assertEqual(self.dump(node), expected)
+        self.assertEqual(count, eliminated)
+
+    def test_constants(self):
+        self.assertFolds('2 + 3 * 4', '14', 4)
+        self.assertFolds('7 DIV 2 - 1.5', '1.5', 4)
+        # 2 - 1 is folded, then (y + 3) * 1 is simplified
+        self.assertFolds('(y + 3) * (2 - 1)', "('y' + 3)", 4)
+        self.assertFolds('10 / 4', '2.5', 2)
+
+    def test_position(self):
+        node, _ = self.fold('2 + 3')
+        self.assertEqual((node.token.lineno, node.token.column), (4, 11))
+
+    def test_failing_operation_is_kept(self):
+        self.assertFolds('y + 1 DIV 0', "('y' + (1 DIV 0))", 0)
+        self.assertFolds('1 DIV (2 - 2)', '(1 DIV 0)', 2)
+
+    def test_unary_chains(self):
+        self.assertFolds('- - - 5', '-5', 3)
+        self.assertFolds('- - (y * 2)', "('y' * 2)", 2)
+        self.assertFolds('+ - - (y * 2)', "('y' * 2)", 3)
+        self.assertFolds('- + - - (y * 2)', "-('y' * 2)", 3)
+        # the innermost sign fails if y is unassigned
+        self.assertFolds('+ - + - y', "--'y'", 2)
+        self.assertFolds('- + + y', "-+'y'", 1)
+        self.assertFolds('- - - y', "-'y'", 2)
+        self.assertFolds('+ + y', "+'y'", 1)
+
+    def test_identities(self):
+        self.assertFolds('(y + 2) * 1', "('y' + 2)", 2)
+        self.assertFolds('1 * -y', "-'y'", 2)
+        self.assertFolds('(y * 2) - 0', "('y' * 2)", 2)
+        # y may be unassigned or a REAL
+        self.assertFolds('y * 1', "('y' * 1)", 0)
+        self.assertFolds('(y + 2) + 0', "(('y' + 2) + 0)", 0)
+        self.assertFolds('(y + 2) * 1.0', "(('y' + 2) * 1.0)", 0)
+        self.assertFolds('0 * (y + 2)', "(0 * ('y' + 2))", 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
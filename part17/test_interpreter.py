@@ -1,5 +1,7 @@
 import unittest
 
+from testutils import RecordingCallStack
+
 
 class LexerTestCase(unittest.TestCase):
     def makeLexer(self, text):
@@ -39,6 +41,179 @@ class LexerTestCase(unittest.TestCase):
         with self.assertRaises(LexerError):
             lexer.get_next_token()
 
+    def test_comments(self):
+        lexer = self.makeLexer('{ one }{two\n}  \n\t { three } a')
+        token = lexer.get_next_token()
+        self.assertEqual(token.value, 'a')
+        self.assertEqual((token.lineno, token.column), (3, 13))
+
+    def test_unterminated_comment(self):
+        from spi import LexerError, ErrorCode
+        lexer = self.makeLexer('a\n  { no closing brace')
+        lexer.get_next_token()
+        with self.assertRaises(LexerError) as cm:
+            lexer.get_next_token()
+        self.assertEqual(cm.exception.error_code, ErrorCode.UNTERMINATED_COMMENT)
+        self.assertEqual(
+            cm.exception.message,
+            "LexerError: Lexer error on '{' line: 2 column: 3 "
+            "(Unterminated comment)",
+        )
+
+    def test_token_position(self):
+        lexer = self.makeLexer('a :=\n  {x}  b1')
+        lexer.get_next_token()
+        lexer.get_next_token()
+        token = lexer.get_next_token()
+        self.assertEqual((token.pos, token.length), (12, 2))
+        self.assertEqual((token.lineno, token.column), (2, 8))
+
+
+class RegexLexerTestCase(LexerTestCase):
+    def makeLexer(self, text):
+        from spi import RegexLexer
+        lexer = RegexLexer(text)
+        return lexer
+
+    def test_same_tokens_as_lexer(self):
+        from spi import Lexer, TokenType
+        text = """\
+PROGRAM Test;  { a comment
+                 spanning two lines }
+VAR
+   a, b1 : INTEGER;
+   y     : REAL;
+BEGIN
+   a := 2; b1 := a DIV 4;
+   y := (20 / 7) + 3.14 - 5.
+END.
+"""
+
+        def tokens(lexer):
+            result = []
+            while True:
+                token = lexer.get_next_token()
+                result.append(
+                    (token.type, token.value, token.lineno, token.column)
+                )
+                if token.type == TokenType.EOF:
+                    return result
+
+        self.assertEqual(
+            tokens(self.makeLexer(text)),
+            tokens(Lexer(text)),
+        )
+
+    def test_lexer_exception_position(self):
+        from spi import LexerError
+        lexer = self.makeLexer('a :=\n  { comment }  <')
+        lexer.get_next_token()
+        lexer.get_next_token()
+        with self.assertRaises(LexerError) as cm:
+            lexer.get_next_token()
+        self.assertEqual(
+            cm.exception.message,
+            "LexerError: Lexer error on '<' line: 2 column: 16",
+        )
+
+
+class BytesLexerTestCase(RegexLexerTestCase):
+    def makeLexer(self, text):
+        from spi import BytesLexer
+        lexer = BytesLexer(text.encode('ascii'))
+        return lexer
+
+    def test_non_ascii_byte_error(self):
+        from spi import BytesLexer, LexerError
+        lexer = BytesLexer('a := 1 \u00e9'.encode('utf-8'))
+        for _ in range(3):
+            lexer.get_next_token()
+        with self.assertRaises(LexerError) as cm:
+            lexer.get_next_token()
+        self.assertEqual(
+            cm.exception.message,
+            'LexerError: Lexer error on non-ASCII byte 0xc3 line: 1 column: 8',
+        )
+
+    def test_non_ascii_comment(self):
+        from spi import BytesLexer, TokenType
+        lexer = BytesLexer('{ caf\u00e9 } a'.encode('utf-8'))
+        self.assertEqual(lexer.get_next_token().value, 'a')
+        self.assertEqual(lexer.get_next_token().type, TokenType.EOF)
+
+    def test_map_source(self):
+        import os
+        import tempfile
+        from spi import BytesLexer, Parser, map_source
+        with tempfile.NamedTemporaryFile('w', suffix='.pas', delete=False) as f:
+            f.write('PROGRAM Test;\nBEGIN\nEND.\n')
+        try:
+            source = map_source(f.name)
+            tree = Parser(BytesLexer(source)).parse()
+            self.assertEqual(tree.name, 'Test')
+            source.close()
+        finally:
+            os.remove(f.name)
+
+
+class TokenBufferTestCase(unittest.TestCase):
+    text = """\
+PROGRAM Test;
+VAR
+   a : INTEGER;
+   y : REAL;
+BEGIN
+   a := 3; y := 3.0 / a
+END.
+"""
+
+    def test_same_tokens_as_lexer(self):
+        from spi import Lexer, TokenBuffer, TokenType
+        tokens = TokenBuffer.from_lexer(Lexer(self.text))
+        lexer = Lexer(self.text)
+        for token in tokens:
+            expected = lexer.get_next_token()
+            self.assertEqual(
+                (token.type, token.value, token.lineno, token.column),
+                (expected.type, expected.value,
+                 expected.lineno, expected.column),
+            )
+            # 3 and 3.0 are kept apart in the side table
+            self.assertIs(type(token.value), type(expected.value))
+        self.assertEqual(tokens[-1].type, TokenType.EOF)
+
+    def test_compact_storage(self):
+        from spi import Lexer, TokenBuffer, TOKEN_TYPES, TokenType
+        tokens = TokenBuffer.from_lexer(Lexer(self.text))
+        self.assertEqual(tokens.kinds.typecode, 'B')
+        self.assertEqual(TOKEN_TYPES[tokens.kinds[0]], TokenType.PROGRAM)
+        # 'a' is stored once in the side table but used three times
+        self.assertEqual(tokens.values.count('a'), 1)
+
+    def test_type_codes(self):
+        import spi
+        for token_type, code in spi.TOKEN_CODES.items():
+            self.assertEqual(getattr(spi, token_type.name), code)
+
+    def test_get_next_token(self):
+        from spi import Lexer, TokenBuffer, TokenType
+        tokens = TokenBuffer.from_lexer(Lexer('a'))
+        self.assertEqual(tokens.get_next_token().value, 'a')
+        self.assertEqual(tokens.get_next_token().type, TokenType.EOF)
+        self.assertEqual(tokens.get_next_token().type, TokenType.EOF)
+        tokens.rewind()
+        self.assertEqual(tokens.get_next_token().value, 'a')
+
+    def test_tokenize(self):
+        from spi import LEXERS, TokenType, tokenize
+        for lexer_class in LEXERS.values():
+            tokens = tokenize('a := 2', lexer_class)
+            self.assertEqual(
+                [token.type for token in tokens],
+                [TokenType.ID, TokenType.ASSIGN, TokenType.INTEGER_CONST,
+                 TokenType.EOF],
+            )
+
 
 class ParserTestCase(unittest.TestCase):
     def makeParser(self, text):
@@ -129,6 +304,199 @@ class ParserTestCase(unittest.TestCase):
         self.assertEqual(the_exception.token.value, 'VAR')
         self.assertEqual(the_exception.token.lineno, 5)  # second VAR
 
+    def test_peek(self):
+        from spi import EOF, ID, PROGRAM, SEMI, TokenType
+        parser = self.makeParser('PROGRAM Test;')
+        self.assertEqual(parser.peek().value, 'Test')
+        self.assertEqual(parser.peek(2).type, TokenType.SEMI)
+        self.assertEqual(parser.peek(3).type, TokenType.EOF)
+        self.assertEqual(parser.peek(4).type, TokenType.EOF)
+        self.assertEqual(parser.peek_kind(2), SEMI)
+        self.assertEqual(parser.peek_kind(4), EOF)
+        # peeking does not consume tokens
+        self.assertEqual(parser.kind, PROGRAM)
+        self.assertEqual(parser.current_token.type, TokenType.PROGRAM)
+        parser.eat(PROGRAM)
+        self.assertEqual(parser.kind, ID)
+        self.assertEqual(parser.current_token.value, 'Test')
+
+    def test_procedure_call_statement(self):
+        from spi import Assign, ProcedureCall
+        parser = self.makeParser(
+            """
+            PROGRAM Test;
+            VAR
+                a : INTEGER;
+            PROCEDURE Alpha(x : INTEGER);
+            BEGIN
+            END;
+            BEGIN
+               Alpha (1 + 2);
+               a := (3)
+            END.
+            """
+        )
+        tree = parser.parse()
+        call, assign = tree.block.compound_statement.children
+        self.assertIsInstance(call, ProcedureCall)
+        self.assertEqual(call.proc_name, 'Alpha')
+        self.assertIsInstance(assign, Assign)
+
+    def test_node_tokens(self):
+        from spi import TokenType
+        parser = self.makeParser(
+            """
+            PROGRAM Test;
+            VAR
+                a : REAL;
+            BEGIN
+               a := - 2.5 * a
+            END.
+            """
+        )
+        tree = parser.parse()
+        var_decl = tree.block.declarations[0]
+        assign = tree.block.compound_statement.children[0]
+        binop = assign.right
+        # nodes keep only what later passes need, not the tokens
+        self.assertFalse(hasattr(binop, '__dict__'))
+        self.assertEqual(binop.op, TokenType.MUL)
+        for node, token_type, value, column in (
+            (var_decl.var_node, TokenType.ID, 'a', 17),
+            (var_decl.type_node, TokenType.REAL, 'REAL', 21),
+            (assign, TokenType.ASSIGN, ':=', 18),
+            (binop, TokenType.MUL, '*', 27),
+            (binop.left, TokenType.MINUS, '-', 21),
+            (binop.left.expr, TokenType.REAL_CONST, 2.5, 23),
+            (binop.right, TokenType.ID, 'a', 29),
+        ):
+            token = node.token
+            self.assertEqual(
+                (token.type, token.value, token.column),
+                (token_type, value, column),
+            )
+
+    def test_operations(self):
+        import operator
+        from spi import float_div
+        parser = self.makeParser(
+            """
+            PROGRAM Test;
+            VAR
+                a : REAL;
+            BEGIN
+               a := -a + a - +a * a DIV a / a
+            END.
+            """
+        )
+        tree = parser.parse()
+        # the operations are looked up once, when the nodes are created
+        sub = tree.block.compound_statement.children[0].right
+        add, div = sub.left, sub.right
+        self.assertIs(sub.operation, operator.sub)
+        self.assertIs(add.operation, operator.add)
+        self.assertIs(add.left.operation, operator.neg)
+        self.assertIs(div.operation, float_div)
+        self.assertIs(div.left.operation, operator.floordiv)
+        self.assertIs(div.left.left.operation, operator.mul)
+        self.assertIs(div.left.left.left.operation, operator.pos)
+
+
+class TokenBufferParserTestCase(ParserTestCase):
+    def makeParser(self, text):
+        from spi import Lexer, Parser, TokenBuffer
+        tokens = TokenBuffer.from_lexer(Lexer(text))
+        parser = Parser(tokens)
+        return parser
+
+    def test_cursor(self):
+        from spi import EOF
+        parser = self.makeParser('PROGRAM Test; BEGIN END.')
+        parser.parse()
+        # the buffer is left on EOF, as by get_next_token
+        self.assertEqual(parser.lexer.cursor, len(parser.lexer) - 1)
+        self.assertEqual(parser.kind, EOF)
+
+
+class PrecedenceParserTestCase(ParserTestCase):
+    def makeParser(self, text):
+        from spi import Lexer, PrecedenceParser
+        lexer = Lexer(text)
+        parser = PrecedenceParser(lexer)
+        return parser
+
+    def dump(self, node):
+        from spi import BinOp, UnaryOp
+        if isinstance(node, BinOp):
+            return (node.op.value, self.dump(node.left), self.dump(node.right))
+        if isinstance(node, UnaryOp):
+            return (node.op.value, self.dump(node.expr))
+        return node.value
+
+    def test_same_tree_as_parser(self):
+        from spi import Lexer, Parser
+        for expr in (
+            '3',
+            '2 + 7 * 4',
+            '7 - 8 DIV 4 / x',
+            '7 + 3 * (10 DIV (12 DIV (3 + 1) - 1)) DIV (2 + 3) - 5 - 3 + (8)',
+            '- 3 * 2',
+            '2 * - 3 + 1',
+            '5 - - - + - (3 + 4) - +2',
+            '((a))',
+        ):
+            self.assertEqual(
+                self.dump(self.makeParser(expr).expr()),
+                self.dump(Parser(Lexer(expr)).expr()),
+                expr,
+            )
+
+    def test_deep_nesting(self):
+        depth = 20000
+        node = self.makeParser('(' * depth + '1' + ')' * depth).expr()
+        self.assertEqual(node.value, 1)
+
+        node = self.makeParser('- ' * depth + '1').expr()
+        for _ in range(depth):
+            node = node.expr
+        self.assertEqual(node.value, 1)
+
+    def test_missing_rparen(self):
+        from spi import ParserError, TokenType
+        parser = self.makeParser('(1 + (2 * 3);')
+        with self.assertRaises(ParserError) as cm:
+            parser.expr()
+        self.assertEqual(cm.exception.token.type, TokenType.SEMI)
+
+
+class NodeVisitorTestCase(unittest.TestCase):
+    def test_dispatch(self):
+        from spi import NodeVisitor, NoOp, Num, Token, TokenType
+
+        class Visitor(NodeVisitor):
+            def visit_Num(self, node):
+                return node.value
+
+            def generic_visit(self, node):
+                return type(node).__name__
+
+        class OtherVisitor(NodeVisitor):
+            def visit_NoOp(self, node):
+                return 'other'
+
+        num = Num(Token(TokenType.INTEGER_CONST, 3))
+        self.assertEqual(Visitor().visit(num), 3)
+        self.assertEqual(Visitor().visit(NoOp()), 'NoOp')
+        # the tables of different visitor classes are kept apart
+        self.assertEqual(OtherVisitor().visit(NoOp()), 'other')
+        self.assertEqual(Visitor().visit(NoOp()), 'NoOp')
+
+    def test_no_visit_method(self):
+        from spi import NodeVisitor, NoOp
+        with self.assertRaises(Exception) as cm:
+            NodeVisitor().visit(NoOp())
+        self.assertEqual(str(cm.exception), 'No visit_NoOp method')
+
 
 class SemanticAnalyzerTestCase(unittest.TestCase):
     def runSemanticAnalyzer(self, text):
@@ -177,34 +545,212 @@ class SemanticAnalyzerTestCase(unittest.TestCase):
         self.assertEqual(the_exception.error_code, ErrorCode.ID_NOT_FOUND)
         self.assertEqual(the_exception.token.value, 'b')
 
+    def test_procedure_not_found_error(self):
+        from spi import SemanticError, ErrorCode
+        with self.assertRaises(SemanticError) as cm:
+            self.runSemanticAnalyzer(
+            """
+            PROGRAM Test;
+            VAR
+                a : INTEGER;
+            BEGIN
+               Alpha(a);
+            END.
+            """
+            )
+        self.assertEqual(cm.exception.error_code, ErrorCode.ID_NOT_FOUND)
+        self.assertEqual(cm.exception.token.value, 'Alpha')
 
-class TestCallStack:
-    def __init__(self):
-        self._records = []
+    def test_wrong_number_of_arguments_error(self):
+        from spi import SemanticError, ErrorCode
+        for call in ('Alpha(a)', 'Alpha(a, 2, 3)'):
+            with self.assertRaises(SemanticError, msg=call) as cm:
+                self.runSemanticAnalyzer(
+                f"""
+                PROGRAM Test;
+                VAR
+                    a : INTEGER;
+                PROCEDURE Alpha(x : INTEGER; y : INTEGER);
+                BEGIN
+                END;
+                BEGIN
+                   {call};
+                END.
+                """
+                )
+            self.assertEqual(
+                cm.exception.error_code, ErrorCode.WRONG_PARAMS_NUM,
+            )
+            self.assertEqual(cm.exception.token.value, 'Alpha')
 
-    def push(self, ar):
-        self._records.append(ar)
+    def test_unary_operand_id_not_found_error(self):
+        from spi import SemanticError, ErrorCode
+        with self.assertRaises(SemanticError) as cm:
+            self.runSemanticAnalyzer(
+            """
+            PROGRAM Test;
+            VAR
+                a : INTEGER;
+            BEGIN
+               a := -b;
+            END.
+            """
+            )
+        self.assertEqual(cm.exception.error_code, ErrorCode.ID_NOT_FOUND)
+        self.assertEqual(cm.exception.token.value, 'b')
 
-    def pop(self):
-        # do nothing
-        pass
+    def test_procedure_used_as_variable_error(self):
+        from spi import SemanticError, ErrorCode
+        for statement in ('a := Alpha', 'Alpha := a', 'a := -Alpha'):
+            with self.assertRaises(SemanticError, msg=statement) as cm:
+                self.runSemanticAnalyzer(
+                f"""
+                PROGRAM Test;
+                VAR
+                    a : INTEGER;
+                PROCEDURE Alpha;
+                BEGIN
+                END;
+                BEGIN
+                   {statement};
+                END.
+                """
+                )
+            self.assertEqual(cm.exception.error_code, ErrorCode.ID_NOT_FOUND)
+
+    def test_variable_addresses(self):
+        from spi import Lexer, Parser, SemanticAnalyzer
+        tree = Parser(Lexer(
+            """
+            PROGRAM Test;
+            VAR
+                a, b : INTEGER;
+            PROCEDURE P1(x : REAL);
+            VAR
+                a : REAL;
+            BEGIN
+               a := x + b
+            END;
+            BEGIN
+               b := 5;
+            END.
+            """
+        )).parse()
+        SemanticAnalyzer().visit(tree)
+
+        self.assertEqual(tree.var_names, ('a', 'b'))
+        proc_decl = tree.block.declarations[2]
+        self.assertEqual(proc_decl.var_names, ('x', 'a'))
+
+        assign = proc_decl.block_node.compound_statement.children[0]
+        self.assertEqual((assign.left.depth, assign.left.slot), (2, 1))
+        x, b = assign.right.left, assign.right.right
+        self.assertEqual((x.depth, x.slot), (2, 0))
+        self.assertEqual((b.depth, b.slot), (1, 1))
+
+
+class CallStackTestCase(unittest.TestCase):
+    def makeRecord(self, name, nesting_level):
+        from spi import ActivationRecord, ARType
+        return ActivationRecord(
+            name=name,
+            type=ARType.PROGRAM,
+            nesting_level=nesting_level,
+        )
 
-    def peek(self):
-        return self._records[-1]
+    def test_display(self):
+        from spi import CallStack
+        call_stack = CallStack()
+        main = self.makeRecord('Main', 1)
+        alpha = self.makeRecord('Alpha', 2)
+        beta = self.makeRecord('Beta', 3)
+        # Alpha calls its nested procedure Beta, which calls Alpha again
+        alpha2 = self.makeRecord('Alpha', 2)
+        call_stack.push(main)
+        call_stack.push(alpha)
+        call_stack.push(beta)
+        self.assertEqual(call_stack.display, [None, main, alpha, beta])
+
+        call_stack.push(alpha2)
+        self.assertEqual(call_stack.display[:3], [None, main, alpha2])
+
+        # leaving the inner Alpha makes the outer one visible again
+        call_stack.pop()
+        self.assertEqual(call_stack.display, [None, main, alpha, beta])
+        call_stack.pop()
+        call_stack.pop()
+        self.assertIs(call_stack.display[1], main)
+        call_stack.pop()
+        self.assertIsNone(call_stack.display[1])
+
+
+class FramePoolTestCase(unittest.TestCase):
+    def makeSymbol(self):
+        from spi import Lexer, Parser, SemanticAnalyzer
+        tree = Parser(Lexer(
+            """
+            PROGRAM Test;
+            PROCEDURE Alpha(a : INTEGER);
+            VAR b : REAL;
+            BEGIN
+            END;
+            BEGIN
+            END.
+            """
+        )).parse()
+        SemanticAnalyzer().visit(tree)
+        return tree.block.declarations[0].proc_symbol
+
+    def test_acquire(self):
+        from spi import ARType, FramePool
+        proc_symbol = self.makeSymbol()
+        ar = FramePool().acquire(proc_symbol)
+        self.assertEqual(ar.name, 'Alpha')
+        self.assertEqual(ar.type, ARType.PROCEDURE)
+        self.assertEqual(ar.nesting_level, 2)
+        self.assertEqual(ar.names, ('a', 'b'))
+        self.assertEqual(ar.slots, [None, None])
+
+    def test_reuse(self):
+        from spi import FramePool
+        proc_symbol = self.makeSymbol()
+        pool = FramePool()
+        ar = pool.acquire(proc_symbol)
+        # a recursive call needs a second record
+        ar2 = pool.acquire(proc_symbol)
+        self.assertIsNot(ar2, ar)
+        ar.slots[:] = [1, 2.5]
+        pool.release(proc_symbol, ar)
+        pool.release(proc_symbol, ar2)
+
+        self.assertIn(pool.acquire(proc_symbol), (ar, ar2))
+        self.assertIn(pool.acquire(proc_symbol), (ar, ar2))
+        self.assertEqual(ar.slots, [None, None])
 
 
 class InterpreterTestCase(unittest.TestCase):
-    def makeInterpreter(self, text):
-        from spi import Lexer, Parser, SemanticAnalyzer, Interpreter
+    """Runs the tests with the engine returned by makeEngine.
+
+    The subclasses test the other execution engines by overriding it.
+    """
+    def makeEngine(self, tree):
+        from spi import Interpreter
+        return Interpreter(tree)
+
+    def makeInterpreter(self, text, typecheck=False):
+        from spi import Lexer, Parser, SemanticAnalyzer
         lexer = Lexer(text)
         parser = Parser(lexer)
         tree = parser.parse()
 
         semantic_analyzer = SemanticAnalyzer()
         semantic_analyzer.visit(tree)
+        if typecheck:
+            from typecheck import TypeChecker
+            TypeChecker().visit(tree)
 
-        interpreter = Interpreter(tree)
-        interpreter.call_stack = TestCallStack()
+        interpreter = self.makeEngine(tree)
+        interpreter.call_stack = RecordingCallStack()
         return interpreter
 
     def test_integer_arithmetic_expressions(self):
@@ -231,7 +777,7 @@ class InterpreterTestCase(unittest.TestCase):
                 """ % expr
             )
             interpreter.interpret()
-            ar = interpreter.call_stack.peek()
+            ar = interpreter.call_stack.last
             self.assertEqual(ar['a'], result)
 
     def test_float_arithmetic_expressions(self):
@@ -250,9 +796,73 @@ class InterpreterTestCase(unittest.TestCase):
                 """ % expr
             )
             interpreter.interpret()
-            ar = interpreter.call_stack.peek()
+            ar = interpreter.call_stack.last
             self.assertEqual(ar['a'], result)
 
+    def test_unassigned_operand(self):
+        from spi import ExecutionError
+        for expr in ('+b', '-b', 'b + 1'):
+            interpreter = self.makeInterpreter(
+                """PROGRAM Test;
+                   VAR
+                       a, b : INTEGER;
+                   BEGIN
+                       a := %s
+                   END.
+                """ % expr
+            )
+            # the Python backend reports the TypeError as the cause of
+            # an ExecutionError with the position of the operation
+            with self.assertRaises((TypeError, ExecutionError)) as cm:
+                interpreter.interpret()
+            error = cm.exception
+            if isinstance(error, ExecutionError):
+                error = error.__cause__
+            self.assertIsInstance(error, TypeError)
+
+    def test_typechecked_float_division(self):
+        from spi import ExecutionError
+        interpreter = self.makeInterpreter(
+            """PROGRAM Test;
+               VAR
+                   r, s, t, u, v : REAL;
+               BEGIN
+                   r := 10000000000000001;
+                   s := r / 3;
+                   t := s / 2.5;
+                   u := 1.5 / (r / 7);
+                   v := (r * 2.0) / r
+               END.
+            """,
+            typecheck=True,
+        )
+        interpreter.interpret()
+        ar = interpreter.call_stack.last
+        # the REAL variable r holds an int
+        r = 10000000000000001
+        self.assertEqual(ar['s'], float(r) / 3.0)
+        self.assertEqual(ar['t'], float(r) / 3.0 / 2.5)
+        self.assertEqual(ar['u'], 1.5 / (float(r) / 7.0))
+        self.assertEqual(ar['v'], (r * 2.0) / float(r))
+
+        for expr in ('r / 2.5', '2.5 / r'):
+            interpreter = self.makeInterpreter(
+                """PROGRAM Test;
+                   VAR
+                       r, s : REAL;
+                   BEGIN
+                       s := %s
+                   END.
+                """ % expr,
+                typecheck=True,
+            )
+            with self.assertRaises((TypeError, ExecutionError)) as cm:
+                interpreter.interpret()
+            error = cm.exception
+            if isinstance(error, ExecutionError):
+                error = error.__cause__
+            self.assertIsInstance(error, TypeError)
+
     def test_procedure_call(self):
         text = """\
 program Main;
@@ -272,6 +882,39 @@ end.  { Main }
         interpreter = self.makeInterpreter(text)
         interpreter.interpret()
 
+    def test_procedure_call_execution(self):
+        text = """\
+program Main;
+var x, y : integer;
+
+procedure Alpha(a : integer; b : integer);
+var z : integer;
+   procedure Beta(c : integer);
+   begin
+      z := z + c;
+      x := x + z
+   end;
+begin
+   z := a * b;
+   Beta(a);
+   Beta(b);
+   y := z
+end;
+
+begin { Main }
+   x := 1;
+   Alpha(3 + 5, 7);
+   Alpha(2, 1)
+end.  { Main }
+"""
+        interpreter = self.makeInterpreter(text)
+        interpreter.interpret()
+
+        ar = interpreter.call_stack.last
+        # z = 56, 64, 71 in the first call and 2, 4, 5 in the second
+        self.assertEqual(ar['x'], 1 + 64 + 71 + 4 + 5)
+        self.assertEqual(ar['y'], 5)
+
     def test_program(self):
         text = """\
 PROGRAM Part12;
@@ -304,7 +947,7 @@ END.  {Part12}
         interpreter = self.makeInterpreter(text)
         interpreter.interpret()
 
-        ar = interpreter.call_stack.peek()
+        ar = interpreter.call_stack.last
         self.assertEqual(len(ar.members.keys()), 4)
         self.assertEqual(ar['number'], 2)
         self.assertEqual(ar['a'], 2)
@@ -312,5 +955,57 @@ END.  {Part12}
         self.assertAlmostEqual(ar['y'], float(20) / 7 + 3.14)  # 5.9971...
 
 
+class ClosureInterpreterTestCase(InterpreterTestCase):
+    def makeEngine(self, tree):
+        from closures import ClosureInterpreter
+        return ClosureInterpreter(tree)
+
+    def test_run_twice(self):
+        interpreter = self.makeInterpreter(
+            """PROGRAM Test;
+               VAR
+                   a : INTEGER;
+               BEGIN
+                   a := 2;
+                   a := a * 3 + 1
+               END.
+            """
+        )
+        for _ in range(2):
+            interpreter.interpret()
+            self.assertEqual(interpreter.call_stack.last['a'], 7)
+
+
+class VMTestCase(InterpreterTestCase):
+    def makeEngine(self, tree):
+        from vm import VM, BytecodeCompiler
+        return VM(BytecodeCompiler().compile(tree))
+
+
+class RegisterVMTestCase(InterpreterTestCase):
+    def makeEngine(self, tree):
+        from regvm import RegisterVM, compile_program
+        return RegisterVM(compile_program(tree))
+
+
+class PythonInterpreterTestCase(InterpreterTestCase):
+    def makeEngine(self, tree):
+        from pybackend import PythonInterpreter
+        return PythonInterpreter(tree)
+
+
+class TieredInterpreterTestCase(InterpreterTestCase):
+    def makeEngine(self, tree):
+        from tiered import ALWAYS, TieredInterpreter
+        # run all procedures compiled
+        return TieredInterpreter(tree, mode=ALWAYS)
+
+
+class TrampolineInterpreterTestCase(InterpreterTestCase):
+    def makeEngine(self, tree):
+        from trampoline import TrampolineInterpreter
+        return TrampolineInterpreter(tree)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,132 @@
+import shutil
+import tempfile
+import unittest
+
+from test_vm import PROGRAM
+from testutils import RecordingCallStack, make_tree
+
+
+class PythonBackendTestCase(unittest.TestCase):
+    def run_program(self, text, code=None):
+        from pybackend import PythonInterpreter
+        interpreter = PythonInterpreter(make_tree(text), code)
+        interpreter.call_stack = RecordingCallStack()
+        interpreter.interpret()
+        return interpreter.call_stack.last
+
+    def test_procedure_calls(self):
+        ar = self.run_program(PROGRAM)
+        self.assertEqual(ar['x'], 30)
+        # Beta assigns the globals as nonlocal variables
+        self.assertEqual(ar['y'], 8 + (-45) * 2 + (-44))
+        self.assertEqual(ar['r'], -126 / 4)
+
+    def test_shadowing_and_recursion_of_scopes(self):
+        ar = self.run_program("""\
+PROGRAM Main;
+VAR x, y : INTEGER;
+PROCEDURE P(x : INTEGER; z : INTEGER);
+BEGIN
+   x := x + 1;
+   y := x * 10
+END;
+BEGIN
+   x := 1;
+   P(x, 2);
+   P(x, 3)
+END.
+""")
+        self.assertEqual(ar['x'], 1)
+        self.assertEqual(ar['y'], 20)
+
+    def test_error_position(self):
+        from spi import ExecutionError
+        with self.assertRaises(ExecutionError) as cm:
+            self.run_program("""\
+PROGRAM Main;
+VAR x, y : INTEGER;
+PROCEDURE P(a : INTEGER);
+BEGIN
+   x := 7 DIV a
+END;
+BEGIN
+   y := 0;
+   P(y)
+END.
+""")
+        e = cm.exception
+        self.assertIsInstance(e.__cause__, ZeroDivisionError)
+        self.assertEqual((e.token.lineno, e.token.column), (5, 11))
+        self.assertEqual(
+            e.message,
+            'ExecutionError: ZeroDivisionError: integer division or modulo '
+            'by zero -> line: 5 column: 11',
+        )
+
+    def test_float_division(self):
+        import ast
+        from pybackend import PythonCompiler
+        from typecheck import TypeChecker
+        tree = make_tree("""\
+PROGRAM Main;
+VAR r : REAL;
+BEGIN
+   r := r / 2;
+   r := 1.5 / (r / 4.0)
+END.
+""")
+        TypeChecker().visit(tree)
+        function = PythonCompiler().visit(tree)
+        conversions = [
+            python_node for python_node in ast.walk(function)
+            if isinstance(python_node, ast.Name) and python_node.id == 'float'
+        ]
+        # r and 2 may be ints, 1.5, 4.0 and the quotient are floats
+        self.assertEqual(len(conversions), 3)
+
+    def test_code_cache(self):
+        from pybackend import CodeCache, PythonCompiler
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache = CodeCache(directory)
+        self.assertIsNone(cache.load(PROGRAM))
+        cache.store(PROGRAM, PythonCompiler().compile(make_tree(PROGRAM)))
+
+        code = cache.load(PROGRAM)
+        self.assertEqual(self.run_program(PROGRAM, code)['x'], 30)
+
+    def test_code_cache_passes(self):
+        import constfold
+        from pybackend import CodeCache, PythonCompiler
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache = CodeCache(directory)
+        cache.store(PROGRAM, PythonCompiler().compile(make_tree(PROGRAM)))
+        # code compiled from a folded AST is a separate entry
+        folded_cache = CodeCache(directory, passes=[constfold])
+        self.assertNotEqual(folded_cache.key(PROGRAM), cache.key(PROGRAM))
+        self.assertIsNone(folded_cache.load(PROGRAM))
+        self.assertIsNotNone(CodeCache(directory).load(PROGRAM))
+
+    def test_code_cache_shares_size_limit(self):
+        import os
+        from astcache import ASTCache
+        from pybackend import CodeCache, PythonCompiler
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        ast_cache = ASTCache(directory)
+        code_cache = CodeCache(directory)
+        tree = make_tree(PROGRAM)
+        ast_cache.store(PROGRAM, tree)
+        os.utime(ast_cache.path(ast_cache.key(PROGRAM)), (0, 0))
+        ast_size = os.path.getsize(ast_cache.path(ast_cache.key(PROGRAM)))
+
+        # the code entry doesn't fit next to the older AST entry
+        code_cache.max_size = ast_size
+        code_cache.store(PROGRAM, PythonCompiler().compile(tree))
+        self.assertIsNone(ast_cache.load(PROGRAM))
+        self.assertIsNotNone(code_cache.load(PROGRAM))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+
+from test_vm import PROGRAM
+from testutils import RecordingCallStack, make_tree
+
+
+class RegisterVMTestCase(unittest.TestCase):
+    def makeIR(self, text, passes=None):
+        from regvm import PASSES, lower, optimize
+        from vm import BytecodeCompiler
+        tree = make_tree(text)
+        procedures = lower(BytecodeCompiler().compile(tree))
+        return optimize(procedures, PASSES if passes is None else passes)
+
+    def format_body(self, text, passes=None):
+        from regvm import format_ir
+        procedures = self.makeIR(text, passes)
+        # the instructions of the program without the header
+        return format_ir(procedures[:1]).split('\n')[1:-1]
+
+    def run_vm(self, text, **kwargs):
+        from regvm import RegisterVM, assemble
+        vm = RegisterVM(assemble(self.makeIR(text)))
+        vm.call_stack = RecordingCallStack()
+        vm.run(**kwargs)
+        return vm, vm.call_stack.last
+
+    def test_procedure_calls(self):
+        vm, ar = self.run_vm(PROGRAM)
+        self.assertEqual(ar['x'], 30)
+        self.assertEqual(ar['y'], 8 + (-45) * 2 + (-44))
+        self.assertEqual(ar['r'], -126 / 4)
+        # the temporaries and constants follow the variables
+        self.assertEqual(ar.members, {'x': 30, 'y': -126, 'r': -126 / 4})
+
+    def test_lowering(self):
+        self.assertEqual(
+            self.format_body(
+                'PROGRAM T; VAR x, y : INTEGER; BEGIN x := y + 3 END.',
+                passes=(),
+            ),
+            ['   t0 = y', '   t1 = 3', '   t2 = add t0, t1', '   x = t2',
+             '   halt'],
+        )
+
+    def test_superinstruction(self):
+        self.assertEqual(
+            self.format_body(
+                'PROGRAM T; VAR x, y : INTEGER; BEGIN x := y + 3 END.'
+            ),
+            ['   x = add y, 3', '   halt'],
+        )
+
+    def test_constant_folding(self):
+        self.assertEqual(
+            self.format_body(
+                'PROGRAM T; VAR x : INTEGER; r : REAL;'
+                ' BEGIN x := -(2 + 3) * 4 DIV 3; r := 7 / 2 END.'
+            ),
+            ['   x = -7', '   r = 3.5', '   halt'],
+        )
+        # division by zero is left to fail at run time
+        self.assertEqual(
+            self.format_body(
+                'PROGRAM T; VAR x : INTEGER; BEGIN x := 1 DIV 0 END.'
+            ),
+            ['   x = div 1, 0', '   halt'],
+        )
+
+    def test_redundant_loads(self):
+        procedures = self.makeIR(PROGRAM)
+        beta = [ir for ir in procedures if ir.procedure.name == 'Beta'][0]
+        ops = [instr.op for instr in beta.instrs]
+        # Main.y is stored and then read back from its register
+        self.assertEqual(ops.count('loadvar'), 2)
+        self.assertEqual(ops.count('storevar'), 2)
+
+    def test_call_invalidates_loads(self):
+        text = """\
+PROGRAM T;
+VAR x, y : INTEGER;
+PROCEDURE P; BEGIN x := 5 END;
+   PROCEDURE Q;
+   VAR a : INTEGER;
+   BEGIN a := x; P(); a := a + x; y := a END;
+BEGIN x := 1; Q() END.
+"""
+        _, ar = self.run_vm(text)
+        self.assertEqual(ar['y'], 6)
+
+    def test_dead_stores(self):
+        self.assertEqual(
+            self.format_body(
+                'PROGRAM T; VAR x, y : INTEGER;'
+                ' BEGIN x := 1; x := 2; y := x; y := y END.'
+            ),
+            ['   x = 2', '   y = x', '   halt'],
+        )
+
+    def test_dump(self):
+        from regvm import PASSES, lower, optimize
+        from vm import BytecodeCompiler
+        tree = make_tree(PROGRAM)
+        listings = []
+        optimize(
+            lower(BytecodeCompiler().compile(tree)), dump=listings.append,
+        )
+        self.assertEqual(len(listings), len(PASSES) + 1)
+        self.assertTrue(listings[0].startswith('--- before optimization'))
+        self.assertIn('call Alpha(8, t10)', listings[-1])
+        self.assertIn('storevar Main.y, t6', listings[-1])
+
+    def test_profile(self):
+        vm, _ = self.run_vm(PROGRAM, profile=True)
+        self.assertEqual(vm.profile['CALL'], 2)
+        self.assertEqual(vm.profile['RETURN'], 2)
+        self.assertEqual(vm.profile['HALT'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
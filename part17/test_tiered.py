@@ -0,0 +1,131 @@
+import contextlib
+import io
+import unittest
+
+from test_vm import PROGRAM
+from testutils import RecordingCallStack, make_tree
+
+# Alpha is called 12 times and Beta 3 * 12 times
+CALLS = """\
+PROGRAM Main;
+VAR n : INTEGER;
+PROCEDURE Alpha(a : INTEGER);
+VAR k : INTEGER;
+   PROCEDURE Beta(b : INTEGER);
+   BEGIN
+      n := n + b * k
+   END;
+BEGIN
+   k := a;
+   Beta(1); Beta(2); Beta(3)
+END;
+BEGIN
+   n := 0;
+   Alpha(1); Alpha(2); Alpha(3); Alpha(4); Alpha(5); Alpha(6);
+   Alpha(7); Alpha(8); Alpha(9); Alpha(10); Alpha(11); Alpha(12)
+END.
+"""
+
+
+class TieredInterpreterTestCase(unittest.TestCase):
+    def run_program(self, text, **kwargs):
+        from tiered import TieredInterpreter
+        interpreter = TieredInterpreter(make_tree(text), **kwargs)
+        interpreter.call_stack = RecordingCallStack()
+        interpreter.interpret()
+        return interpreter, interpreter.call_stack.last
+
+    def assertProfiles(self, interpreter, expected):
+        self.assertEqual(
+            [
+                (profile.name, profile.tier, profile.calls)
+                for profile in interpreter.profiles.values()
+            ],
+            expected,
+        )
+
+    def test_adaptive(self):
+        interpreter, ar = self.run_program(
+            CALLS, threshold=10, background=False,
+        )
+        self.assertEqual(ar['n'], 6 * 78)
+        self.assertProfiles(interpreter, [
+            ('Alpha', 'closures', 12),
+            ('Beta', 'closures', 36),
+        ])
+
+    def test_below_threshold(self):
+        interpreter, ar = self.run_program(
+            CALLS, threshold=20, background=False,
+        )
+        self.assertEqual(ar['n'], 6 * 78)
+        self.assertProfiles(interpreter, [
+            ('Alpha', 'interpreter', 12),
+            ('Beta', 'closures', 36),
+        ])
+
+    def test_background(self):
+        interpreter, ar = self.run_program(CALLS, threshold=1)
+        self.assertEqual(ar['n'], 6 * 78)
+        for profile in interpreter.profiles.values():
+            # the procedure runs compiled once the compilation is done,
+            # interpret() waits for the compilations to finish
+            if profile.tier == 'interpreter':
+                self.assertTrue(profile.pending.done())
+            else:
+                self.assertIsNone(profile.pending)
+
+    def test_background_keeps_gc(self):
+        import gc
+        from unittest import mock
+        # the collector state is process-wide, background compilations
+        # must not suspend it for the interpreting thread
+        with mock.patch.object(gc, 'disable') as disable:
+            interpreter, ar = self.run_program(CALLS, threshold=1)
+        self.assertEqual(ar['n'], 6 * 78)
+        disable.assert_not_called()
+
+    def test_modes(self):
+        from tiered import ALWAYS, NEVER
+        interpreter, ar = self.run_program(PROGRAM, mode=ALWAYS)
+        self.assertEqual(ar['x'], 30)
+        self.assertEqual(ar['y'], 8 + (-45) * 2 + (-44))
+        self.assertEqual(
+            {profile.tier for profile in interpreter.profiles.values()},
+            {'closures'},
+        )
+
+        interpreter, ar = self.run_program(CALLS, mode=NEVER, threshold=1)
+        self.assertEqual(ar['n'], 6 * 78)
+        self.assertProfiles(interpreter, [
+            ('Alpha', 'interpreter', 12),
+            ('Beta', 'interpreter', 36),
+        ])
+
+    def test_unknown_mode(self):
+        from tiered import TieredInterpreter
+        with self.assertRaises(ValueError):
+            TieredInterpreter(None, mode='sometimes')
+
+    def test_stack_log(self):
+        import spi
+        out = io.StringIO()
+        spi._SHOULD_LOG_STACK = True
+        try:
+            with contextlib.redirect_stdout(out):
+                self.run_program(CALLS, threshold=10, background=False)
+        finally:
+            spi._SHOULD_LOG_STACK = False
+        log = out.getvalue()
+        self.assertIn('TIER UP: PROCEDURE Beta to closures after 10 calls\n',
+                      log)
+        self.assertTrue(log.endswith(
+            'PROCEDURE TIERS\n'
+            'Alpha               : closures             12 calls\n'
+            'Beta                : closures             36 calls\n'
+            '\n'
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import sys
+import unittest
+
+from test_vm import PROGRAM
+from testutils import RecordingCallStack, make_tree
+
+# Alpha and Beta call each other forever
+RECURSION = """\
+PROGRAM Main;
+VAR x : INTEGER;
+PROCEDURE Alpha(a : INTEGER);
+   PROCEDURE Beta(b : INTEGER);
+   BEGIN
+      x := x + b;
+      Alpha(b + 1)
+   END;
+BEGIN
+   Beta(a)
+END;
+BEGIN
+   x := 0;
+   Alpha(1)
+END.
+"""
+
+
+class TrampolineInterpreterTestCase(unittest.TestCase):
+    def makeInterpreter(self, text, **kwargs):
+        from trampoline import TrampolineInterpreter
+        return TrampolineInterpreter(make_tree(text), **kwargs)
+
+    def test_procedure_calls(self):
+        interpreter = self.makeInterpreter(PROGRAM)
+        interpreter.call_stack = RecordingCallStack()
+        interpreter.interpret()
+        ar = interpreter.call_stack.last
+        self.assertEqual(ar['x'], 30)
+        self.assertEqual(ar['y'], 8 + (-45) * 2 + (-44))
+        self.assertEqual(ar['r'], -126 / 4)
+        self.assertEqual(interpreter.calls, [])
+
+    def test_deep_recursion(self):
+        from spi import ErrorCode, ExecutionError
+        max_depth = 10 * sys.getrecursionlimit()
+        interpreter = self.makeInterpreter(RECURSION, max_depth=max_depth)
+        with self.assertRaises(ExecutionError) as cm:
+            interpreter.interpret()
+        e = cm.exception
+        self.assertEqual(e.error_code, ErrorCode.CALL_DEPTH_EXCEEDED)
+        self.assertEqual(e.token.value, 'Alpha')
+        self.assertEqual((e.token.lineno, e.token.column), (7, 7))
+        self.assertEqual(len(interpreter.calls), max_depth)
+        # every call of Beta added its argument 1, 2, 3, ...
+        n = max_depth // 2
+        self.assertEqual(
+            interpreter.call_stack.display[1]['x'], n * (n + 1) // 2,
+        )
+
+    def test_stack_trace(self):
+        from spi import ExecutionError
+        interpreter = self.makeInterpreter(RECURSION, max_depth=3)
+        with self.assertRaises(ExecutionError) as cm:
+            interpreter.interpret()
+        self.assertEqual(cm.exception.message.splitlines()[1:], [
+            'Pascal stack trace (most recent call last):',
+            '  line 14 column 4, in Main: Alpha',
+            '  line 10 column 4, in Alpha: Beta',
+            '  line 7 column 7, in Beta: Alpha',
+            '  line 10 column 4, in Alpha: Beta',
+        ])
+
+    def test_long_stack_trace(self):
+        from spi import ExecutionError
+        from trampoline import TRACE_EDGE
+        interpreter = self.makeInterpreter(RECURSION, max_depth=100)
+        with self.assertRaises(ExecutionError) as cm:
+            interpreter.interpret()
+        lines = cm.exception.message.splitlines()[2:]
+        self.assertEqual(len(lines), 2 * TRACE_EDGE + 1)
+        omitted = 101 - 2 * TRACE_EDGE
+        self.assertEqual(lines[TRACE_EDGE], f'  ... {omitted} more calls ...')
+        self.assertEqual(lines[0], '  line 14 column 4, in Main: Alpha')
+        self.assertEqual(lines[-1], '  line 7 column 7, in Beta: Alpha')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+
+
+class TypeCheckerTestCase(unittest.TestCase):
+    def check(self, text):
+        from spi import Lexer, Parser, SemanticAnalyzer
+        from typecheck import TypeChecker
+        tree = Parser(Lexer(text)).parse()
+        SemanticAnalyzer().visit(tree)
+        TypeChecker().visit(tree)
+        return tree
+
+    def statements(self, statements):
+        text = f"""\
+PROGRAM Test;
+VAR i, j : INTEGER;
+    r    : REAL;
+PROCEDURE P(n : INTEGER; x : REAL);
+BEGIN
+END;
+BEGIN
+   {statements}
+END.
+"""
+        tree = self.check(text)
+        return tree.block.compound_statement.children
+
+    def assertMismatch(self, statements, lineno, column):
+        from spi import ErrorCode, SemanticError
+        with self.assertRaises(SemanticError) as cm:
+            self.statements(statements)
+        e = cm.exception
+        self.assertEqual(e.error_code, ErrorCode.TYPE_MISMATCH)
+        self.assertEqual((e.token.lineno, e.token.column), (lineno, column))
+        self.assertTrue(e.message.startswith('SemanticError: Type mismatch'))
+
+    def test_annotations(self):
+        statements = self.statements(
+            'i := -(i + 2) * j DIV 3; r := i * 2.5; r := i / j; r := i'
+        )
+        expr = statements[0].right
+        self.assertEqual(expr.static_type, 'INTEGER')
+        self.assertEqual(expr.left.static_type, 'INTEGER')
+        self.assertEqual(expr.left.left.static_type, 'INTEGER')
+        self.assertEqual(expr.left.left.expr.left.static_type, 'INTEGER')
+        self.assertEqual(statements[1].right.static_type, 'REAL')
+        self.assertEqual(statements[1].right.right.static_type, 'REAL')
+        self.assertEqual(statements[2].right.static_type, 'REAL')
+        self.assertEqual(statements[3].right.static_type, 'INTEGER')
+        self.assertEqual(statements[3].left.static_type, 'REAL')
+
+    def test_is_float(self):
+        from typecheck import is_float
+        statements = self.statements(
+            'r := r / 2; r := (i + 0.5) * r; r := -(2.5 - r); r := r * 2; '
+            'r := i; r := 2.5'
+        )
+        self.assertEqual(
+            [is_float(statement.right) for statement in statements],
+            [True, True, True, False, False, True],
+        )
+        # r may hold an int
+        self.assertFalse(is_float(statements[0].right.left))
+
+    def test_real_assigned_to_integer(self):
+        self.assertMismatch('i := j + 2.5', 8, 11)
+        self.assertMismatch('i := r', 8, 9)
+        self.assertMismatch('i := 4 / 2', 8, 11)
+
+    def test_real_div(self):
+        self.assertMismatch('r := r DIV 2', 8, 11)
+        self.assertMismatch('i := 7 DIV (1 * 2.0)', 8, 11)
+
+    def test_procedure_arguments(self):
+        self.statements('P(1, 2); P(i, r)')
+        self.assertMismatch('P(r, 1)', 8, 6)
+
+    def test_arena(self):
+        from spi import Lexer, SemanticAnalyzer
+        from astarena import ArenaParser
+        from typecheck import TypeChecker
+        tree = ArenaParser(Lexer(
+            'PROGRAM T; VAR r : REAL; BEGIN r := -2 * 1.5 END.'
+        )).parse()
+        SemanticAnalyzer().visit(tree)
+        TypeChecker().visit(tree)
+        expr = tree.block.compound_statement.children[0].right
+        self.assertEqual(expr.static_type, 'REAL')
+        self.assertEqual(expr.left.static_type, 'INTEGER')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+from testutils import RecordingCallStack, make_tree
+
+
+PROGRAM = """\
+PROGRAM Main;
+VAR
+   x, y : INTEGER;
+   r    : REAL;
+
+PROCEDURE Alpha(a : INTEGER; b : INTEGER);
+VAR
+   x : INTEGER;
+
+   PROCEDURE Beta(c : INTEGER);
+   BEGIN
+      y := a + c * 2 + x;
+      r := y / 4
+   END;
+
+BEGIN
+   x := (a + b) * 2;
+   Beta(x - 1)
+END;
+
+BEGIN { Main }
+   y := 7;
+   x := (y + 3) * 3;
+   Alpha(3 + 5, -x)
+END.  { Main }
+"""
+
+
+class VMTestCase(unittest.TestCase):
+    def makeBytecode(self, text):
+        from vm import BytecodeCompiler
+        tree = make_tree(text)
+        return BytecodeCompiler().compile(tree)
+
+    def run_vm(self, text, **kwargs):
+        from vm import VM
+        vm = VM(self.makeBytecode(text))
+        vm.call_stack = RecordingCallStack()
+        vm.run(**kwargs)
+        return vm, vm.call_stack.last
+
+    def test_procedure_calls(self):
+        vm, ar = self.run_vm(PROGRAM)
+        self.assertEqual(ar['x'], 30)
+        # Beta assigns the globals through the display
+        self.assertEqual(ar['y'], 8 + (-45) * 2 + (-44))
+        self.assertEqual(ar['r'], -126 / 4)
+        self.assertEqual(vm.call_stack.display[1:], [None, None, None])
+
+    def test_deep_call_chain(self):
+        import sys
+        depth = sys.getrecursionlimit() * 2
+        lines = ['PROGRAM Chain;', 'VAR n : INTEGER;']
+        lines.append('PROCEDURE P0; BEGIN n := 1 END;')
+        for i in range(1, depth):
+            lines.append(f'PROCEDURE P{i}; BEGIN P{i - 1}(); n := n + 1 END;')
+        lines.append(f'BEGIN P{depth - 1}() END.')
+        _, ar = self.run_vm('\n'.join(lines))
+        self.assertEqual(ar['n'], depth)
+
+    def test_too_deeply_nested_variable(self):
+        import sys
+        from vm import MAX_DEPTH, CompileError
+        # P{MAX_DEPTH - 1} is at level MAX_DEPTH + 1 and declares a,
+        # which the innermost procedure assigns
+        count = MAX_DEPTH + 1
+        lines = ['PROGRAM Nested;']
+        for i in range(count):
+            lines.append(f'PROCEDURE P{i};')
+            if i == MAX_DEPTH - 1:
+                lines.append('VAR a : INTEGER;')
+        lines.append('BEGIN a := 1 END;')
+        for i in range(count - 1, 0, -1):
+            lines.append(f'BEGIN P{i}() END;')
+        lines.append('BEGIN P0() END.')
+        limit = sys.getrecursionlimit()
+        self.addCleanup(sys.setrecursionlimit, limit)
+        # parsing recurses into the nested procedures
+        sys.setrecursionlimit(max(limit, 20 * count))
+        with self.assertRaises(CompileError) as cm:
+            self.makeBytecode('\n'.join(lines))
+        e = cm.exception
+        self.assertEqual((e.token.lineno, e.token.column), (count + 3, 7))
+        self.assertIn(f'deeper than {MAX_DEPTH} levels', e.message)
+
+    def test_disassemble(self):
+        from vm import disassemble
+        listing = disassemble(self.makeBytecode(PROGRAM))
+        self.assertIn('PROCEDURE Beta (level 3, slots: c)', listing)
+        self.assertIn('STORE_VAR    1:1 (Main.y)', listing)
+        self.assertIn('LOAD_VAR     2:0 (Alpha.a)', listing)
+        self.assertIn('CALL         1 (Alpha)', listing)
+        self.assertTrue(listing.rstrip().endswith('HALT'))
+
+    def test_profile(self):
+        vm, _ = self.run_vm(PROGRAM, profile=True)
+        self.assertEqual(vm.profile['CALL'], 2)
+        self.assertEqual(vm.profile['RETURN'], 2)
+        self.assertEqual(vm.profile['HALT'], 1)
+        vm, _ = self.run_vm(PROGRAM)
+        self.assertIsNone(vm.profile)
+
+    def test_constant_pool(self):
+        bytecode = self.makeBytecode(PROGRAM)
+        # 3 is used twice but stored once, 2 and 2.0 are kept apart
+        self.assertEqual(bytecode.consts.count(3), 1)
+        bytecode = self.makeBytecode(
+            'PROGRAM T; VAR r : REAL; BEGIN r := 2 + 2.0 END.'
+        )
+        self.assertEqual(
+            [(type(c), c) for c in bytecode.consts],
+            [(int, 2), (float, 2.0)],
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,16 @@
+"""Helpers shared by the test modules."""
+from spi import CallStack, Lexer, Parser, SemanticAnalyzer
+
+
+def make_tree(text):
+    """Return the semantically checked AST of a program."""
+    tree = Parser(Lexer(text)).parse()
+    SemanticAnalyzer().visit(tree)
+    return tree
+
+
+class RecordingCallStack(CallStack):
+    """Keeps the program record around after it is popped."""
+    def pop(self):
+        self.last = super().pop()
+        return self.last
@@ -0,0 +1,185 @@
+###############################################################################
+#  Tiered execution.                                                          #
+#                                                                             #
+#  Programs spend most of their time in a few procedures, so compiling all    #
+#  of them up front wastes time on cold code. TieredInterpreter starts every  #
+#  procedure in the tree-walking Interpreter (tier 'interpreter') and counts  #
+#  its calls. A procedure that reaches `threshold` calls is compiled into     #
+#  closures (tier 'closures', see ClosureCompiler) on a background thread,    #
+#  and the calls after the compilation has finished run the closures:         #
+#                                                                             #
+#      >>> interpreter = TieredInterpreter(tree, threshold=100)               #
+#      >>> interpreter.interpret()                                            #
+#      >>> interpreter.profiles                                               #
+#                                                                             #
+#  A procedure is compiled on its own: its calls, including calls of the      #
+#  procedures declared in it, go back through the tier dispatch, so every     #
+#  procedure is counted and promoted by itself. Both tiers use the same       #
+#  activation records, a procedure may switch tiers between two calls.        #
+#                                                                             #
+#  The mode ALWAYS compiles every procedure before its first call and NEVER   #
+#  keeps all of them in the interpreter, e.g. for benchmarking.               #
+#                                                                             #
+###############################################################################
+import concurrent.futures
+
+import spi
+from closures import ClosureCompiler
+from spi import Interpreter
+
+ADAPTIVE = 'adaptive'
+ALWAYS = 'always'
+NEVER = 'never'
+MODES = (ADAPTIVE, ALWAYS, NEVER)
+
+DEFAULT_THRESHOLD = 100
+
+# the tiers of a procedure
+INTERPRETER = 'interpreter'
+CLOSURES = 'closures'
+
+
+class ProcedureProfile:
+    """The call count and the tier of a procedure."""
+    __slots__ = ('name', 'calls', 'tier', 'code', 'pending')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.tier = INTERPRETER
+        # the compiled body of the procedure, a function of the display
+        self.code = None
+        # the Future of a background compilation
+        self.pending = None
+
+    def __str__(self):
+        return f'{self.name:<20}: {self.tier:<12} {self.calls:10} calls'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class _ProcedureCompiler(ClosureCompiler):
+    """Compiles the body of a single procedure.
+
+    The compiled calls run the called procedures through the tier
+    dispatch of the interpreter (see TieredInterpreter).
+    """
+    def __init__(self, interpreter):
+        super().__init__(interpreter)
+        self.procedures = _Dispatch(interpreter)
+
+    def visit_ProcedureDecl(self, node):
+        # nested procedures are compiled when they get hot themselves
+        return None
+
+
+class _Dispatch(dict):
+    """The bodies of the procedures by symbol, as seen by compiled calls."""
+    def __init__(self, interpreter):
+        super().__init__()
+        self.interpreter = interpreter
+
+    def __missing__(self, proc_symbol):
+        execute_procedure = self.interpreter.execute_procedure
+
+        def body(display):
+            execute_procedure(proc_symbol)
+        self[proc_symbol] = body
+        return body
+
+
+def _empty_body(display):
+    pass
+
+
+class TieredInterpreter(Interpreter):
+    """Interpreter that compiles hot procedures into closures.
+
+    `mode` is one of ADAPTIVE, ALWAYS and NEVER. In ADAPTIVE mode a
+    procedure is compiled after `threshold` calls, in the background
+    unless `background` is false.
+    """
+    def __init__(self, tree, mode=ADAPTIVE, threshold=DEFAULT_THRESHOLD,
+                 background=True):
+        if mode not in MODES:
+            raise ValueError(f'unknown tiering mode: {mode}')
+        super().__init__(tree)
+        self.mode = mode
+        self.threshold = threshold
+        self.background = background
+        # ProcedureProfile by ProcedureSymbol, in the order of first calls
+        self.profiles = {}
+        self._executor = None
+
+    def execute_procedure(self, proc_symbol):
+        profile = self.profiles.get(proc_symbol)
+        if profile is None:
+            profile = self.profiles[proc_symbol] = ProcedureProfile(
+                proc_symbol.name,
+            )
+        profile.calls += 1
+
+        code = profile.code
+        if code is None:
+            if profile.pending is not None:
+                if profile.pending.done():
+                    self.install(profile, profile.pending.result())
+            elif self.mode == ALWAYS or (
+                self.mode == ADAPTIVE and profile.calls >= self.threshold
+            ):
+                self.tier_up(proc_symbol, profile)
+            code = profile.code
+        if code is None:
+            self.visit(proc_symbol.block_ast)
+        else:
+            code(self.call_stack.display)
+
+    def compile(self, proc_symbol, manage_gc=True):
+        """Return the body of a procedure compiled into a closure.
+
+        See ClosureCompiler.compile for `manage_gc`.
+        """
+        code = _ProcedureCompiler(self).compile(
+            proc_symbol.block_ast, manage_gc=manage_gc,
+        )
+        return code or _empty_body
+
+    def tier_up(self, proc_symbol, profile):
+        if self.background and self.mode == ADAPTIVE:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=1,
+                )
+            # the main thread keeps interpreting, don't suspend its
+            # garbage collection
+            profile.pending = self._executor.submit(
+                self.compile, proc_symbol, manage_gc=False,
+            )
+        else:
+            self.install(profile, self.compile(proc_symbol))
+
+    def install(self, profile, code):
+        profile.code = code
+        profile.tier = CLOSURES
+        profile.pending = None
+        if spi._SHOULD_LOG_STACK:
+            self.log(
+                f'TIER UP: PROCEDURE {profile.name} '
+                f'to {CLOSURES} after {profile.calls} calls'
+            )
+
+    def __str__(self):
+        lines = ['PROCEDURE TIERS']
+        lines.extend(str(profile) for profile in self.profiles.values())
+        return '\n'.join(lines) + '\n'
+
+    def interpret(self):
+        try:
+            result = super().interpret()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+        self.log(str(self))
+        return result
@@ -0,0 +1,170 @@
+###############################################################################
+#  Trampolined interpreter.                                                   #
+#                                                                             #
+#  Interpreter executes a procedure call by visiting its body, so every       #
+#  Pascal call nests several Python frames (visit_ProcedureCall, visit,       #
+#  visit_Block, visit_Compound, ...) and recursive programs die with          #
+#  RecursionError at a modest depth. TrampolineInterpreter runs statements    #
+#  from an explicit work stack instead: a call pushes the body of the         #
+#  procedure and a marker that leaves the procedure when it is reached, and   #
+#  the loop returns to the top after every statement. Only expressions are    #
+#  still evaluated recursively, they contain no calls.                        #
+#                                                                             #
+#  Call depth is then limited by memory alone, or by the max_depth guard:     #
+#                                                                             #
+#      >>> TrampolineInterpreter(tree, max_depth=1000).interpret()            #
+#                                                                             #
+#  raises an ExecutionError with the Pascal stack trace of the calls when     #
+#  a call would exceed the limit.                                             #
+#                                                                             #
+###############################################################################
+import spi
+from spi import (
+    Assign,
+    Compound,
+    ErrorCode,
+    ExecutionError,
+    Interpreter,
+    ProcedureCall,
+)
+
+DEFAULT_MAX_DEPTH = 100000
+# the number of calls shown at either end of a long stack trace
+TRACE_EDGE = 10
+
+
+class _Return:
+    """Work item that leaves the procedure of an activation record."""
+    __slots__ = ('proc_symbol', 'ar')
+
+    def __init__(self, proc_symbol, ar):
+        self.proc_symbol = proc_symbol
+        self.ar = ar
+
+
+# the kinds of work items by item class, see _kind()
+_KINDS = {}
+
+
+def _kind(item_class):
+    """Return the work item class that item_class is a subclass of.
+
+    Arena views are virtual subclasses of the AST classes, and a
+    failing isinstance check on an ABC is slow, so the kind of every
+    item class is looked up once and cached in _KINDS.
+    """
+    for kind in (Assign, Compound, ProcedureCall, _Return):
+        if issubclass(item_class, kind):
+            break
+    else:
+        # any other statement, e.g. NoOp, is skipped
+        kind = item_class
+    _KINDS[item_class] = kind
+    return kind
+
+
+class TrampolineInterpreter(Interpreter):
+    """Interpreter that doesn't recurse into procedure calls.
+
+    `max_depth` is the maximum number of active procedure calls, None
+    for no limit.
+    """
+    def __init__(self, tree, max_depth=DEFAULT_MAX_DEPTH):
+        super().__init__(tree)
+        self.max_depth = max_depth
+        # the ProcedureCall nodes of the active calls, outermost first
+        self.calls = []
+
+    def visit_Compound(self, node):
+        self.execute(node)
+
+    def visit_ProcedureCall(self, node):
+        self.execute(node)
+
+    def execute(self, statement):
+        """Run a statement and the procedures it calls."""
+        work = [statement]
+        pop = work.pop
+        while work:
+            item = pop()
+            kind = _KINDS.get(item.__class__) or _kind(item.__class__)
+            if kind is Assign:
+                self.visit_Assign(item)
+            elif kind is Compound:
+                work.extend(reversed(item.children))
+            elif kind is ProcedureCall:
+                self.enter(item, work)
+            elif kind is _Return:
+                self.leave(item)
+
+    def enter(self, node, work):
+        """Call the procedure: push its record and then its body."""
+        if self.max_depth is not None and len(self.calls) >= self.max_depth:
+            self.error(node)
+
+        proc_symbol = node.proc_symbol
+        ar = self.frame_pool.acquire(proc_symbol)
+        # bind the arguments like Interpreter does
+        slots = ar.slots
+        for param_symbol, param_node in zip(
+            proc_symbol.params, node.actual_params
+        ):
+            slots[param_symbol.slot] = self.visit(param_node)
+
+        if spi._SHOULD_LOG_STACK:
+            self.log(f'ENTER: PROCEDURE {proc_symbol.name}')
+        self.call_stack.push(ar)
+        if spi._SHOULD_LOG_STACK:
+            self.log(str(self.call_stack))
+
+        self.calls.append(node)
+        work.append(_Return(proc_symbol, ar))
+        # declarations have no run-time effect
+        work.append(proc_symbol.block_ast.compound_statement)
+
+    def leave(self, item):
+        proc_symbol = item.proc_symbol
+        if spi._SHOULD_LOG_STACK:
+            self.log(f'LEAVE: PROCEDURE {proc_symbol.name}')
+            self.log(str(self.call_stack))
+        self.call_stack.pop()
+        self.frame_pool.release(proc_symbol, item.ar)
+        self.calls.pop()
+
+    def error(self, node):
+        token = node.token
+        trace = '\n'.join(self.stack_trace(node))
+        raise ExecutionError(
+            error_code=ErrorCode.CALL_DEPTH_EXCEEDED,
+            token=token,
+            message=(
+                f'{ErrorCode.CALL_DEPTH_EXCEEDED.value} '
+                f'({self.max_depth}) -> {token}\n{trace}'
+            ),
+        )
+
+    def stack_trace(self, node):
+        """Yield the lines of the Pascal stack trace of a call.
+
+        There is a line for every active call and one for the call
+        `node`. Of a deep recursion only the outermost and innermost
+        TRACE_EDGE calls are shown.
+        """
+        yield 'Pascal stack trace (most recent call last):'
+        callers = [self.tree.name] + [call.proc_name for call in self.calls]
+        calls = self.calls + [node]
+        omitted = len(calls) - 2 * TRACE_EDGE
+        for i, (caller, call) in enumerate(zip(callers, calls)):
+            if omitted > 0 and TRACE_EDGE <= i < len(calls) - TRACE_EDGE:
+                if i == TRACE_EDGE:
+                    yield f'  ... {omitted} more calls ...'
+                continue
+            token = call.token
+            yield (
+                f'  line {token.lineno} column {token.column}, '
+                f'in {caller}: {call.proc_name}'
+            )
+
+    def interpret(self):
+        self.calls = []
+        return super().interpret()
@@ -0,0 +1,133 @@
+###############################################################################
+#  Static type checking.                                                      #
+#                                                                             #
+#  TypeChecker runs after SemanticAnalyzer, which sets the declared type of   #
+#  every Var node, and annotates every BinOp and UnaryOp node with the        #
+#  static type of its value (Num nodes know theirs):                          #
+#                                                                             #
+#      INTEGER op INTEGER             -> INTEGER   for +, -, * and DIV        #
+#      INTEGER or REAL op REAL (or    -> REAL      for +, - and *             #
+#        the other way round)                                                 #
+#      any / any                      -> REAL                                 #
+#                                                                             #
+#  It reports the operations Pascal does not allow on mixed types as         #
+#  semantic errors: DIV of a REAL value and a REAL value assigned to (or      #
+#  passed for) an INTEGER variable. INTEGER values may be used wherever a     #
+#  REAL value is expected.                                                    #
+#                                                                             #
+#  After the check every INTEGER expression evaluates to an int (or fails     #
+#  on an unassigned variable), so execution engines may use int-only          #
+#  operations for them. A REAL expression may still evaluate to an int,       #
+#  e.g. a REAL variable that was assigned an INTEGER value; is_float() tells  #
+#  the ones that always evaluate to a float, whose operands of / need no      #
+#  conversion.                                                                #
+#                                                                             #
+###############################################################################
+from spi import (
+    BinOp,
+    ErrorCode,
+    NodeVisitor,
+    Num,
+    SemanticError,
+    TokenType,
+    UnaryOp,
+)
+
+INTEGER = 'INTEGER'
+REAL = 'REAL'
+
+
+def is_float(node):
+    """Return whether a checked expression always evaluates to a float.
+
+    These are the REAL constants, the / operations and the other
+    operations on such a value.
+    """
+    if node.static_type != REAL:
+        return False
+    if isinstance(node, BinOp):
+        return (
+            node.op == TokenType.FLOAT_DIV or
+            is_float(node.left) or is_float(node.right)
+        )
+    if isinstance(node, UnaryOp):
+        return is_float(node.expr)
+    return isinstance(node, Num)
+
+
+class TypeChecker(NodeVisitor):
+    """Annotates expressions with their static types.
+
+    visit(node) returns the static type of an expression.
+    """
+    def error(self, error_code, token):
+        raise SemanticError(
+            error_code=error_code,
+            token=token,
+            message=f'{error_code.value} -> {token}',
+        )
+
+    def check_assignable(self, var_type, value_type, node):
+        if var_type == INTEGER and value_type == REAL:
+            self.error(error_code=ErrorCode.TYPE_MISMATCH, token=node.token)
+
+    def visit_Program(self, node):
+        self.visit(node.block)
+
+    def visit_Block(self, node):
+        for declaration in node.declarations:
+            self.visit(declaration)
+        self.visit(node.compound_statement)
+
+    def visit_VarDecl(self, node):
+        pass
+
+    def visit_ProcedureDecl(self, node):
+        self.visit(node.block_node)
+
+    def visit_Compound(self, node):
+        for child in node.children:
+            self.visit(child)
+
+    def visit_NoOp(self, node):
+        pass
+
+    def visit_Assign(self, node):
+        value_type = self.visit(node.right)
+        self.check_assignable(node.left.static_type, value_type, node.right)
+
+    def visit_ProcedureCall(self, node):
+        for param_symbol, param_node in zip(
+            node.proc_symbol.params, node.actual_params
+        ):
+            value_type = self.visit(param_node)
+            self.check_assignable(
+                param_symbol.type.name, value_type, param_node,
+            )
+
+    def visit_Var(self, node):
+        return node.static_type
+
+    def visit_Num(self, node):
+        return node.static_type
+
+    def visit_UnaryOp(self, node):
+        node.static_type = self.visit(node.expr)
+        return node.static_type
+
+    def visit_BinOp(self, node):
+        left_type = self.visit(node.left)
+        right_type = self.visit(node.right)
+        if node.op == TokenType.FLOAT_DIV:
+            node.static_type = REAL
+        elif node.op == TokenType.INTEGER_DIV:
+            if REAL in (left_type, right_type):
+                self.error(
+                    error_code=ErrorCode.TYPE_MISMATCH, token=node.token,
+                )
+            node.static_type = INTEGER
+        elif REAL in (left_type, right_type):
+            node.static_type = REAL
+        else:
+            node.static_type = INTEGER
+        return node.static_type
@@ -0,0 +1,407 @@
+###############################################################################
+#  Bytecode compiler and virtual machine.                                     #
+#                                                                             #
+#  BytecodeCompiler translates an analyzed AST into a Bytecode object: one    #
+#  array of (opcode, argument) pairs for the whole program, a constant pool   #
+#  and a table of procedures with their entry points and variable slots.      #
+#  The VM runs it in a single dispatch loop; procedure calls push activation  #
+#  records onto an explicit call stack instead of recursing in Python, so     #
+#  the depth of Pascal call chains is not limited by the Python stack.        #
+#                                                                             #
+#      >>> bytecode = BytecodeCompiler().compile(tree)                        #
+#      >>> print(disassemble(bytecode))                                       #
+#      >>> VM(bytecode).run()                                                 #
+#                                                                             #
+###############################################################################
+import collections
+from array import array
+
+import spi
+from spi import (
+    ActivationRecord,
+    ARType,
+    CallStack,
+    Error,
+    NodeVisitor,
+    TokenType,
+)
+
+# Every instruction is an opcode and an argument, both stored in the
+# code array. Instructions that need no argument have argument 0.
+OPCODES = (
+    'HALT',         # stop the machine
+    'RETURN',       # return from a procedure
+    'CALL',         # call procedures[arg], its arguments are on the stack
+    'LOAD_CONST',   # push consts[arg]
+    'LOAD_LOCAL',   # push the variable in slot arg of the current frame
+    'STORE_LOCAL',  # pop into the variable in slot arg of the current frame
+    'LOAD_VAR',     # push the variable at address arg (see _address)
+    'STORE_VAR',    # pop into the variable at address arg
+    'ADD',
+    'SUB',
+    'MUL',
+    'INTEGER_DIV',
+    'FLOAT_DIV',
+    'NEG',
+    'POS',          # unary +, fails on a non-number like the other engines
+)
+(
+    HALT, RETURN, CALL, LOAD_CONST, LOAD_LOCAL, STORE_LOCAL, LOAD_VAR,
+    STORE_VAR, ADD, SUB, MUL, INTEGER_DIV, FLOAT_DIV, NEG, POS,
+) = range(len(OPCODES))
+
+BINARY_OPCODES = {
+    TokenType.PLUS: ADD,
+    TokenType.MINUS: SUB,
+    TokenType.MUL: MUL,
+    TokenType.INTEGER_DIV: INTEGER_DIV,
+    TokenType.FLOAT_DIV: FLOAT_DIV,
+}
+
+# LOAD_VAR and STORE_VAR address a variable of an enclosing scope by
+# its nesting level (the low byte of the argument) and its slot
+_DEPTH_BITS = 8
+# the deepest nesting level that LOAD_VAR and STORE_VAR can address
+MAX_DEPTH = (1 << _DEPTH_BITS) - 1
+
+
+class CompileError(Error):
+    pass
+
+
+def _address(depth, slot):
+    return slot << _DEPTH_BITS | depth
+
+
+def _split_address(address):
+    return address & ((1 << _DEPTH_BITS) - 1), address >> _DEPTH_BITS
+
+
+class Procedure:
+    """The compiled program or procedure.
+
+    `var_names` is the local table: the names of the parameters and
+    variables by slot. The first `nparams` slots hold the parameters.
+    """
+    def __init__(self, name, level, var_names, nparams, parent=None):
+        self.name = name
+        # static nesting level, 1 for the program
+        self.level = level
+        # the enclosing Procedure, None for the program
+        self.parent = parent
+        self.var_names = var_names
+        self.nparams = nparams
+        # index of the first instruction in the code array
+        self.entry = None
+
+
+class Bytecode:
+    def __init__(self):
+        # (opcode, argument) pairs
+        self.code = array('i')
+        self.consts = []
+        # procedures[0] is the program itself
+        self.procedures = []
+
+    def emit(self, opcode, arg=0):
+        self.code.append(opcode)
+        self.code.append(arg)
+
+
+class BytecodeCompiler(NodeVisitor):
+    """Compiles an analyzed AST into Bytecode.
+
+    The code of nested procedures precedes the code of the body of the
+    enclosing procedure, so every procedure occupies a contiguous range
+    of the code array that ends with RETURN (HALT for the program).
+    """
+    def __init__(self):
+        self.bytecode = None
+        # the procedure being compiled
+        self.procedure = None
+        # ProcedureSymbol -> index in bytecode.procedures
+        self.procedure_ids = {}
+        # constant -> index in the constant pool
+        self.const_ids = {}
+
+    def compile(self, tree):
+        self.bytecode = Bytecode()
+        self.visit(tree)
+        return self.bytecode
+
+    def emit(self, opcode, arg=0):
+        self.bytecode.emit(opcode, arg)
+
+    def visit_Program(self, node):
+        self.procedure = Procedure(
+            name=node.name,
+            level=1,
+            var_names=node.var_names,
+            nparams=0,
+        )
+        self.bytecode.procedures.append(self.procedure)
+        self.visit(node.block)
+        self.emit(HALT)
+
+    def visit_Block(self, node):
+        for declaration in node.declarations:
+            self.visit(declaration)
+        self.procedure.entry = len(self.bytecode.code)
+        self.visit(node.compound_statement)
+
+    def visit_VarDecl(self, node):
+        pass
+
+    def visit_ProcedureDecl(self, node):
+        enclosing_procedure = self.procedure
+        self.procedure = Procedure(
+            name=node.proc_name,
+            level=enclosing_procedure.level + 1,
+            var_names=node.var_names,
+            nparams=len(node.params),
+            parent=enclosing_procedure,
+        )
+        # registered before the body is compiled for recursive calls
+        self.procedure_ids[node.proc_symbol] = len(self.bytecode.procedures)
+        self.bytecode.procedures.append(self.procedure)
+
+        self.visit(node.block_node)
+        self.emit(RETURN)
+        self.procedure = enclosing_procedure
+
+    def visit_Compound(self, node):
+        for child in node.children:
+            self.visit(child)
+
+    def visit_NoOp(self, node):
+        pass
+
+    def visit_ProcedureCall(self, node):
+        procedure_id = self.procedure_ids[node.proc_symbol]
+        for param_node in node.actual_params:
+            self.visit(param_node)
+        self.emit(CALL, procedure_id)
+
+    def visit_Assign(self, node):
+        self.visit(node.right)
+        var_node = node.left
+        if var_node.depth == self.procedure.level:
+            self.emit(STORE_LOCAL, var_node.slot)
+        else:
+            self.emit(STORE_VAR, self.address(var_node))
+
+    def visit_Var(self, node):
+        if node.depth == self.procedure.level:
+            self.emit(LOAD_LOCAL, node.slot)
+        else:
+            self.emit(LOAD_VAR, self.address(node))
+
+    def address(self, var_node):
+        """Return the address of a variable of an enclosing scope."""
+        if var_node.depth > MAX_DEPTH:
+            # the depth would spill into the slot bits of the address
+            token = var_node.token
+            raise CompileError(
+                token=token,
+                message=(
+                    f'variables nested deeper than {MAX_DEPTH} levels '
+                    f'cannot be addressed -> {token}'
+                ),
+            )
+        return _address(var_node.depth, var_node.slot)
+
+    def visit_Num(self, node):
+        self.emit(LOAD_CONST, self.const_id(node.value))
+
+    def visit_UnaryOp(self, node):
+        self.visit(node.expr)
+        if node.op == TokenType.MINUS:
+            self.emit(NEG)
+        else:
+            self.emit(POS)
+
+    def visit_BinOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+        self.emit(BINARY_OPCODES[node.op])
+
+    def const_id(self, value):
+        # the type is part of the key to keep e.g. 3 and 3.0 apart
+        key = (value.__class__, value)
+        const_id = self.const_ids.get(key)
+        if const_id is None:
+            const_id = self.const_ids[key] = len(self.bytecode.consts)
+            self.bytecode.consts.append(value)
+        return const_id
+
+
+def disassemble(bytecode):
+    """Return a listing of the bytecode, one procedure after another."""
+    lines = []
+    code = bytecode.code
+    for procedure in sorted(bytecode.procedures, key=lambda p: p.entry):
+        kind = 'PROGRAM' if procedure.level == 1 else 'PROCEDURE'
+        lines.append('{kind} {name} (level {level}, slots: {slots})'.format(
+            kind=kind,
+            name=procedure.name,
+            level=procedure.level,
+            slots=', '.join(procedure.var_names) or '-',
+        ))
+        pc = procedure.entry
+        while True:
+            opcode, arg = code[pc], code[pc + 1]
+            description = _describe(bytecode, procedure, opcode, arg)
+            lines.append('   {:5} {:<12} {}'.format(
+                pc, OPCODES[opcode], description,
+            ).rstrip())
+            pc += 2
+            if opcode in (RETURN, HALT):
+                break
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def _describe(bytecode, procedure, opcode, arg):
+    if opcode == LOAD_CONST:
+        return f'{arg} ({bytecode.consts[arg]!r})'
+    if opcode in (LOAD_LOCAL, STORE_LOCAL):
+        return f'{arg} ({procedure.var_names[arg]})'
+    if opcode in (LOAD_VAR, STORE_VAR):
+        depth, slot = _split_address(arg)
+        owner = procedure
+        while owner.level > depth:
+            owner = owner.parent
+        return f'{depth}:{slot} ({owner.name}.{owner.var_names[slot]})'
+    if opcode == CALL:
+        return f'{arg} ({bytecode.procedures[arg].name})'
+    return ''
+
+
+class VM:
+    def __init__(self, bytecode):
+        self.bytecode = bytecode
+        self.call_stack = CallStack()
+        # executed instructions by opcode name, if profiling
+        self.profile = None
+
+    def log(self, msg):
+        if spi._SHOULD_LOG_STACK:
+            print(msg)
+
+    def interpret(self):
+        """Run the program, like Interpreter.interpret."""
+        self.run()
+
+    def run(self, profile=False):
+        """Run the program.
+
+        With profile=True the number of executed instructions of
+        every kind is counted in self.profile.
+        """
+        counts = [0] * len(OPCODES) if profile else None
+        log_stack = spi._SHOULD_LOG_STACK
+
+        bytecode = self.bytecode
+        code = bytecode.code.tolist()
+        consts = bytecode.consts
+        procedures = bytecode.procedures
+        call_stack = self.call_stack
+        display = call_stack.display
+        program = procedures[0]
+
+        self.log(f'ENTER: PROGRAM {program.name}')
+        ar = ActivationRecord(
+            name=program.name,
+            type=ARType.PROGRAM,
+            nesting_level=1,
+            names=program.var_names,
+        )
+        call_stack.push(ar)
+        self.log(str(call_stack))
+
+        # variables of the current frame
+        slots = ar.slots
+        # operand stack
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        # return addresses
+        returns = []
+        pc = program.entry
+        while True:
+            op = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+            if counts is not None:
+                counts[op] += 1
+
+            # the most frequent instructions first
+            if op == LOAD_LOCAL:
+                push(slots[arg])
+            elif op == LOAD_CONST:
+                push(consts[arg])
+            elif op == STORE_LOCAL:
+                slots[arg] = pop()
+            elif op == ADD:
+                right = pop()
+                stack[-1] = stack[-1] + right
+            elif op == SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif op == MUL:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif op == INTEGER_DIV:
+                right = pop()
+                stack[-1] = stack[-1] // right
+            elif op == FLOAT_DIV:
+                right = pop()
+                stack[-1] = float(stack[-1]) / float(right)
+            elif op == NEG:
+                stack[-1] = -stack[-1]
+            elif op == POS:
+                stack[-1] = +stack[-1]
+            elif op == LOAD_VAR:
+                depth, slot = _split_address(arg)
+                push(display[depth].slots[slot])
+            elif op == STORE_VAR:
+                depth, slot = _split_address(arg)
+                display[depth].slots[slot] = pop()
+            elif op == CALL:
+                procedure = procedures[arg]
+                if log_stack:
+                    self.log(f'ENTER: PROCEDURE {procedure.name}')
+                ar = ActivationRecord(
+                    name=procedure.name,
+                    type=ARType.PROCEDURE,
+                    nesting_level=procedure.level,
+                    names=procedure.var_names,
+                )
+                nparams = procedure.nparams
+                if nparams:
+                    ar.slots[:nparams] = stack[-nparams:]
+                    del stack[-nparams:]
+                call_stack.push(ar)
+                if log_stack:
+                    self.log(str(call_stack))
+                returns.append(pc)
+                pc = procedure.entry
+                slots = ar.slots
+            elif op == RETURN:
+                if log_stack:
+                    self.log(f'LEAVE: PROCEDURE {call_stack.peek().name}')
+                    self.log(str(call_stack))
+                call_stack.pop()
+                pc = returns.pop()
+                slots = call_stack.peek().slots
+            elif op == HALT:
+                break
+
+        self.log(f'LEAVE: PROGRAM {program.name}')
+        self.log(str(call_stack))
+        call_stack.pop()
+
+        if counts is not None:
+            self.profile = collections.Counter({
+                OPCODES[op]: count for op, count in enumerate(counts) if count
+            })
@@ -1,3 +1,5 @@
+import operator
+
 # Token types
 #
 # EOF (end-of-file) token is used to indicate that
@@ -7,6 +9,11 @@ INTEGER, PLUS, MINUS, MUL, DIV, EOF = (
 )
 
 
+# the operations of the operators of terms and expressions by token type
+TERM_OPERATIONS = {MUL: operator.mul, DIV: operator.floordiv}
+EXPR_OPERATIONS = {PLUS: operator.add, MINUS: operator.sub}
+
+
 class Token(object):
     def __init__(self, type, value):
         # token type: INTEGER, PLUS, MINUS, MUL, DIV, or EOF
@@ -127,14 +134,10 @@ class Interpreter(object):
         """term : factor ((MUL | DIV) factor)*"""
         result = self.factor()
 
-        while self.current_token.type in (MUL, DIV):
-            token = self.current_token
-            if token.type == MUL:
-                self.eat(MUL)
-                result = result * self.factor()
-            elif token.type == DIV:
-                self.eat(DIV)
-                result = result // self.factor()
+        while self.current_token.type in TERM_OPERATIONS:
+            operation = TERM_OPERATIONS[self.current_token.type]
+            self.eat(self.current_token.type)
+            result = operation(result, self.factor())
 
         return result
 
@@ -150,14 +153,10 @@ class Interpreter(object):
         """
         result = self.term()
 
-        while self.current_token.type in (PLUS, MINUS):
-            token = self.current_token
-            if token.type == PLUS:
-                self.eat(PLUS)
-                result = result + self.term()
-            elif token.type == MINUS:
-                self.eat(MINUS)
-                result = result - self.term()
+        while self.current_token.type in EXPR_OPERATIONS:
+            operation = EXPR_OPERATIONS[self.current_token.type]
+            self.eat(self.current_token.type)
+            result = operation(result, self.term())
 
         return result
 
@@ -1,5 +1,7 @@
 """ SPI - Simple Pascal Interpreter """
 
+import operator
+
 ###############################################################################
 #                                                                             #
 #  LEXER                                                                      #
@@ -118,6 +120,16 @@ class Lexer(object):
 #                                                                             #
 ###############################################################################
 
+# the operations of the operators by token type, looked up once
+# by the BinOp nodes
+BINARY_OPERATIONS = {
+    PLUS: operator.add,
+    MINUS: operator.sub,
+    MUL: operator.mul,
+    DIV: operator.floordiv,
+}
+
+
 class AST(object):
     pass
 
@@ -127,6 +139,7 @@ class BinOp(AST):
         self.left = left
         self.token = self.op = op
         self.right = right
+        self.operation = BINARY_OPERATIONS[op.type]
 
 
 class Num(AST):
@@ -225,14 +238,7 @@ class Interpreter(NodeVisitor):
         self.parser = parser
 
     def visit_BinOp(self, node):
-        if node.op.type == PLUS:
-            return self.visit(node.left) + self.visit(node.right)
-        elif node.op.type == MINUS:
-            return self.visit(node.left) - self.visit(node.right)
-        elif node.op.type == MUL:
-            return self.visit(node.left) * self.visit(node.right)
-        elif node.op.type == DIV:
-            return self.visit(node.left) // self.visit(node.right)
+        return node.operation(self.visit(node.left), self.visit(node.right))
 
     def visit_Num(self, node):
         return node.value